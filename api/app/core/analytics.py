@@ -0,0 +1,217 @@
+# app/core/analytics.py
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, func, insert
+from app.database import settings
+from app.core.genealogy import LEAVE_EVENT
+from app.models import (
+    Basket, Batch, BasketMovement, AnalyticsWatermark,
+    FlowHourly, FlowDaily, OccupancyHourly, OccupancyDaily
+)
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 分析彙總 ---
+- 流量 (throughput)：以 BasketMovements (append-only) 為變更來源，依 id 水位增量彙總到
+  FlowHourly / FlowDaily (時間桶 × 倉庫 × 事件類型 × 產品)；水位與彙總在同一個交易內更新
+  換批次 / 清空時舊批次的離開紀錄 (Leave) 不是籃子流量，只推進水位、不列入彙總
+- 在庫量 (occupancy)：定期對 Baskets 做一次 GROUP BY 快照，寫入目前小時 / 當日的時間桶 (覆蓋)
+查詢 API 只讀取彙總表，不讀取歷史或流向明細。
+"""
+FLOW_WATERMARK = "flow"
+ROLLUP_LAG_SECONDS = 60  # 只彙總建立超過此秒數的流向，避免略過尚未 commit 的交易
+
+FLOW_DIMENSIONS = ("warehouseId", "eventType", "itemcode")
+OCCUPANCY_DIMENSIONS = ("warehouseId", "status")
+
+def hour_bucket(value: datetime):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def day_bucket(value: datetime):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def shift_bucket(value: datetime, start_hours):
+    """時間所屬班別的起點 (例如 6/14/22 點開班，凌晨 3 點屬於前一天 22 點的班)"""
+    starts = sorted(start_hours)
+    day = day_bucket(value)
+    for hour in reversed(starts):
+        if value.hour >= hour:
+            return day + timedelta(hours=hour)
+    return day - timedelta(days=1) + timedelta(hours=starts[-1])
+
+"""
+# --- 增量彙總 ---
+"""
+def rollup_flow(db, chunk_size: int = None):
+    """彙總一批新的流向紀錄 (會 commit)，回傳 (處理筆數, 是否已追上)"""
+    chunk_size = chunk_size or settings.ANALYTICS_ROLLUP_CHUNK
+    watermark = db.get(AnalyticsWatermark, FLOW_WATERMARK)
+    if watermark is None:
+        watermark = AnalyticsWatermark(name=FLOW_WATERMARK, lastId=0, updatedAt=datetime.now())
+        db.add(watermark)
+        db.commit()
+    last_id = watermark.lastId or 0
+
+    itemcode = select(Batch.itemcode).where(Batch.batch_code == BasketMovement.batchCode).limit(1).scalar_subquery()
+    rows = db.execute(
+        select(
+            BasketMovement.id, BasketMovement.createdAt, BasketMovement.warehouseId,
+            BasketMovement.eventType, BasketMovement.quantity, itemcode.label("itemcode"),
+        )
+        .where(BasketMovement.id > last_id)
+        .order_by(BasketMovement.id)
+        .limit(chunk_size)
+    ).all()
+    fetched = len(rows)
+
+    # 停在第一筆太新的紀錄，水位不會越過可能還沒 commit 的交易
+    cutoff = datetime.now() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+    for index, row in enumerate(rows):
+        if row.createdAt >= cutoff:
+            rows = rows[:index]
+            break
+    caught_up = len(rows) < fetched or fetched < chunk_size
+    if not rows:
+        return 0, True
+
+    hourly = {}
+    daily = {}
+    for row in rows:
+        if row.eventType == LEAVE_EVENT:
+            continue
+        dims = (row.warehouseId, row.eventType, row.itemcode)
+        for target, bucket in ((hourly, hour_bucket(row.createdAt)), (daily, day_bucket(row.createdAt))):
+            entry = target.setdefault((bucket,) + dims, [0, 0])
+            entry[0] += 1
+            entry[1] += row.quantity or 0
+
+    merge_flow(db, FlowHourly, hourly)
+    merge_flow(db, FlowDaily, daily)
+
+    # 水位以條件更新：同時有其他 worker 彙總同一段時放棄這次
+    moved = db.execute(
+        update(AnalyticsWatermark)
+        .where(AnalyticsWatermark.name == FLOW_WATERMARK, AnalyticsWatermark.lastId == last_id)
+        .values(lastId=rows[-1].id, updatedAt=datetime.now())
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if moved != 1:
+        db.rollback()
+        raise RuntimeError("Flow watermark moved by another rollup")
+
+    db.commit()
+    return len(rows), caught_up
+
+def merge_flow(db, model, deltas: dict):
+    """把 {(bucket, warehouseId, eventType, itemcode): [baskets, quantity]} 累加到彙總表"""
+    buckets = list({key[0] for key in deltas})
+    existing = {
+        (row.bucket, row.warehouseId, row.eventType, row.itemcode): row
+        for row in db.query(model).filter(model.bucket.in_(buckets))
+    }
+
+    updates = []
+    inserts = []
+    for key, (baskets, quantity) in deltas.items():
+        row = existing.get(key)
+        if row:
+            updates.append({"id": row.id, "baskets": row.baskets + baskets, "quantity": row.quantity + quantity})
+        else:
+            bucket, warehouse, event_type, item = key
+            inserts.append({
+                "bucket": bucket, "warehouseId": warehouse, "eventType": event_type,
+                "itemcode": item, "baskets": baskets, "quantity": quantity,
+            })
+
+    if updates:
+        db.execute(update(model), updates)
+    if inserts:
+        db.execute(insert(model), inserts)
+
+def reset_flow_rollup(db):
+    """清空流量彙總並把水位歸零，下次排程從頭重新彙總 (會 commit)"""
+    db.execute(delete(FlowHourly))
+    db.execute(delete(FlowDaily))
+    db.execute(update(AnalyticsWatermark).where(AnalyticsWatermark.name == FLOW_WATERMARK).values(lastId=0, updatedAt=datetime.now()))
+    db.commit()
+
+def run_flow_rollup(db):
+    total = 0
+    while True:
+        processed, caught_up = rollup_flow(db)
+        total += processed
+        if caught_up:
+            return total
+
+def snapshot_occupancy(db, now: datetime = None):
+    """目前各倉庫 × 狀態的在庫量，覆蓋目前小時與當日的時間桶 (會 commit)"""
+    now = now or datetime.now()
+    rows = db.execute(
+        select(Basket.warehouseId, Basket.status, func.count(Basket.bid), func.coalesce(func.sum(Basket.quantity), 0))
+        .where(Basket.warehouseId.isnot(None))
+        .group_by(Basket.warehouseId, Basket.status)
+    ).all()
+
+    for model, bucket in ((OccupancyHourly, hour_bucket(now)), (OccupancyDaily, day_bucket(now))):
+        db.execute(delete(model).where(model.bucket == bucket))
+        if rows:
+            db.execute(insert(model), [
+                {"bucket": bucket, "warehouseId": warehouse, "status": status, "baskets": baskets, "quantity": int(quantity)}
+                for warehouse, status, baskets, quantity in rows
+            ])
+    db.commit()
+    return len(rows)
+
+"""
+# --- 查詢 (只讀彙總表) ---
+"""
+def parse_group_by(group_by: str, allowed):
+    fields = [f.strip() for f in (group_by or "").split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown group_by field(s): {', '.join(unknown)}; allowed: {', '.join(allowed)}")
+    return [f for f in allowed if f in fields]
+
+def aggregate_series(db, model, start: datetime, end: datetime, dimensions, filters: dict):
+    columns = [getattr(model, name) for name in dimensions]
+    statement = select(
+        model.bucket, *columns, func.sum(model.baskets), func.sum(model.quantity)
+    ).where(
+        model.bucket >= start, model.bucket < end
+    ).group_by(model.bucket, *columns).order_by(model.bucket, *columns)
+
+    for name, value in filters.items():
+        if value is not None:
+            statement = statement.where(getattr(model, name) == value)
+
+    return [
+        {
+            "bucket": row[0],
+            **{name: row[i + 1] for i, name in enumerate(dimensions)},
+            "baskets": int(row[-2] or 0),
+            "quantity": int(row[-1] or 0),
+        }
+        for row in db.execute(statement)
+    ]
+
+def throughput_series(db, start: datetime, end: datetime, interval: str, dimensions, filters: dict):
+    if interval == "day":
+        return aggregate_series(db, FlowDaily, start, end, dimensions, filters)
+
+    series = aggregate_series(db, FlowHourly, start, end, dimensions, filters)
+    if interval == "hour":
+        return series
+
+    # shift：由每小時彙總再合併成班別
+    shifts = {}
+    for point in series:
+        key = (shift_bucket(point["bucket"], settings.SHIFT_START_HOURS),) + tuple(point[name] for name in dimensions)
+        entry = shifts.setdefault(key, {**point, "bucket": key[0], "baskets": 0, "quantity": 0})
+        entry["baskets"] += point["baskets"]
+        entry["quantity"] += point["quantity"]
+    return sorted(shifts.values(), key=lambda p: (p["bucket"],) + tuple(str(p[name]) for name in dimensions))
+
+def occupancy_series(db, start: datetime, end: datetime, interval: str, dimensions, filters: dict):
+    model = OccupancyDaily if interval == "day" else OccupancyHourly
+    return aggregate_series(db, model, start, end, dimensions, filters)
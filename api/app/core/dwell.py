@@ -0,0 +1,285 @@
+# app/core/dwell.py
+import logging
+import math
+from datetime import datetime, timedelta
+from itertools import groupby
+from sqlalchemy import select, update, delete, insert, func, or_
+from app.models import BasketDwell, DwellDaily, AnalyticsWatermark
+from app.core.history import basket_timeline_subquery
+from app.core.analytics import day_bucket, ROLLUP_LAG_SECONDS
+from app.core.reconciliation import chunked
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 籃子停留時間 (dwell / cycle time) ---
+- 依 rfid, 版本順序串流讀取籃子時間軸 (yield_per，不把整段歷史載入記憶體)，
+  同一籃子連續相同的 (status, warehouseId) 版本合併為一個停留區間 → BasketDwells
+- 離開 UNASSIGNED 到再次被清空為一個週期，另記一筆 status = CYCLE 的區間
+- 已結束的區間同時累加到 DwellDaily (離開日 × 狀態 × 倉庫 × 產品 的對數直方圖)，
+  百分位數由直方圖估算 (誤差約 ±5%)，查詢不必讀取明細
+- 增量：水位為時間 (AnalyticsWatermark.lastAt)，只讀取水位後有變化的版本；
+  每個籃子目前所在的區間 (leftAt 為 NULL) 保存在 BasketDwells，下次接續
+"""
+DWELL_WATERMARK = "dwell"
+CYCLE_STATUS = "CYCLE"
+CLEARED_STATUS = "UNASSIGNED"
+STREAM_CHUNK = 5000
+FLUSH_ROWS = 20000
+
+BIN_BASE = 1.1
+
+def dwell_bin(seconds: int) -> int:
+    """秒數 -> 對數分箱 (0 秒為第 0 箱，之後每箱寬約 10%)"""
+    if seconds < 1:
+        return 0
+    return int(math.log(seconds) / math.log(BIN_BASE)) + 1
+
+def bin_seconds(index: int) -> float:
+    """分箱的代表值 (上下界的幾何平均)"""
+    if index <= 0:
+        return 0.0
+    return BIN_BASE ** (index - 0.5)
+
+class DwellState:
+    __slots__ = ("id", "status", "warehouseId", "itemcode", "enteredAt", "cycleStart")
+
+    def __init__(self, status, warehouse_id, itemcode, entered_at, cycle_start, id=None):
+        self.id = id
+        self.status = status
+        self.warehouseId = warehouse_id
+        self.itemcode = itemcode
+        self.enteredAt = entered_at
+        self.cycleStart = cycle_start
+
+class DwellBatch:
+    """一次執行中累積的寫入：新的區間列、被取代的 open 列、直方圖增量"""
+    def __init__(self):
+        self.rows = []
+        self.replaced_ids = []
+        self.histogram = {}
+        self.closed = 0
+
+    def close(self, rfid, state, left_at, status=None, entered_at=None):
+        entered_at = entered_at or state.enteredAt
+        seconds = max(0, int((left_at - entered_at).total_seconds()))
+        status = status or state.status
+        warehouse = None if status == CYCLE_STATUS else state.warehouseId
+        self.rows.append({
+            "rfid": rfid, "status": status, "warehouseId": warehouse, "itemcode": state.itemcode,
+            "enteredAt": entered_at, "leftAt": left_at, "seconds": seconds, "cycleStart": state.cycleStart,
+        })
+        entry = self.histogram.setdefault((day_bucket(left_at), status, warehouse, state.itemcode, dwell_bin(seconds)), [0, 0])
+        entry[0] += 1
+        entry[1] += seconds
+        self.closed += 1
+
+    def keep_open(self, rfid, state):
+        self.rows.append({
+            "rfid": rfid, "status": state.status, "warehouseId": state.warehouseId, "itemcode": state.itemcode,
+            "enteredAt": state.enteredAt, "leftAt": None, "seconds": None, "cycleStart": state.cycleStart,
+        })
+
+def replay_basket(batch: DwellBatch, rfid: str, versions, state: DwellState, cutoff: datetime):
+    """依版本順序走過一個籃子的時間軸，結束的區間寫入 batch，回傳 (是否有變更, 目前區間)"""
+    changed = False
+    for v in versions:
+        if v.validFrom is None:
+            continue
+        if state is None:
+            cycle_start = None if v.status == CLEARED_STATUS else v.validFrom
+            state = DwellState(v.status, v.warehouseId, v.itemcode, v.validFrom, cycle_start)
+            changed = True
+        elif (v.status, v.warehouseId) == (state.status, state.warehouseId):
+            if v.itemcode and not state.itemcode:
+                state.itemcode = v.itemcode
+                changed = True
+        elif v.validFrom >= state.enteredAt:
+            batch.close(rfid, state, v.validFrom)
+            if v.status == CLEARED_STATUS and state.cycleStart:
+                batch.close(rfid, state, v.validFrom, status=CYCLE_STATUS, entered_at=state.cycleStart)
+
+            if v.status == CLEARED_STATUS:
+                cycle_start = None
+            else:
+                cycle_start = state.cycleStart or v.validFrom
+            state = DwellState(v.status, v.warehouseId, v.itemcode or (state.itemcode if cycle_start else None), v.validFrom, cycle_start)
+            changed = True
+
+        # 最後一個版本在 cutoff 前就結束 (籃子被刪除)
+        if v is versions[-1] and v.validTo is not None and state.enteredAt < v.validTo <= cutoff:
+            batch.close(rfid, state, v.validTo)
+            return True, None
+
+    return changed, state
+
+def merge_histogram(db, deltas: dict):
+    """把 {(day, status, warehouseId, itemcode, bin): [count, seconds]} 累加到 DwellDaily"""
+    if not deltas:
+        return
+    days = list({key[0] for key in deltas})
+    existing = {
+        (row.day, row.status, row.warehouseId, row.itemcode, row.bin): row
+        for row in db.query(DwellDaily).filter(DwellDaily.day.in_(days))
+    }
+
+    updates = []
+    inserts = []
+    for key, (count, seconds) in deltas.items():
+        row = existing.get(key)
+        if row:
+            updates.append({"id": row.id, "count": row.count + count, "totalSeconds": row.totalSeconds + seconds})
+        else:
+            day, status, warehouse, item, index = key
+            inserts.append({
+                "day": day, "status": status, "warehouseId": warehouse, "itemcode": item,
+                "bin": index, "count": count, "totalSeconds": seconds,
+            })
+
+    if updates:
+        db.execute(update(DwellDaily), updates)
+    if inserts:
+        for chunk in chunked(inserts):
+            db.execute(insert(DwellDaily), chunk)
+
+def flush(db, batch: DwellBatch):
+    for ids in chunked(batch.replaced_ids):
+        db.execute(delete(BasketDwell).where(BasketDwell.id.in_(ids)).execution_options(synchronize_session=False))
+    for rows in chunked(batch.rows):
+        db.execute(insert(BasketDwell), rows)
+    merge_histogram(db, batch.histogram)
+
+def stream_timeline(reader, since: datetime, cutoff: datetime):
+    """
+    依 rfid, 版本順序串流讀取 (since 之後有變化、cutoff 之前開始的版本)
+    reader 為獨立連線，寫入端可以在串流途中 commit
+    """
+    timeline = basket_timeline_subquery(reader.dialect.name)
+    statement = select(
+        timeline.c.rfid, timeline.c.status, timeline.c.warehouseId, timeline.c.itemcode,
+        timeline.c.validFrom, timeline.c.validTo,
+    ).where(
+        timeline.c.validFrom <= cutoff
+    ).order_by(timeline.c.rfid, timeline.c.seq)
+    if since is not None:
+        statement = statement.where(or_(timeline.c.validTo > since, timeline.c.validFrom > since))
+
+    return reader.execution_options(stream_results=True, yield_per=STREAM_CHUNK).execute(statement)
+
+def run_dwell(db, full: bool = False):
+    """
+    計算停留區間 (會 commit)；full 時清空重算 (分段 commit，中斷後再以 full 重跑即可)
+    回傳 {"baskets", "intervals", "watermark"}
+    """
+    watermark = db.get(AnalyticsWatermark, DWELL_WATERMARK)
+    if watermark is None:
+        watermark = AnalyticsWatermark(name=DWELL_WATERMARK, lastId=0, updatedAt=datetime.now())
+        db.add(watermark)
+        db.commit()
+    # 第一次執行等同 full
+    full = full or watermark.lastAt is None
+    since = None if full else watermark.lastAt
+    cutoff = datetime.now() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+
+    open_states = {}
+    if full:
+        db.execute(delete(BasketDwell))
+        db.execute(delete(DwellDaily))
+        db.commit()
+    else:
+        # 每個籃子最多一筆 open 區間
+        for row in db.execute(
+            select(BasketDwell.id, BasketDwell.rfid, BasketDwell.status, BasketDwell.warehouseId,
+                   BasketDwell.itemcode, BasketDwell.enteredAt, BasketDwell.cycleStart)
+            .where(BasketDwell.leftAt.is_(None))
+        ):
+            open_states[row.rfid] = DwellState(row.status, row.warehouseId, row.itemcode, row.enteredAt, row.cycleStart, id=row.id)
+
+    batch = DwellBatch()
+    baskets = 0
+    intervals = 0
+    with db.get_bind().connect() as reader:
+        for rfid, versions in groupby(stream_timeline(reader, since, cutoff), key=lambda v: v.rfid):
+            state = open_states.pop(rfid, None)
+            previous_id = state.id if state else None
+            changed, state = replay_basket(batch, rfid, list(versions), state, cutoff)
+            if not changed:
+                continue
+
+            baskets += 1
+            if previous_id:
+                batch.replaced_ids.append(previous_id)
+            if state:
+                batch.keep_open(rfid, state)
+
+            # full 重算可分段寫入；增量在同一個交易內完成
+            if full and len(batch.rows) >= FLUSH_ROWS:
+                flush(db, batch)
+                db.commit()
+                intervals += batch.closed
+                batch = DwellBatch()
+
+    flush(db, batch)
+    intervals += batch.closed
+
+    # 增量的水位以條件更新：同時有其他執行更新了水位時放棄這次
+    statement = update(AnalyticsWatermark).where(AnalyticsWatermark.name == DWELL_WATERMARK)
+    if not full:
+        statement = statement.where(AnalyticsWatermark.lastAt == since)
+    moved = db.execute(
+        statement.values(lastAt=cutoff, updatedAt=datetime.now()).execution_options(synchronize_session=False)
+    ).rowcount
+    if moved != 1:
+        db.rollback()
+        raise RuntimeError("Dwell watermark moved by another run")
+
+    db.commit()
+    return {"baskets": baskets, "intervals": intervals, "watermark": cutoff}
+
+"""
+# --- 查詢 (只讀直方圖) ---
+"""
+DWELL_DIMENSIONS = ("day", "status", "warehouseId", "itemcode")
+
+def histogram_percentile(bins, total: int, p: float):
+    """bins 為依分箱排序的 [(bin, count)]，回傳第 p 百分位的秒數估計"""
+    target = max(1, math.ceil(total * p / 100))
+    seen = 0
+    for index, count in bins:
+        seen += count
+        if seen >= target:
+            return round(bin_seconds(index), 1)
+    return round(bin_seconds(bins[-1][0]), 1) if bins else None
+
+def dwell_percentiles(db, start: datetime, end: datetime, dimensions, filters: dict, percentiles):
+    columns = [getattr(DwellDaily, name) for name in dimensions]
+    statement = select(
+        *columns, DwellDaily.bin, func.sum(DwellDaily.count), func.sum(DwellDaily.totalSeconds)
+    ).where(
+        DwellDaily.day >= start, DwellDaily.day < end
+    ).group_by(*columns, DwellDaily.bin).order_by(*columns, DwellDaily.bin)
+
+    for name, value in filters.items():
+        if value is not None:
+            statement = statement.where(getattr(DwellDaily, name) == value)
+
+    groups = {}
+    for row in db.execute(statement):
+        key = tuple(row[:len(dimensions)])
+        index, count, seconds = row[len(dimensions)], int(row[-2] or 0), int(row[-1] or 0)
+        group = groups.setdefault(key, {"bins": [], "count": 0, "seconds": 0})
+        group["bins"].append((index, count))
+        group["count"] += count
+        group["seconds"] += seconds
+
+    points = []
+    for key, group in groups.items():
+        if not group["count"]:
+            continue
+        points.append({
+            **dict(zip(dimensions, key)),
+            "count": group["count"],
+            "avgSeconds": round(group["seconds"] / group["count"], 1),
+            "percentiles": {f"p{p:g}": histogram_percentile(group["bins"], group["count"], p) for p in percentiles},
+        })
+    return points
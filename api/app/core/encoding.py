@@ -0,0 +1,118 @@
+# app/core/encoding.py
+import json
+from datetime import date, datetime
+from fastapi import Request, Response
+from starlette.datastructures import MutableHeaders
+import msgpack
+import orjson
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+COLUMNAR_MEDIA_TYPE = "application/vnd.kdl.columnar+json"
+
+# 以 JSON 字串存放在 DB 的欄位，精簡格式下直接展開成物件，App 不用再二次解析
+EMBEDDED_JSON_FIELDS = ("product", "batch")
+
+# 回應內容依 Accept 而異的請求 (negotiate_format 設定)，VaryAcceptMiddleware 據此加上 Vary: Accept
+NEGOTIATED_STATE = "accept_negotiated"
+
+class ORJSONResponse(Response):
+    """以 orjson 編碼的 JSON 回應 (datetime/date 直接輸出 ISO 格式)"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+def negotiate_format(request: Request):
+    """
+    依 Accept header 決定回應格式：
+    - application/x-msgpack              -> "msgpack"
+    - application/vnd.kdl.columnar+json  -> "columnar"
+    - 其他                                -> None (維持原本的 JSON 陣列)
+    """
+    setattr(request.state, NEGOTIATED_STATE, True)
+    accept = request.headers.get("accept", "")
+    if MSGPACK_MEDIA_TYPE in accept:
+        return "msgpack"
+    if COLUMNAR_MEDIA_TYPE in accept:
+        return "columnar"
+    return None
+
+def compact_response(request: Request, rows, fields, extra: dict = None):
+    """
+    若 App 要求精簡格式，將 rows (ORM 物件或 dict) 轉成欄位陣列格式回傳：
+        {"columns": [...], "rows": [[...], ...], **extra}
+    沒有要求時回傳 None，由呼叫端走原本的 response_model 流程。
+    """
+    fmt = negotiate_format(request)
+    if fmt is None:
+        return None
+
+    columns = list(fields)
+    payload = dict(extra or {})
+    payload["columns"] = columns
+    payload["rows"] = [[expand_value(f, value_of(row, f)) for f in columns] for row in rows]
+
+    if fmt == "msgpack":
+        content = msgpack.packb(payload, default=encode_default, use_bin_type=True)
+        return Response(content=content, media_type=MSGPACK_MEDIA_TYPE)
+
+    content = json.dumps(payload, default=encode_default, ensure_ascii=False, separators=(",", ":"))
+    return Response(content=content.encode("utf-8"), media_type=COLUMNAR_MEDIA_TYPE)
+
+def query_rows(query, model, fields):
+    """
+    只查詢需要的欄位 (tuple) 並直接組成 dict，略過 ORM 物件建立與 Pydantic 逐筆驗證。
+    搭配 ORJSONResponse 回傳，供大量列表的熱門端點使用。
+    """
+    fields = list(fields)
+    rows = query.with_entities(*[getattr(model, f) for f in fields]).all()
+    return [dict(zip(fields, row)) for row in rows]
+
+def fast_response(request: Request, rows, fields, extra: dict = None, items_key: str = None):
+    """
+    列表快速回應：App 要求精簡格式時走 compact_response，否則用 orjson 編碼。
+    items_key 有值時回傳 {**extra, items_key: rows} (分頁格式)，否則直接回傳陣列。
+    """
+    compact = compact_response(request, rows, fields, extra=extra)
+    if compact:
+        return compact
+    if items_key:
+        return ORJSONResponse({**(extra or {}), items_key: rows})
+    return ORJSONResponse(rows)
+
+def value_of(row, field):
+    if isinstance(row, dict):
+        return row.get(field)
+    return getattr(row, field, None)
+
+def expand_value(field, value):
+    if field in EMBEDDED_JSON_FIELDS and isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+def encode_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not serializable")
+
+class VaryAcceptMiddleware:
+    """純 ASGI middleware：經過格式協商的回應加上 Vary: Accept，避免共用快取把 msgpack / 欄位格式回給 JSON 用戶端"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and state.get(NEGOTIATED_STATE):
+                MutableHeaders(scope=message).add_vary_header("Accept")
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
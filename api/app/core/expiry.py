@@ -0,0 +1,130 @@
+# app/core/expiry.py
+import logging
+from datetime import datetime, date, timedelta
+from sqlalchemy import select, func
+from app.models import Basket, Batch
+from app.core.reconciliation import NON_STOCK_STATUSES, chunked
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 到期查詢與提醒 ---
+- 查詢：先以 Batches.expireDate (索引) 找出期間內到期的批次，再以 Baskets.batchCode (索引) 彙總各倉庫的在庫籃子
+- 增量索引：expiry:batches (ZSET，score = 到期時間)，批次新增/修改/刪除時同步；
+  定期掃描只讀取即將到期的批次代碼，不必掃描整個 Batches 表 (key 不存在時自動從資料庫重建)
+- 去重：expiry:alerted:{batch}:{warehouse}:{daysLeft}，同一批次在同一倉庫每個剩餘天數只提醒一次
+"""
+INDEX_KEY = "expiry:batches"
+ALERTED_TTL = 2 * 24 * 3600
+
+def day_start(value: date):
+    return datetime.combine(value, datetime.min.time())
+
+def index_batch_expiry(client, batches):
+    """commit 後呼叫；Redis 失敗時下次重建索引會補上"""
+    mapping = {b.batch_code: b.expireDate.timestamp() for b in batches if b.batch_code and b.expireDate}
+    if not mapping:
+        return
+    try:
+        client.zadd(INDEX_KEY, mapping)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to update expiry index: {e}")
+
+def remove_batch_expiry(client, batch_codes):
+    codes = [code for code in batch_codes if code]
+    if not codes:
+        return
+    try:
+        client.zrem(INDEX_KEY, *codes)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to update expiry index: {e}")
+
+def rebuild_expiry_index(db, client):
+    """以資料庫內尚未過期 (含昨天) 的批次重建索引"""
+    since = day_start(date.today() - timedelta(days=1))
+    rows = db.execute(
+        select(Batch.batch_code, Batch.expireDate).where(Batch.expireDate >= since)
+    ).all()
+
+    pipe = client.pipeline()
+    pipe.delete(INDEX_KEY)
+    for chunk in chunked(rows):
+        pipe.zadd(INDEX_KEY, {code: expire.timestamp() for code, expire in chunk if code})
+    pipe.execute()
+    return len(rows)
+
+def upcoming_expiry(db, days: int, warehouse_id: str = None, itemcode: str = None,
+                    batch_codes=None, include_expired: bool = False):
+    """
+    今天起 days 天內到期 (include_expired 時含已過期) 的在庫籃子，依倉庫 × 批次彙總，依到期日排序
+    """
+    today = date.today()
+    end = day_start(today + timedelta(days=days + 1))
+
+    statement = select(
+        Basket.warehouseId,
+        Batch.itemcode,
+        Batch.batch_code,
+        Batch.expireDate,
+        func.count(Basket.bid),
+        func.coalesce(func.sum(Basket.quantity), 0),
+    ).join(
+        Basket, Basket.batchCode == Batch.batch_code
+    ).where(
+        Batch.expireDate < end,
+        Basket.status.notin_(NON_STOCK_STATUSES),
+    ).group_by(
+        Basket.warehouseId, Batch.itemcode, Batch.batch_code, Batch.expireDate
+    ).order_by(Batch.expireDate, Basket.warehouseId)
+
+    if not include_expired:
+        statement = statement.where(Batch.expireDate >= day_start(today))
+    if warehouse_id:
+        statement = statement.where(Basket.warehouseId == warehouse_id)
+    if itemcode:
+        statement = statement.where(Batch.itemcode == itemcode)
+
+    if batch_codes is None:
+        rows = db.execute(statement).all()
+    else:
+        rows = []
+        for codes in chunked(list(batch_codes)):
+            rows.extend(db.execute(statement.where(Batch.batch_code.in_(codes))).all())
+        rows.sort(key=lambda row: (row[3], row[0] or ""))
+
+    return [
+        {
+            "warehouseId": warehouse,
+            "itemcode": item,
+            "batchCode": batch_code,
+            "expireDate": expire_date,
+            "daysLeft": (expire_date.date() - today).days,
+            "baskets": baskets,
+            "quantity": int(quantity),
+        }
+        for warehouse, item, batch_code, expire_date, baskets, quantity in rows
+    ]
+
+def scan_expiry_alerts(db, client, days: int):
+    """找出需要提醒 (尚未提醒過) 的到期群組；只查詢索引中即將到期的批次"""
+    if not client.exists(INDEX_KEY):
+        rebuilt = rebuild_expiry_index(db, client)
+        logger.info(f"🗓️ Rebuilt expiry index ({rebuilt} batches)")
+
+    today = date.today()
+    # 清掉已過期一天以上的批次
+    client.zremrangebyscore(INDEX_KEY, "-inf", f"({day_start(today - timedelta(days=1)).timestamp()}")
+    codes = client.zrangebyscore(INDEX_KEY, day_start(today).timestamp(), f"({day_start(today + timedelta(days=days + 1)).timestamp()}")
+    codes = [code.decode() if isinstance(code, bytes) else code for code in codes]
+    if not codes:
+        return []
+
+    groups = upcoming_expiry(db, days, batch_codes=codes)
+
+    pipe = client.pipeline()
+    for group in groups:
+        key = f"expiry:alerted:{group['batchCode']}:{group['warehouseId']}:{group['daysLeft']}"
+        pipe.set(key, 1, nx=True, ex=ALERTED_TTL)
+    fresh = pipe.execute()
+
+    return [group for group, is_new in zip(groups, fresh) if is_new]
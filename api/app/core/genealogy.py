@@ -0,0 +1,248 @@
+# app/core/genealogy.py
+from datetime import datetime
+from sqlalchemy import select, insert, update, exists, or_
+from sqlalchemy.orm import aliased
+from app.models import BasketMovement
+from app.core.history import basket_versions_subquery
+from app.utils import extract_batch_code
+
+BACKFILL_CHUNK = 5000
+LEAVE_EVENT = "Leave"
+
+"""
+# --- 籃子流向 (回收追溯) ---
+各寫入路徑 (bulk-update、單筆修改、離線同步、出貨確認) 在同一個交易內附加 BasketMovements：
+- 籃子目前有批次：記錄目前的批次 / 倉庫 / 狀態 / 數量
+- 清空 (或換批次) 時：舊批次另記一筆離開事件 (eventType 為 Leave、quantity 為 0、status 為離開後狀態)，
+  追溯舊批次時能看到籃子何時離開，讀取端 (對帳、流量彙總) 不必再由寫入時間推斷
+- producedDelta：此事件對批次生產量的影響 (批次對帳以 SUM 計算)，見 produced_delta
+正向追溯 (批次 -> 籃子 -> 倉庫 -> 出貨單) 以 batchCode 索引查詢；反向 (籃子 -> 批次) 以 rfid 索引查詢。
+"""
+def produced_delta(event_type: str, batch_code, status, quantity, previous=None) -> int:
+    """
+    籃子進入生產 (Production 事件，或從其他批次 / 狀態變為 IN_PRODUCTION) -> +數量
+    同一批次生產中修改數量 -> 差額；其他事件 -> 0
+    previous 為更新前的 (batchCode, status, quantity)
+    """
+    if not batch_code or status != "IN_PRODUCTION" or event_type == LEAVE_EVENT:
+        return 0
+    if event_type == "Production" or previous is None or previous[1] != "IN_PRODUCTION" or previous[0] != batch_code:
+        return quantity or 0
+    return (quantity or 0) - (previous[2] or 0)
+
+def basket_movement(basket, event_type: str, batch_code: str = None, shipment_no: str = None, quantity: int = None,
+                    produced: int = 0):
+    return {
+        "batchCode": batch_code or basket.batchCode,
+        "rfid": basket.rfid,
+        "bid": basket.bid,
+        "warehouseId": basket.warehouseId,
+        "status": basket.status,
+        "quantity": basket.quantity if quantity is None else quantity,
+        "eventType": event_type,
+        "shipmentNo": shipment_no,
+        "producedDelta": produced,
+        "createdAt": basket.lastUpdated,
+        "createdBy": basket.updateBy,
+    }
+
+def basket_movements(basket, event_type: str, previous=(None, None, None)):
+    """一次籃子更新對應的流向紀錄 (0~2 筆)；previous 為更新前的 (batchCode, status, quantity)"""
+    rows = []
+    previous_batch_code = previous[0]
+    if previous_batch_code and previous_batch_code != basket.batchCode:
+        rows.append(basket_movement(basket, LEAVE_EVENT, batch_code=previous_batch_code, quantity=0))
+    if basket.batchCode:
+        produced = produced_delta(event_type, basket.batchCode, basket.status, basket.quantity, previous)
+        rows.append(basket_movement(basket, event_type, produced=produced))
+    return rows
+
+def record_movements(db, rows):
+    """在呼叫端的交易內寫入 (不 commit)"""
+    if rows:
+        db.execute(insert(BasketMovement), rows)
+
+def mark_leave_movements(db):
+    """
+    把加入 Leave 事件前寫入的離開紀錄改為 Leave (可重複執行，會 commit)，回傳筆數
+    舊格式：Clear 事件 (清空後沒有批次) 或同一籃子同一時間緊接著另一批次的紀錄
+    """
+    following = aliased(BasketMovement)
+    switched = exists().where(
+        following.rfid == BasketMovement.rfid,
+        following.createdAt == BasketMovement.createdAt,
+        following.id > BasketMovement.id,
+        following.batchCode != BasketMovement.batchCode,
+    )
+    result = db.execute(
+        update(BasketMovement)
+        .where(
+            BasketMovement.eventType.notin_((LEAVE_EVENT, "Backfill", "Shipping")),
+            or_(BasketMovement.eventType == "Clear", switched),
+        )
+        .values(eventType=LEAVE_EVENT, quantity=0)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount
+
+def fill_produced_deltas(db):
+    """
+    為加入 producedDelta 前寫入的流向紀錄補上數值 (可重複執行，會 commit)，回傳筆數
+    需要同一籃子前一筆紀錄才能計算，因此讀取有缺值紀錄的籃子的全部紀錄
+    """
+    pending = select(BasketMovement.rfid).where(BasketMovement.producedDelta.is_(None)).distinct()
+    statement = select(
+        BasketMovement.id, BasketMovement.rfid, BasketMovement.batchCode, BasketMovement.status,
+        BasketMovement.quantity, BasketMovement.eventType, BasketMovement.producedDelta,
+    ).where(BasketMovement.rfid.in_(pending)).order_by(BasketMovement.rfid, BasketMovement.createdAt, BasketMovement.id)
+
+    count = 0
+    params = []
+    previous = None
+    previous_rfid = None
+    # 以獨立連線串流讀取 (SQL Server 未開 MARS 時，同一連線無法邊讀邊寫)；全部寫入後一次 commit
+    with db.get_bind().connect() as reader:
+        for m in reader.execution_options(stream_results=True, yield_per=BACKFILL_CHUNK).execute(statement):
+            if m.rfid != previous_rfid:
+                previous = None
+                previous_rfid = m.rfid
+            if m.producedDelta is None:
+                params.append({"id": m.id, "producedDelta": produced_delta(m.eventType, m.batchCode, m.status, m.quantity, previous)})
+            # 離開舊批次後籃子不再屬於該批次
+            previous = (None, m.status, 0) if m.eventType == LEAVE_EVENT else (m.batchCode, m.status, m.quantity)
+
+            if len(params) >= BACKFILL_CHUNK:
+                db.execute(update(BasketMovement), params)
+                count += len(params)
+                params = []
+
+    if params:
+        db.execute(update(BasketMovement), params)
+        count += len(params)
+    db.commit()
+    return count
+
+def movement_view(m):
+    return {
+        "rfid": m.rfid,
+        "batchCode": m.batchCode,
+        "warehouseId": m.warehouseId,
+        "status": m.status,
+        "quantity": m.quantity,
+        "eventType": m.eventType,
+        "shipmentNo": m.shipmentNo,
+        "createdAt": m.createdAt,
+        "createdBy": m.createdBy,
+    }
+
+def batch_genealogy(db, batch_code: str):
+    """正向追溯：曾經裝過此批次的每個籃子、經過的倉庫與出貨單"""
+    movements = db.query(BasketMovement).filter(
+        BasketMovement.batchCode == batch_code
+    ).order_by(BasketMovement.rfid, BasketMovement.createdAt, BasketMovement.id).all()
+
+    baskets = {}
+    warehouses = {}
+    shipments = {}
+    for m in movements:
+        basket = baskets.setdefault(m.rfid, {"rfid": m.rfid, "firstSeen": m.createdAt, "lastSeen": m.createdAt, "events": []})
+        basket["lastSeen"] = m.createdAt
+        basket["events"].append(movement_view(m))
+
+        if m.warehouseId:
+            warehouse = warehouses.setdefault(m.warehouseId, {"warehouseId": m.warehouseId, "baskets": set(), "firstSeen": m.createdAt, "lastSeen": m.createdAt})
+            warehouse["baskets"].add(m.rfid)
+            warehouse["firstSeen"] = min(warehouse["firstSeen"], m.createdAt)
+            warehouse["lastSeen"] = max(warehouse["lastSeen"], m.createdAt)
+
+        if m.shipmentNo:
+            shipment = shipments.setdefault(m.shipmentNo, {"shipmentNo": m.shipmentNo, "warehouseId": m.warehouseId, "baskets": 0, "quantity": 0, "shippedAt": m.createdAt})
+            shipment["baskets"] += 1
+            shipment["quantity"] += m.quantity or 0
+
+    return {
+        "batchCode": batch_code,
+        "baskets": list(baskets.values()),
+        "warehouses": [
+            {**w, "baskets": len(w["baskets"])}
+            for w in sorted(warehouses.values(), key=lambda w: w["firstSeen"])
+        ],
+        "shipments": sorted(shipments.values(), key=lambda s: s["shippedAt"]),
+    }
+
+def basket_genealogy(db, rfid: str, since=None, until=None):
+    """反向追溯：籃子裝過哪些批次 (依時間)"""
+    query = db.query(BasketMovement).filter(BasketMovement.rfid == rfid)
+    if since:
+        query = query.filter(BasketMovement.createdAt >= since)
+    if until:
+        query = query.filter(BasketMovement.createdAt < until)
+    movements = query.order_by(BasketMovement.createdAt, BasketMovement.id).all()
+
+    batches = {}
+    for m in movements:
+        batch = batches.setdefault(m.batchCode, {"batchCode": m.batchCode, "firstSeen": m.createdAt, "lastSeen": m.createdAt})
+        batch["lastSeen"] = m.createdAt
+
+    return {
+        "rfid": rfid,
+        "batches": list(batches.values()),
+        "events": [movement_view(m) for m in movements],
+    }
+
+def backfill_movements(db):
+    """
+    以既有籃子歷史 (含目前版本) 建立流向紀錄；只在 BasketMovements 為空時執行，回傳筆數
+    遷移前的歷史版本沒有 batchCode 欄位值，改由該版本的 batch JSON 解析
+    """
+    if db.query(BasketMovement.id).first():
+        return 0
+
+    versions = basket_versions_subquery(
+        db.get_bind().dialect.name,
+        columns=("rfid", "bid", "batchCode", "batch", "warehouseId", "status", "quantity", "lastUpdated", "updateBy"),
+    )
+    # 沒有批次的版本 (清空) 也要讀取：生產量需要知道籃子的前一個狀態
+    statement = select(
+        versions.c.batchCode, versions.c.batch, versions.c.rfid, versions.c.bid, versions.c.warehouseId,
+        versions.c.status, versions.c.quantity, versions.c.lastUpdated, versions.c.updateBy,
+    ).order_by(versions.c.rfid, versions.c.lastUpdated)
+
+    now = datetime.now()
+    count = 0
+    rows = []
+    previous = None
+    previous_rfid = None
+    # 以獨立連線串流讀取 (SQL Server 未開 MARS 時，同一連線無法邊讀邊寫)；全部寫入後一次 commit
+    with db.get_bind().connect() as reader:
+        for version in reader.execution_options(stream_results=True, yield_per=BACKFILL_CHUNK).execute(statement):
+            if version.rfid != previous_rfid:
+                previous = None
+                previous_rfid = version.rfid
+            batch_code = version.batchCode or extract_batch_code(version.batch)
+            produced = produced_delta("Backfill", batch_code, version.status, version.quantity, previous)
+            previous = (batch_code, version.status, version.quantity)
+            if not batch_code:
+                continue
+            rows.append({
+                "batchCode": batch_code,
+                "rfid": version.rfid,
+                "bid": version.bid,
+                "warehouseId": version.warehouseId,
+                "status": version.status,
+                "quantity": version.quantity,
+                "eventType": "Backfill",
+                "producedDelta": produced,
+                "createdAt": version.lastUpdated or now,
+                "createdBy": version.updateBy,
+            })
+            if len(rows) >= BACKFILL_CHUNK:
+                record_movements(db, rows)
+                count += len(rows)
+                rows = []
+
+    record_movements(db, rows)
+    count += len(rows)
+    db.commit()
+    return count
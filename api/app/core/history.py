@@ -0,0 +1,162 @@
+# app/core/history.py
+import logging
+from sqlalchemy import select, union_all, literal, literal_column, text, bindparam, DateTime, Integer
+from app.models import Basket, BasketVersion
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 籃子歷史版本 (依資料庫切換實作) ---
+- SQL Server : Temporal Table (Baskets FOR SYSTEM_TIME ALL，SysStartTime / SysEndTime)
+- 其他資料庫 : BasketVersions 附加式歷史表，由 Baskets 的 UPDATE/DELETE trigger 寫入舊版本
+兩者都回傳 Baskets 欄位 + validFrom / validTo，目前版本的 validTo 為 NULL (Temporal 為 9999-12-31)。
+"""
+BASKET_COLUMNS = [c.name for c in Basket.__table__.columns]
+VERSION_COLUMNS = [c for c in BASKET_COLUMNS if c in BasketVersion.__table__.columns]
+
+def uses_temporal_tables(dialect_name: str) -> bool:
+    return dialect_name == "mssql"
+
+def unused_history_tables(dialect_name: str):
+    """此資料庫不需要建立的歷史表 (SQL Server 由 Temporal Table 自行管理)"""
+    if uses_temporal_tables(dialect_name):
+        return [BasketVersion.__table__]
+    return []
+
+def basket_history_statement(dialect_name: str):
+    """單一籃子的所有版本 (新到舊)，參數 :rfid"""
+    if uses_temporal_tables(dialect_name):
+        return text("""
+            SELECT *, SysStartTime as validFrom, SysEndTime as validTo
+            FROM Baskets FOR SYSTEM_TIME ALL
+            WHERE rfid = :rfid
+            ORDER BY lastUpdated DESC
+        """)
+
+    current = select(
+        *[Basket.__table__.c[name] for name in VERSION_COLUMNS],
+        Basket.lastUpdated.label("validFrom"),
+        literal(None, DateTime).label("validTo"),
+    ).where(Basket.rfid == bindparam("rfid"))
+    versions = select(
+        *[BasketVersion.__table__.c[name] for name in VERSION_COLUMNS],
+        BasketVersion.validFrom,
+        BasketVersion.validTo,
+    ).where(BasketVersion.rfid == bindparam("rfid"))
+
+    history = union_all(current, versions).subquery("history")
+    return select(history).order_by(history.c.lastUpdated.desc())
+
+def basket_versions_subquery(dialect_name: str, columns=("rfid", "batchCode", "status", "quantity")):
+    """所有籃子的所有版本 (含目前版本)，供彙總查詢使用；isCurrent = 1 為目前版本"""
+    if uses_temporal_tables(dialect_name):
+        select_list = ", ".join(columns)
+        return text(f"""
+            SELECT {select_list},
+                   CASE WHEN SysEndTime >= '9999-12-31' THEN 1 ELSE 0 END AS isCurrent
+            FROM Baskets FOR SYSTEM_TIME ALL
+        """).columns(
+            *[Basket.__table__.c[name] for name in columns],
+            literal_column("isCurrent", Integer),
+        ).subquery("versions")
+
+    current = select(
+        *[Basket.__table__.c[name] for name in columns],
+        literal(1, Integer).label("isCurrent"),
+    )
+    versions = select(
+        *[BasketVersion.__table__.c[name] for name in columns],
+        literal(0, Integer).label("isCurrent"),
+    )
+    return union_all(current, versions).subquery("versions")
+
+def basket_timeline_subquery(dialect_name: str):
+    """
+    所有籃子的狀態時間軸：rfid, status, warehouseId, itemcode, validFrom, validTo (目前版本為 NULL), seq
+    依 rfid, seq 排序即為每個籃子的版本順序 (SQL Server 為 SysStartTime)
+    時間一律使用 lastUpdated (伺服器本地時間)，與 Temporal Table 的 UTC 系統時間無關
+    """
+    if uses_temporal_tables(dialect_name):
+        return text("""
+            SELECT rfid, status, warehouseId, itemcode,
+                   lastUpdated AS validFrom,
+                   LEAD(lastUpdated) OVER (PARTITION BY rfid ORDER BY SysStartTime) AS validTo,
+                   SysStartTime AS seq
+            FROM Baskets FOR SYSTEM_TIME ALL
+        """).columns(
+            Basket.rfid, Basket.status, Basket.warehouseId, Basket.itemcode,
+            literal_column("validFrom", DateTime),
+            literal_column("validTo", DateTime),
+            literal_column("seq", DateTime),
+        ).subquery("timeline")
+
+    current = select(
+        Basket.rfid, Basket.status, Basket.warehouseId, Basket.itemcode,
+        Basket.lastUpdated.label("validFrom"),
+        literal(None, DateTime).label("validTo"),
+        Basket.lastUpdated.label("seq"),
+    )
+    versions = select(
+        BasketVersion.rfid, BasketVersion.status, BasketVersion.warehouseId, BasketVersion.itemcode,
+        BasketVersion.validFrom,
+        BasketVersion.validTo,
+        BasketVersion.validFrom.label("seq"),
+    )
+    return union_all(current, versions).subquery("timeline")
+
+"""
+# --- Trigger DDL ---
+"""
+def history_trigger_ddl(dialect_name: str, quote):
+    columns = ", ".join(quote(name) for name in VERSION_COLUMNS)
+    old_values = ", ".join(f"OLD.{quote(name)}" for name in VERSION_COLUMNS)
+    baskets = quote(Basket.__tablename__)
+    versions = quote(BasketVersion.__tablename__)
+    last_updated = quote("lastUpdated")
+    insert = f"INSERT INTO {versions} ({columns}, {quote('validFrom')}, {quote('validTo')})"
+
+    if dialect_name == "sqlite":
+        now = "datetime('now', 'localtime')"
+        return [
+            "DROP TRIGGER IF EXISTS trg_Baskets_history_update",
+            "DROP TRIGGER IF EXISTS trg_Baskets_history_delete",
+            f"""CREATE TRIGGER trg_Baskets_history_update AFTER UPDATE ON {baskets}
+            BEGIN
+                {insert} VALUES ({old_values}, COALESCE(OLD.{last_updated}, {now}), COALESCE(NEW.{last_updated}, {now}));
+            END""",
+            f"""CREATE TRIGGER trg_Baskets_history_delete AFTER DELETE ON {baskets}
+            BEGIN
+                {insert} VALUES ({old_values}, COALESCE(OLD.{last_updated}, {now}), {now});
+            END""",
+        ]
+
+    if dialect_name == "postgresql":
+        return [
+            f"""CREATE OR REPLACE FUNCTION baskets_history() RETURNS trigger AS $$
+            BEGIN
+                {insert} VALUES ({old_values}, COALESCE(OLD.{last_updated}, LOCALTIMESTAMP),
+                    CASE WHEN TG_OP = 'UPDATE' THEN COALESCE(NEW.{last_updated}, LOCALTIMESTAMP) ELSE LOCALTIMESTAMP END);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+            f"DROP TRIGGER IF EXISTS trg_baskets_history ON {baskets}",
+            f"""CREATE TRIGGER trg_baskets_history AFTER UPDATE OR DELETE ON {baskets}
+            FOR EACH ROW EXECUTE FUNCTION baskets_history()""",
+        ]
+
+    return None
+
+def install_history_triggers(engine):
+    """建立 (或重建) 歷史 trigger；欄位變更後重新執行即可同步欄位清單"""
+    dialect_name = engine.dialect.name
+    if uses_temporal_tables(dialect_name):
+        return
+
+    statements = history_trigger_ddl(dialect_name, engine.dialect.identifier_preparer.quote)
+    if statements is None:
+        logger.warning(f"⚠️ Basket history triggers are not supported on {dialect_name}; history will not be recorded")
+        return
+
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(text(statement))
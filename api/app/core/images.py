@@ -0,0 +1,207 @@
+# app/core/images.py
+import hashlib
+import os
+import re
+import tempfile
+from python_multipart.multipart import MultipartParser, parse_options_header
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.staticfiles import StaticFiles, NotModifiedResponse
+from app.database import settings
+
+"""
+# --- 產品圖片 ---
+- 上傳：multipart 內容直接串流寫入暫存檔 (不經過 UploadFile)，邊寫邊計算 SHA-256，超過大小上限即中止
+- 檔名為內容雜湊，同一張圖重複上傳直接沿用既有檔案：
+  {hash}.{jpg|png|webp|gif} 原圖、{hash}_large.webp 限制最長邊的 WebP、{hash}_thumb.webp 縮圖
+- 服務：雜湊檔名的內容永不改變 -> Cache-Control immutable，ETag 為檔名 (多台主機一致)
+Pillow 在第一次處理圖片時才載入。
+"""
+IMAGE_DIR = os.path.join("static", "images")
+IMAGE_URL_PREFIX = "/static/images/"
+HASH_LENGTH = 32
+HASHED_NAME = re.compile(r"^([0-9a-f]{32})(_large|_thumb)?\.(jpg|png|webp|gif)$")
+FORMAT_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+DEFAULT_CACHE = "public, max-age=300" # 舊的 UUID 檔名等，內容可能被覆蓋
+
+class ImageTooLarge(Exception):
+    pass
+
+class InvalidImage(Exception):
+    pass
+
+def thumbnail_url(image_url):
+    """雜湊命名的圖片 -> 縮圖 URL；舊圖片 (UUID 檔名) 沒有縮圖，回傳原圖"""
+    if not image_url:
+        return None
+    match = HASHED_NAME.match(image_url.rsplit("/", 1)[-1])
+    if not match:
+        return image_url
+    return f"{IMAGE_URL_PREFIX}{match.group(1)}_thumb.webp"
+
+class ImageUpload:
+    """上傳中的檔案：寫入 IMAGE_DIR 下的暫存檔 (同一檔案系統，完成後 os.replace 為雜湊檔名)"""
+    def __init__(self, filename: str, max_bytes: int):
+        fd, self.path = tempfile.mkstemp(dir=IMAGE_DIR, prefix=".", suffix=".upload")
+        self.file = os.fdopen(fd, "wb")
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hasher = hashlib.sha256()
+
+    def write(self, data: bytes):
+        self.size += len(data)
+        if self.size > self.max_bytes:
+            raise ImageTooLarge(f"Image exceeds {self.max_bytes} bytes")
+        self.hasher.update(data)
+        self.file.write(data)
+
+    @property
+    def digest(self) -> str:
+        return self.hasher.hexdigest()[:HASH_LENGTH]
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+    def discard(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+async def receive_image_upload(request, field_name: str = "file", max_bytes: int = None) -> ImageUpload:
+    """解析 multipart/form-data 請求，將 field_name 檔案欄位串流寫入暫存檔；其他欄位忽略"""
+    max_bytes = max_bytes or settings.IMAGE_MAX_UPLOAD_BYTES
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise InvalidImage("Expected multipart/form-data with a file field")
+
+    # Content-Length 明顯超過上限時不讀取內容 (保留 multipart 標頭的空間)
+    length = request.headers.get("content-length", "")
+    if length.isdigit() and int(length) > max_bytes + 64 * 1024:
+        raise ImageTooLarge(f"Image exceeds {max_bytes} bytes")
+
+    state = {"field": b"", "value": b"", "headers": {}, "target": None, "upload": None}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["target"] = None
+
+    def on_header_field(data, start, end):
+        state["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        state["value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["field"].lower()] = state["value"]
+        state["field"] = b""
+        state["value"] = b""
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        if (state["upload"] is None
+                and disposition.get(b"name") == field_name.encode()
+                and b"filename" in disposition):
+            filename = disposition[b"filename"].decode("utf-8", errors="replace")
+            state["upload"] = state["target"] = ImageUpload(filename, max_bytes)
+
+    def on_part_data(data, start, end):
+        if state["target"] is not None:
+            state["target"].write(data[start:end])
+
+    parser = MultipartParser(options[b"boundary"], {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+        parser.finalize()
+    except Exception as e:
+        if state["upload"] is not None:
+            state["upload"].discard()
+        if isinstance(e, (ImageTooLarge, InvalidImage)):
+            raise
+        raise InvalidImage(f"Malformed multipart body: {e}")
+
+    upload = state["upload"]
+    if upload is None:
+        raise InvalidImage(f"Missing file field '{field_name}'")
+    upload.close()
+    return upload
+
+def save_webp(image, path: str, max_size: int):
+    """等比縮小到最長邊 max_size 後存成 WebP (先寫暫存檔再改名，避免讀到寫一半的檔案)"""
+    variant = image.copy()
+    variant.thumbnail((max_size, max_size))
+    temp_path = f"{path}.tmp"
+    variant.save(temp_path, format="WEBP", quality=settings.IMAGE_WEBP_QUALITY, method=4)
+    os.replace(temp_path, path)
+
+def store_image(upload: ImageUpload) -> dict:
+    """驗證圖片、以內容雜湊命名並產生 WebP 大圖與縮圖 (阻塞，於執行緒池執行)"""
+    from PIL import Image, ImageOps
+    Image.MAX_IMAGE_PIXELS = settings.IMAGE_MAX_PIXELS
+
+    try:
+        with Image.open(upload.path) as image:
+            image_format = image.format
+            image.verify()
+    except Exception as e: # 含 DecompressionBombError
+        upload.discard()
+        raise InvalidImage(f"Invalid image: {e}")
+
+    extension = FORMAT_EXTENSIONS.get(image_format)
+    if not extension:
+        upload.discard()
+        raise InvalidImage(f"Unsupported image format: {image_format}")
+
+    digest = upload.digest
+    original = f"{digest}.{extension}"
+    original_path = os.path.join(IMAGE_DIR, original)
+    deduplicated = os.path.exists(original_path)
+    if deduplicated:
+        upload.discard()
+    else:
+        os.replace(upload.path, original_path)
+
+    variants = ((f"{digest}_large.webp", settings.IMAGE_LARGE_SIZE), (f"{digest}_thumb.webp", settings.IMAGE_THUMB_SIZE))
+    missing = [(name, size) for name, size in variants if not os.path.exists(os.path.join(IMAGE_DIR, name))]
+    if missing:
+        with Image.open(original_path) as image:
+            image = ImageOps.exif_transpose(image) # 手機照片依 EXIF 方向轉正
+            if image.mode not in ("RGB", "RGBA"):
+                image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+            for name, size in missing:
+                save_webp(image, os.path.join(IMAGE_DIR, name), size)
+
+    return {
+        "filename": original,
+        "url": f"{IMAGE_URL_PREFIX}{original}",
+        "webpUrl": f"{IMAGE_URL_PREFIX}{variants[0][0]}",
+        "thumbnailUrl": f"{IMAGE_URL_PREFIX}{variants[1][0]}",
+        "hash": digest,
+        "size": upload.size,
+        "deduplicated": deduplicated,
+    }
+
+class CachedStaticFiles(StaticFiles):
+    """雜湊檔名：一年 immutable 快取、ETag 為檔名；其他檔案維持 Starlette 的 ETag 並給短快取"""
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result)
+        name = os.path.basename(full_path)
+        if HASHED_NAME.match(name):
+            response.headers["etag"] = f'"{os.path.splitext(name)[0]}"'
+            response.headers["cache-control"] = IMMUTABLE_CACHE
+        else:
+            response.headers["cache-control"] = DEFAULT_CACHE
+        if self.is_not_modified(response.headers, Headers(scope=scope)):
+            return NotModifiedResponse(response.headers)
+        return response
@@ -0,0 +1,224 @@
+# app/core/jobs.py
+import json
+import logging
+import time
+import traceback
+import uuid
+from datetime import datetime
+from app.database import settings, SessionLocal
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 背景工作 (Redis 佇列) ---
+- jobs:queue            待執行的 job id (LPUSH / BRPOPLPUSH)
+- jobs:processing       執行中的 job id (worker 異常結束時由 requeue_stale_jobs 放回佇列)
+- jobs:delayed          等待重試的 job id (ZSET，score = 可執行時間)
+- job:{id}              狀態 hash：type, status, progress, total, attempts, payload, result, error...
+- jobs:user:{username}  使用者最近的 job (ZSET)
+
+狀態：QUEUED -> RUNNING -> SUCCEEDED / FAILED (失敗且可重試時為 RETRYING，依指數退避重新排入)
+處理函式以 @job_handler("type") 註冊，簽名為 handler(ctx: JobContext, payload: dict) -> dict。
+處理函式應可重複執行 (冪等)；可用 ctx.checkpoint 記錄進度，重試時從中斷處繼續。
+定期工作以 @periodic_job("type", interval) 註冊，由 worker 排入 (jobs:schedule:{type} 確保多個 worker 只排一次)。
+"""
+QUEUE_KEY = "jobs:queue"
+PROCESSING_KEY = "jobs:processing"
+DELAYED_KEY = "jobs:delayed"
+USER_JOBS_LIMIT = 50
+
+JOB_HANDLERS = {}
+PERIODIC_JOBS = {}
+
+def job_handler(job_type: str):
+    def register(fn):
+        JOB_HANDLERS[job_type] = fn
+        return fn
+    return register
+
+def periodic_job(job_type: str, interval):
+    """interval 為秒數或回傳秒數的函式 (讀取 settings)；被裝飾的函式同時註冊為處理函式"""
+    def register(fn):
+        PERIODIC_JOBS[job_type] = interval
+        return job_handler(job_type)(fn)
+    return register
+
+def job_key(job_id: str):
+    return f"job:{job_id}"
+
+def job_ttl_seconds():
+    return settings.JOB_TTL_DAYS * 24 * 3600
+
+def enqueue_job(client, job_type: str, payload: dict, created_by: str, total: int = 0, max_attempts: int = None):
+    job_id = uuid.uuid4().hex
+    now = datetime.now()
+    pipe = client.pipeline()
+    pipe.hset(job_key(job_id), mapping={
+        "id": job_id,
+        "type": job_type,
+        "status": "QUEUED",
+        "progress": 0,
+        "total": total,
+        "attempts": 0,
+        "maxAttempts": max_attempts or settings.JOB_MAX_ATTEMPTS,
+        "checkpoint": "",
+        "payload": json.dumps(payload),
+        "createdBy": created_by,
+        "createdAt": now.isoformat(),
+    })
+    pipe.expire(job_key(job_id), job_ttl_seconds())
+    pipe.zadd(f"jobs:user:{created_by}", {job_id: now.timestamp()})
+    pipe.zremrangebyrank(f"jobs:user:{created_by}", 0, -USER_JOBS_LIMIT - 1)
+    pipe.lpush(QUEUE_KEY, job_id)
+    pipe.execute()
+    return job_id
+
+def get_job(client, job_id: str):
+    job = client.hgetall(job_key(job_id))
+    if not job:
+        return None
+    return job_view(job)
+
+def list_user_jobs(client, username: str, limit: int = 20):
+    job_ids = client.zrevrange(f"jobs:user:{username}", 0, limit - 1)
+    pipe = client.pipeline()
+    for job_id in job_ids:
+        pipe.hgetall(job_key(job_id))
+    return [job_view(job) for job in pipe.execute() if job]
+
+def job_view(job: dict):
+    """Redis hash -> API 回應 (不含 payload)"""
+    return {
+        "id": job["id"],
+        "type": job["type"],
+        "status": job["status"],
+        "progress": int(job.get("progress") or 0),
+        "total": int(job.get("total") or 0),
+        "attempts": int(job.get("attempts") or 0),
+        "maxAttempts": int(job.get("maxAttempts") or 0),
+        "result": json.loads(job["result"]) if job.get("result") else None,
+        "error": job.get("error") or None,
+        "createdBy": job.get("createdBy"),
+        "createdAt": job.get("createdAt"),
+        "startedAt": job.get("startedAt") or None,
+        "finishedAt": job.get("finishedAt") or None,
+    }
+
+class JobContext:
+    def __init__(self, client, job_id: str, job: dict):
+        self.client = client
+        self.job_id = job_id
+        self.attempt = int(job["attempts"])
+        self._checkpoint = job.get("checkpoint") or ""
+        self.db = SessionLocal()
+
+    def progress(self, done: int, total: int = None):
+        mapping = {"progress": done}
+        if total is not None:
+            mapping["total"] = total
+        self.client.hset(job_key(self.job_id), mapping=mapping)
+
+    @property
+    def checkpoint(self):
+        return json.loads(self._checkpoint) if self._checkpoint else None
+
+    @checkpoint.setter
+    def checkpoint(self, value):
+        self._checkpoint = json.dumps(value)
+        self.client.hset(job_key(self.job_id), "checkpoint", self._checkpoint)
+
+    def close(self):
+        self.db.close()
+
+"""
+# --- Worker ---
+"""
+def promote_delayed_jobs(client):
+    """把到期的重試 job 移回佇列"""
+    now = time.time()
+    for job_id in client.zrangebyscore(DELAYED_KEY, 0, now):
+        # ZREM 成功的 worker 才負責排入，避免多個 worker 重複排入
+        if client.zrem(DELAYED_KEY, job_id):
+            client.lpush(QUEUE_KEY, job_id)
+
+def requeue_stale_jobs(client, stale_seconds: int):
+    """
+    worker 異常結束時留在 processing 的 job：
+    RUNNING / QUEUED 超過 stale_seconds 重新排入，已結束的直接移除
+    """
+    now = time.time()
+    for job_id in client.lrange(PROCESSING_KEY, 0, -1):
+        job = client.hgetall(job_key(job_id))
+        status = job.get("status")
+        if status in ("RUNNING", "QUEUED"):
+            since = job.get("startedAt") if status == "RUNNING" else job.get("createdAt")
+            if since and now - datetime.fromisoformat(since).timestamp() < stale_seconds:
+                continue
+        if client.lrem(PROCESSING_KEY, 1, job_id) and status in ("RUNNING", "QUEUED"):
+            client.hset(job_key(job_id), "status", "QUEUED")
+            client.lpush(QUEUE_KEY, job_id)
+            logger.warning(f"⚠️ Requeued stale job {job_id}")
+
+def run_job(client, job_id: str):
+    key = job_key(job_id)
+    job = client.hgetall(key)
+    if not job:
+        client.lrem(PROCESSING_KEY, 1, job_id)
+        return
+
+    handler = JOB_HANDLERS.get(job["type"])
+    attempts = int(job.get("attempts") or 0) + 1
+    client.hset(key, mapping={
+        "status": "RUNNING",
+        "attempts": attempts,
+        "startedAt": datetime.now().isoformat(),
+        "error": "",
+    })
+    job["attempts"] = attempts
+
+    ctx = JobContext(client, job_id, job)
+    try:
+        if handler is None:
+            raise ValueError(f"Unknown job type: {job['type']}")
+        result = handler(ctx, json.loads(job["payload"]))
+        client.hset(key, mapping={
+            "status": "SUCCEEDED",
+            "result": json.dumps(result or {}, default=str),
+            "finishedAt": datetime.now().isoformat(),
+        })
+        logger.info(f"✅ Job {job_id} ({job['type']}) succeeded")
+    except Exception as e:
+        ctx.db.rollback()
+        error = f"{type(e).__name__}: {e}"
+        max_attempts = int(job.get("maxAttempts") or 1)
+        if handler is not None and attempts < max_attempts:
+            delay = settings.JOB_RETRY_BASE_DELAY * (2 ** (attempts - 1))
+            client.hset(key, mapping={"status": "RETRYING", "error": error})
+            client.zadd(DELAYED_KEY, {job_id: time.time() + delay})
+            logger.warning(f"⚠️ Job {job_id} failed (attempt {attempts}/{max_attempts}), retry in {delay}s: {error}")
+        else:
+            client.hset(key, mapping={
+                "status": "FAILED",
+                "error": error,
+                "finishedAt": datetime.now().isoformat(),
+            })
+            logger.error(f"❌ Job {job_id} failed: {error}\n{traceback.format_exc()}")
+    finally:
+        ctx.close()
+        client.lrem(PROCESSING_KEY, 1, job_id)
+
+def enqueue_periodic_jobs(client):
+    """到期的定期工作排入佇列；SET NX 搶到排程 key 的 worker 才排入"""
+    for job_type, interval in PERIODIC_JOBS.items():
+        seconds = interval() if callable(interval) else interval
+        if seconds > 0 and client.set(f"jobs:schedule:{job_type}", 1, nx=True, ex=seconds):
+            enqueue_job(client, job_type, {}, "scheduler")
+
+def run_worker(client, should_stop, poll_timeout: int = 1):
+    requeue_stale_jobs(client, settings.JOB_STALE_SECONDS)
+    while not should_stop():
+        promote_delayed_jobs(client)
+        enqueue_periodic_jobs(client)
+        job_id = client.brpoplpush(QUEUE_KEY, PROCESSING_KEY, timeout=poll_timeout)
+        if job_id:
+            run_job(client, job_id)
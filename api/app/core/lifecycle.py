@@ -0,0 +1,130 @@
+# app/core/lifecycle.py
+import logging
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from fastapi import HTTPException
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+from app.database import settings, get_engine, dispose_engine
+from app.core.metrics import close_redis_pools, mark_metrics_process_dead
+from app.core.permissions import ROLE_PERMISSION_MATRIX, resolve_permissions
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 服務生命週期 (多 worker 部署，見 serve.py) ---
+- 啟動 (每個 worker)：丟棄 fork 前繼承的 DB 連線、預先建立 DB / Redis 連線、預熱權限與籃子快取
+- 關閉：收到 SIGTERM / SIGINT 時即開始 drain (新的批量寫入回 503)，並從此刻起算 SHUTDOWN_DRAIN_SECONDS；
+  uvicorn 停止接受連線並等待進行中的請求後，仍在執行緒中的批量寫入只等到同一個期限，
+  最後釋放 engine 與 Redis 連線池 (整體關閉時間不超過一次 SHUTDOWN_DRAIN_SECONDS)
+批量寫入 (bulk-update、離線同步、出貨確認...) 以 @drains_on_shutdown 標記：
+關閉期間新的批量寫入直接回 503，由手持端稍後重送。
+"""
+class InflightWrites:
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._active = 0
+        self.draining = False
+        self.deadline = None
+
+    @contextmanager
+    def track(self):
+        with self._condition:
+            if self.draining:
+                raise HTTPException(
+                    status_code=503,
+                    detail="Server is shutting down, please retry",
+                    headers={"Retry-After": "5"},
+                )
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def begin_drain(self, timeout: float):
+        """停止接受新的批量寫入；期限只在第一次呼叫時設定"""
+        with self._condition:
+            if not self.draining:
+                self.draining = True
+                self.deadline = time.monotonic() + timeout
+
+    def time_left(self) -> float:
+        return max(0.0, self.deadline - time.monotonic()) if self.deadline else 0.0
+
+    def drain(self, timeout: float) -> int:
+        """等待進行中的批量寫入完成 (已開始 drain 時沿用原本的期限)；回傳逾時後仍在執行的數量"""
+        self.begin_drain(timeout)
+        with self._condition:
+            while self._active:
+                remaining = self.time_left()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return self._active
+
+inflight_writes = InflightWrites()
+
+def drains_on_shutdown(func):
+    """標記同步 (def) 端點為批量寫入；計數在執行緒內進行，請求被取消時仍會等到實際寫完"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with inflight_writes.track():
+            return func(*args, **kwargs)
+    return wrapper
+
+def install_drain_signal_handlers():
+    """
+    在 uvicorn 的 SIGTERM / SIGINT handler 前先開始 drain (lifespan 啟動時呼叫，uvicorn 已設定好 handler)
+    只能在主執行緒設定 signal handler (TestClient 等情況略過)
+    """
+    if threading.current_thread() is not threading.main_thread():
+        return
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum, frame, previous=previous):
+            inflight_writes.begin_drain(settings.SHUTDOWN_DRAIN_SECONDS)
+            previous(signum, frame)
+
+        signal.signal(sig, handler)
+
+def shutdown_time_left() -> float:
+    """關閉流程剩餘的等待時間 (未經 signal 關閉時從現在起算)"""
+    inflight_writes.begin_drain(settings.SHUTDOWN_DRAIN_SECONDS)
+    return inflight_writes.time_left()
+
+def prepare_worker_connections(redis_client):
+    """worker 啟動：不沿用父行程 (gunicorn --preload 等) 的 DB 連線，並預先建立連線"""
+    engine = get_engine()
+    if not isinstance(engine.pool, StaticPool): # 記憶體 SQLite 只有一條連線，丟棄即遺失資料
+        engine.dispose(close=False)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except Exception as e:
+        logger.warning(f"⚠️ Database not reachable at startup: {e}")
+    try:
+        redis_client.ping()
+    except Exception as e:
+        logger.warning(f"⚠️ Redis not reachable at startup: {e}")
+
+def warm_permission_cache():
+    for role, department in ROLE_PERMISSION_MATRIX:
+        resolve_permissions(role, department, None)
+
+def release_worker_connections():
+    remaining = inflight_writes.drain(settings.SHUTDOWN_DRAIN_SECONDS)
+    if remaining:
+        logger.warning(f"⚠️ Shutting down with {remaining} bulk writes still running")
+    dispose_engine()
+    close_redis_pools()
+    mark_metrics_process_dead(os.getpid())
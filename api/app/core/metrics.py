@@ -0,0 +1,197 @@
+# app/core/metrics.py
+import logging
+import os
+import time
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram, CollectorRegistry, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+from fastapi import Response
+from sqlalchemy import event
+import redis
+from app.database import settings, pool_sizes
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- Prometheus 指標 ---
+"""
+REQUEST_COUNT = Counter(
+    "http_requests_total", "HTTP 請求數", ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP 請求處理時間", ["method", "route"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+DB_STATEMENTS_PER_REQUEST = Histogram(
+    "db_statements_per_request", "每個請求執行的 SQL 語句數", ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250, 500, 1000)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "每個請求的 SQL 累計時間", ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+)
+DB_STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds", "單一 SQL 語句執行時間",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+REDIS_COMMAND_DURATION = Histogram(
+    "redis_command_duration_seconds", "Redis 指令執行時間", ["command"],
+    buckets=(0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5)
+)
+BULK_BATCH_SIZE = Histogram(
+    "basket_bulk_batch_size", "批量操作的籃子數", ["operation"],
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+)
+PASSWORD_HASH_QUEUE_DEPTH = Gauge(
+    "password_hash_queue_depth", "密碼雜湊池中排隊與執行中的工作數",
+    multiprocess_mode="livesum"
+)
+PASSWORD_HASH_DURATION = Histogram(
+    "password_hash_duration_seconds", "密碼雜湊/驗證時間", ["operation"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+LOGIN_RATE_LIMITED = Counter(
+    "login_rate_limited_total", "被頻率限制拒絕的登入", ["scope"]
+)
+
+# 目前請求的 SQL 統計 (由 MetricsMiddleware 設定，SQLAlchemy 事件累加)
+_request_stats: ContextVar = ContextVar("request_stats", default=None)
+
+class RequestStats:
+    __slots__ = ("statements", "db_time")
+
+    def __init__(self):
+        self.statements = 0
+        self.db_time = 0.0
+
+def current_request_stats():
+    return _request_stats.get()
+
+class MetricsMiddleware:
+    """
+    純 ASGI middleware：記錄每個路由的請求數、處理時間與 SQL 語句數/時間。
+    路由標籤使用路徑樣板 (例如 /api/v1/baskets/{rfid})，避免 RFID 造成標籤爆量。
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_stats.reset(token)
+
+            route = route_label(scope)
+            method = scope["method"]
+            REQUEST_COUNT.labels(method, route, str(status_code)).inc()
+            REQUEST_LATENCY.labels(method, route).observe(elapsed)
+            DB_STATEMENTS_PER_REQUEST.labels(route).observe(stats.statements)
+            DB_TIME_PER_REQUEST.labels(route).observe(stats.db_time)
+
+def route_label(scope):
+    """
+    路由的路徑樣板：/api/v1/baskets/E200... -> /api/v1/baskets/{rfid}
+    取比對成功的路由的 path_format；include_router 的子路由 (scope["route"] 只有子路由內的相對路徑)
+    使用 FastAPI 放在 scope["fastapi"] 的完整路由
+    """
+    if "endpoint" not in scope:
+        return "unmatched"
+    if "app_root_path" in scope:
+        # Mount 的子應用 (例如 /static)，以掛載路徑為標籤
+        return scope.get("root_path") or "/"
+    route = scope.get("fastapi", {}).get("effective_route_context") or scope.get("route")
+    return getattr(route, "path_format", None) or "unmatched"
+
+def install_sql_metrics(engine):
+    """在 Engine 上掛 cursor 事件，統計每個 SQL 語句的執行時間"""
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+        DB_STATEMENT_DURATION.observe(elapsed)
+
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.statements += 1
+            stats.db_time += elapsed
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(exception_context):
+        # 語句失敗時不會觸發 after_cursor_execute，這裡把開始時間移除
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
+
+# 同一行程內相同 host/port/db/decode 的 client 共用一個有上限的連線池
+# (redis-py 的連線池在 fork 後會自動丟棄父行程的連線)
+# 每個 worker 的連線上限平均分給各連線池：目前只有 bytes / str 兩種 decode 模式
+REDIS_POOLS_PER_WORKER = 2
+_redis_pools = {}
+
+def shared_redis_pool(host, port, db, decode_responses):
+    key = (host, port, db, decode_responses)
+    pool = _redis_pools.get(key)
+    if pool is None:
+        per_worker = sum(pool_sizes(settings.REDIS_MAX_CONNECTIONS, settings.WEB_CONCURRENCY))
+        max_connections = max(2, per_worker // REDIS_POOLS_PER_WORKER)
+        pool = redis.BlockingConnectionPool(
+            host=host, port=port, db=db, decode_responses=decode_responses,
+            max_connections=max_connections, timeout=5,
+        )
+        _redis_pools[key] = pool
+        if len(_redis_pools) > REDIS_POOLS_PER_WORKER:
+            logger.warning(
+                f"⚠️ {len(_redis_pools)} Redis connection pools exceed REDIS_POOLS_PER_WORKER={REDIS_POOLS_PER_WORKER}; "
+                f"connections may exceed REDIS_MAX_CONNECTIONS"
+            )
+    return pool
+
+def close_redis_pools():
+    for pool in _redis_pools.values():
+        pool.disconnect()
+
+class InstrumentedRedis(redis.Redis):
+    """記錄每個 Redis 指令執行時間的 Redis client (未指定 connection_pool 時使用共用連線池)"""
+    def __init__(self, host="localhost", port=6379, db=0, decode_responses=False, **kwargs):
+        if "connection_pool" not in kwargs:
+            kwargs["connection_pool"] = shared_redis_pool(host, port, db, decode_responses)
+        super().__init__(host=host, port=port, db=db, decode_responses=decode_responses, **kwargs)
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            command = str(args[0]).upper() if args else "UNKNOWN"
+            REDIS_COMMAND_DURATION.labels(command).observe(time.perf_counter() - start)
+
+def metrics_response():
+    # 多 worker (serve.py)：各行程的指標寫在 PROMETHEUS_MULTIPROC_DIR，回應時合併
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return Response(content=generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+def mark_metrics_process_dead(pid: int):
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
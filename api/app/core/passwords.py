@@ -0,0 +1,65 @@
+# app/core/passwords.py
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fastapi import HTTPException, status
+from app.database import settings
+from app.core.metrics import PASSWORD_HASH_QUEUE_DEPTH, PASSWORD_HASH_DURATION
+from app.utils import verify_and_update_password, get_password_hash
+
+"""
+# --- 密碼雜湊專用執行緒池 ---
+bcrypt 每次約 250 ms CPU (C 實作會釋放 GIL)，放在專用池中執行，
+不佔用 FastAPI 的 threadpool，登入尖峰時掃描 API 仍有執行緒可用。
+排隊 + 執行中的工作超過 PASSWORD_HASH_MAX_QUEUE 時直接回 503，避免請求無限堆積。
+"""
+_executor = ThreadPoolExecutor(
+    max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash"
+)
+_depth = 0
+_depth_lock = threading.Lock()
+
+def _release(_future):
+    global _depth
+    with _depth_lock:
+        _depth -= 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(_depth)
+
+def submit_password_job(operation: str, fn, *args):
+    global _depth
+    with _depth_lock:
+        if _depth >= settings.PASSWORD_HASH_MAX_QUEUE:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent sign-ins, please retry",
+                headers={"Retry-After": "1"},
+            )
+        _depth += 1
+        PASSWORD_HASH_QUEUE_DEPTH.set(_depth)
+
+    def job():
+        start = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            PASSWORD_HASH_DURATION.labels(operation).observe(time.perf_counter() - start)
+
+    future = _executor.submit(job)
+    future.add_done_callback(_release)
+    return future
+
+async def verify_password_async(plain_password, hashed_password):
+    """回傳 (是否正確, 新 hash 或 None)"""
+    if not hashed_password:
+        return False, None
+    future = submit_password_job("verify", verify_and_update_password, plain_password, hashed_password)
+    return await asyncio.wrap_future(future)
+
+async def hash_password_async(plain_password):
+    future = submit_password_job("hash", get_password_hash, plain_password)
+    return await asyncio.wrap_future(future)
+
+def hash_password(plain_password):
+    """同步版本 (供同步 endpoint 使用)，一樣受池大小與排隊上限控制"""
+    return submit_password_job("hash", get_password_hash, plain_password).result()
@@ -1,5 +1,7 @@
 # app/core/permissions.py
+import json
 from enum import Enum
+from functools import lru_cache
 
 class Perms(str, Enum):
     # 系統級
@@ -41,11 +43,61 @@ DEFAULT_ROLE_PERMISSIONS = {
             Perms.USER_READ,
             Perms.USER_CREATE_DEPT,
             Perms.RECEIVING_OP,
+            Perms.SHIPPING_OP,
             Perms.BASKET_READ
         ]
     },
     "Operator": {
         "Production": [Perms.PRODUCTION_OP],
-        "Warehouse": [Perms.RECEIVING_OP]
+        "Warehouse": [Perms.RECEIVING_OP, Perms.SHIPPING_OP]
     }
 }
+
+"""
+# --- 權限解析 (預先編譯 + 快取) ---
+- 角色 × 部門的預設權限在載入時編譯成 frozenset
+- 使用者的最終權限依 (role, department, permissions JSON) 快取；permissions 欄位內容即版本，
+  修改額外權限後 key 不同，自然使用新的結果
+- 支援階層萬用字元：production:* 涵蓋 production:read、production:create...，* 涵蓋全部
+"""
+WILDCARD = "*"
+
+def _perm_value(perm) -> str:
+    return perm.value if isinstance(perm, Perms) else str(perm)
+
+ROLE_PERMISSION_MATRIX = {
+    (role, department): frozenset(_perm_value(p) for p in perms)
+    for role, departments in DEFAULT_ROLE_PERMISSIONS.items()
+    for department, perms in departments.items()
+}
+
+@lru_cache(maxsize=1024)
+def permission_candidates(required: str) -> tuple:
+    """user:create:dept -> (user:create:dept, user:create:*, user:*, *)"""
+    parts = required.split(":")
+    wildcards = tuple(":".join(parts[:i]) + ":" + WILDCARD for i in range(len(parts) - 1, 0, -1))
+    return (required,) + wildcards + (WILDCARD,)
+
+class PermissionSet(frozenset):
+    """已解析的權限集合；`perm in perms` 會一併比對萬用字元 (最多數次 set 查詢)"""
+    def __contains__(self, perm):
+        lookup = super().__contains__
+        return any(lookup(candidate) for candidate in permission_candidates(_perm_value(perm)))
+
+@lru_cache(maxsize=4096)
+def resolve_permissions(role, department, permissions) -> PermissionSet:
+    role_perms = ROLE_PERMISSION_MATRIX.get((role, department), frozenset())
+
+    extra_perms = []
+    if permissions:
+        try:
+            extra_perms = json.loads(permissions)
+        except ValueError:
+            extra_perms = []
+        if not isinstance(extra_perms, list):
+            extra_perms = []
+
+    return PermissionSet(role_perms.union(_perm_value(p) for p in extra_perms))
+
+def has_permission(perms, required) -> bool:
+    return required in perms
@@ -0,0 +1,218 @@
+# app/core/profiling.py
+import cProfile
+import functools
+import inspect
+import io
+import json
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+import uuid
+from contextvars import ContextVar
+from datetime import datetime
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from app.database import settings
+from app.core.metrics import route_label
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 請求取樣 Profiling (預設關閉) ---
+PROFILING_ENABLED=false 時不掛 middleware、路由也不包裝，沒有額外負擔。
+啟用後符合以下任一條件的請求會以 cProfile 記錄呼叫堆疊：
+- 帶有 X-Profile header (若設定 PROFILING_TOKEN，header 值必須相同)
+- 路徑符合 PROFILING_ROUTES 中的任一前綴
+- 依 PROFILING_SAMPLE_RATE 隨機取樣
+結果存成 .prof (可用 snakeviz 開啟成 icicle/flame graph) 與 .json 索引，
+由 /api/v1/profiles 查詢下載 (IT Admin)。
+
+限制：同步 endpoint 在 threadpool 執行緒中各自記錄，只包含該請求；
+event loop 端 (驗證、序列化) 的 cProfile 一次只記錄一個請求，但期間 event loop 上其他請求的工作也會被記錄，
+.json 的 overlapping 為期間同時進行的其他請求數 (0 表示結果只屬於這個請求)。
+"""
+_current_session: ContextVar = ContextVar("profile_session", default=None)
+
+# 同一執行緒同時只能有一個 cProfile 啟用，event loop 端一次只記錄一個請求
+_loop_profile_lock = threading.Lock()
+_loop_session = None   # 目前在 event loop 端記錄中的 session
+_active_requests = 0   # 進行中的請求數 (只在 event loop 上修改)
+
+class ProfileSession:
+    def __init__(self, reason: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.reason = reason
+        self.profiles = []
+        self.lock = threading.Lock()
+        self.overlapping = 0
+
+    def add(self, profile: cProfile.Profile):
+        with self.lock:
+            self.profiles.append(profile)
+
+def profile_reason(scope):
+    headers = dict(scope.get("headers") or [])
+    header_value = headers.get(b"x-profile")
+    if header_value is not None:
+        if not settings.PROFILING_TOKEN or header_value.decode() == settings.PROFILING_TOKEN:
+            return "header"
+    path = scope["path"]
+    if any(path.startswith(prefix) for prefix in settings.PROFILING_ROUTES):
+        return "route"
+    if settings.PROFILING_SAMPLE_RATE > 0 and random.random() < settings.PROFILING_SAMPLE_RATE:
+        return "sample"
+    return None
+
+class ProfilingMiddleware:
+    """決定是否 profile 這個請求；event loop 端 (驗證、序列化) 也一併記錄"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _active_requests
+        if _loop_session is not None:
+            _loop_session.overlapping += 1
+        _active_requests += 1
+        try:
+            await self.handle(scope, receive, send)
+        finally:
+            _active_requests -= 1
+
+    async def handle(self, scope, receive, send):
+        global _loop_session
+        reason = profile_reason(scope)
+        if reason is None:
+            await self.app(scope, receive, send)
+            return
+
+        session = ProfileSession(reason)
+        token = _current_session.set(session)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        loop_profile = None
+        if _loop_profile_lock.acquire(blocking=False):
+            session.overlapping = _active_requests - 1
+            _loop_session = session
+            loop_profile = cProfile.Profile()
+            loop_profile.enable()
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            if loop_profile is not None:
+                loop_profile.disable()
+                _loop_session = None
+                _loop_profile_lock.release()
+                session.add(loop_profile)
+            _current_session.reset(token)
+
+            # 寫檔與清理舊檔為阻塞 I/O，交給 threadpool
+            try:
+                await run_in_threadpool(save_profile, session, scope, status_code, elapsed)
+            except Exception as e:
+                logger.warning(f"⚠️ Profile save failed: {e}")
+
+def profiled_endpoint(endpoint):
+    """包裝同步 endpoint：被取樣的請求在 threadpool 執行緒中以 cProfile 記錄"""
+    if inspect.iscoroutinefunction(endpoint):
+        return endpoint
+
+    @functools.wraps(endpoint)
+    def wrapper(*args, **kwargs):
+        session = _current_session.get()
+        if session is None:
+            return endpoint(*args, **kwargs)
+
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            profile.disable()
+            session.add(profile)
+
+    return wrapper
+
+class ProfiledRoute(APIRoute):
+    """APIRouter(route_class=ProfiledRoute)：啟用 profiling 時包裝同步 endpoint"""
+    def __init__(self, path, endpoint, **kwargs):
+        if settings.PROFILING_ENABLED:
+            endpoint = profiled_endpoint(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+"""
+# --- 儲存與查詢 ---
+"""
+def save_profile(session: ProfileSession, scope, status_code: int, elapsed: float):
+    if not session.profiles:
+        return
+
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    stats = pstats.Stats(session.profiles[0])
+    for profile in session.profiles[1:]:
+        stats.add(profile)
+    stats.dump_stats(profile_path(session.id, "prof"))
+
+    meta = {
+        "id": session.id,
+        "method": scope["method"],
+        "path": scope["path"],
+        "route": route_label(scope),
+        "status": status_code,
+        "duration_ms": round(elapsed * 1000, 2),
+        "reason": session.reason,
+        "overlapping": session.overlapping,
+        "created_at": datetime.now().isoformat(),
+    }
+    with open(profile_path(session.id, "json"), "w") as f:
+        json.dump(meta, f)
+
+    prune_profiles()
+
+def profile_path(profile_id: str, ext: str):
+    return os.path.join(settings.PROFILING_DIR, f"{profile_id}.{ext}")
+
+def list_profiles():
+    if not os.path.isdir(settings.PROFILING_DIR):
+        return []
+    items = []
+    for name in os.listdir(settings.PROFILING_DIR):
+        if not name.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(settings.PROFILING_DIR, name)) as f:
+                items.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    items.sort(key=lambda item: item["created_at"], reverse=True)
+    return items
+
+def prune_profiles():
+    items = list_profiles()
+    for item in items[settings.PROFILING_MAX_FILES:]:
+        for ext in ("json", "prof"):
+            try:
+                os.remove(profile_path(item["id"], ext))
+            except OSError:
+                pass
+
+def profile_summary(profile_id: str, sort: str = "cumulative", limit: int = 40) -> str:
+    out = io.StringIO()
+    stats = pstats.Stats(profile_path(profile_id, "prof"), stream=out)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return out.getvalue()
@@ -0,0 +1,36 @@
+# app/core/projection.py
+from fastapi import HTTPException
+from app.models import Basket
+from app.schemas import BasketResponse, BasketBriefResponse
+
+# fields= 可直接指定的預設組合 (對應較小的回應 Schema)
+BASKET_FIELD_PRESETS = {
+    "full": list(BasketResponse.model_fields),
+    "brief": list(BasketBriefResponse.model_fields),
+}
+
+# 自訂欄位清單時可選的欄位 (Baskets 表的所有欄位)，bid/rfid 一定回傳
+BASKET_ALLOWED_FIELDS = set(Basket.__table__.columns.keys())
+BASKET_KEY_FIELDS = ["bid", "rfid"]
+
+def parse_fields(fields, presets, allowed, key_fields, default="full"):
+    """
+    解析 fields 查詢參數：
+    - 空值             -> presets[default]
+    - 預設組合名稱      -> presets[name]  (例如 fields=brief)
+    - 逗號分隔欄位清單  -> key_fields + 指定欄位 (例如 fields=status,quantity)
+    """
+    if not fields:
+        return presets[default]
+    if fields in presets:
+        return presets[fields]
+
+    requested = [f.strip() for f in fields.split(",") if f.strip()]
+    invalid = [f for f in requested if f not in allowed]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(invalid)}")
+
+    return list(dict.fromkeys(key_fields + requested))
+
+def parse_basket_fields(fields):
+    return parse_fields(fields, BASKET_FIELD_PRESETS, BASKET_ALLOWED_FIELDS, BASKET_KEY_FIELDS)
@@ -0,0 +1,138 @@
+# app/core/query_budget.py
+import logging
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import event
+from app.core.metrics import route_label
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- SQL 查詢預算 / N+1 偵測 (開發、測試用) ---
+"""
+_STRING_LITERAL = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_NAMED_PARAM = re.compile(r"%\(\w+\)s|:\w+")
+_PARAM_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_sql(statement: str) -> str:
+    """
+    將 SQL 正規化成「語句形狀」：常數與參數換成 ?，IN (?, ?, ?) 收合成 IN (?...)，
+    同一段程式在迴圈中重複執行的查詢會得到相同的形狀。
+    """
+    sql = _STRING_LITERAL.sub("?", statement)
+    sql = _NAMED_PARAM.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _PARAM_LIST.sub("?...", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+class QueryRecorder:
+    """收集執行過的 SQL (正規化後)，並檢查是否超過預算"""
+    def __init__(self):
+        self.statements = []
+
+    def record(self, statement: str):
+        self.statements.append(normalize_sql(statement))
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    @property
+    def shapes(self):
+        return Counter(self.statements)
+
+    def violations(self, max_queries=None, max_repeats=None):
+        problems = []
+        if max_queries is not None and self.count > max_queries:
+            problems.append(f"{self.count} statements (budget {max_queries})")
+        if max_repeats is not None:
+            for shape, times in self.shapes.most_common():
+                if times <= max_repeats:
+                    break
+                problems.append(f"{times}x (max {max_repeats}) possible N+1: {shape[:200]}")
+        return problems
+
+    def assert_budget(self, max_queries=None, max_repeats=None):
+        problems = self.violations(max_queries, max_repeats)
+        if problems:
+            raise QueryBudgetExceeded("Query budget exceeded:\n  " + "\n  ".join(problems))
+
+    def report(self, top: int = 5) -> str:
+        lines = [f"{self.count} statements, {len(self.shapes)} distinct shapes"]
+        for shape, times in self.shapes.most_common(top):
+            lines.append(f"  {times:>4}x {shape[:200]}")
+        return "\n".join(lines)
+
+@contextmanager
+def record_queries(engine):
+    """
+    記錄區塊內在 engine 上執行的所有 SQL (不分執行緒，適合搭配 TestClient)：
+        with record_queries(engine) as recorder:
+            client.put("/api/v1/baskets/bulk-update", json=...)
+        recorder.assert_budget(max_queries=10, max_repeats=2)
+    """
+    recorder = QueryRecorder()
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        recorder.record(statement)
+
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    try:
+        yield recorder
+    finally:
+        event.remove(engine, "after_cursor_execute", after_cursor_execute)
+
+# 目前請求的 QueryRecorder (由 QueryBudgetMiddleware 設定)
+_request_recorder: ContextVar = ContextVar("query_budget_recorder", default=None)
+
+def install_query_budget(engine):
+    """在 Engine 上掛事件，把 SQL 記到目前請求的 QueryRecorder"""
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        recorder = _request_recorder.get()
+        if recorder is not None:
+            recorder.record(statement)
+
+class QueryBudgetMiddleware:
+    """
+    每個請求檢查 SQL 語句數與重複形狀 (N+1)：
+    - mode="warn"  : 超過預算時寫 warning log
+    - mode="raise" : 超過預算時拋出 QueryBudgetExceeded (測試環境使用，TestClient 會讓測試失敗)
+    route_budgets 可針對個別路由樣板指定語句數上限，例如 {"/api/v1/baskets/bulk-update": 10}
+    """
+    def __init__(self, app, max_queries=30, max_repeats=10, mode="warn", route_budgets=None):
+        self.app = app
+        self.max_queries = max_queries
+        self.max_repeats = max_repeats
+        self.mode = mode
+        self.route_budgets = route_budgets or {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recorder = QueryRecorder()
+        token = _request_recorder.set(recorder)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_recorder.reset(token)
+
+        route = route_label(scope)
+        max_queries = self.route_budgets.get(route, self.max_queries)
+        problems = recorder.violations(max_queries, self.max_repeats)
+        if not problems:
+            return
+
+        message = f"Query budget exceeded on {scope['method']} {route}:\n  " + "\n  ".join(problems)
+        if self.mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(f"⚠️ {message}")
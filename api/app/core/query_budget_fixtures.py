@@ -0,0 +1,31 @@
+# app/core/query_budget_fixtures.py
+"""
+pytest 外掛：在 conftest.py 加入
+    pytest_plugins = ["app.core.query_budget_fixtures"]
+
+用法 1 - 手動檢查:
+    def test_lookup(client, query_budget):
+        client.post("/api/v1/baskets/lookup", json={"rfids": rfids})
+        query_budget.assert_budget(max_queries=3, max_repeats=1)
+
+用法 2 - 以 marker 宣告，測試結束時自動檢查:
+    @pytest.mark.query_budget(max_queries=10, max_repeats=2)
+    def test_bulk_update(client, query_budget):
+        client.put("/api/v1/baskets/bulk-update", json=payload)
+"""
+import pytest
+from app.database import engine
+from app.core.query_budget import record_queries
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        "markers", "query_budget(max_queries=None, max_repeats=None): SQL 語句數/重複形狀上限"
+    )
+
+@pytest.fixture
+def query_budget(request):
+    marker = request.node.get_closest_marker("query_budget")
+    with record_queries(engine) as recorder:
+        yield recorder
+    if marker:
+        recorder.assert_budget(**marker.kwargs)
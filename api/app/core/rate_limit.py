@@ -0,0 +1,28 @@
+# app/core/rate_limit.py
+import logging
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- Redis 固定時間窗頻率限制 ---
+"""
+def hit_rate_limit(client, key: str, limit: int, window: int):
+    """
+    記錄一次嘗試；超過 limit 時回傳需等待的秒數 (Retry-After)，否則回傳 None。
+    limit <= 0 表示不限制；Redis 無法連線時放行 (不影響登入)。
+    """
+    if limit <= 0:
+        return None
+    try:
+        pipe = client.pipeline()
+        pipe.set(key, 0, ex=window, nx=True)
+        pipe.incr(key)
+        pipe.ttl(key)
+        _, count, ttl = pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Rate limit check failed: {e}")
+        return None
+
+    if count > limit:
+        return max(int(ttl), 1)
+    return None
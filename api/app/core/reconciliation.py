@@ -0,0 +1,180 @@
+# app/core/reconciliation.py
+import logging
+from datetime import datetime
+from sqlalchemy import select, func, update
+from app.models import Batch, Basket, BasketMovement
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 批次庫存對帳 ---
+Batches.producedQuantity / remainingQuantity 只在 Production 模式累加，Clear、出貨、修改數量都不會扣回，
+因此以籃子資料重新計算 (皆為 SQL 分組彙總)：
+- 生產量 = 籃子流向 (BasketMovements，含遷移前歷史的 backfill) 的 producedDelta 加總：
+  寫入流向時即標記每一次生產 (+數量) 與生產中的數量修改 (差額)，離開舊批次為 Leave 事件 (0)
+- 在庫量 = 目前仍屬於該批次、且不在 NON_STOCK_STATUSES 的籃子數量加總
+  (Baskets.batchCode 由寫入路徑維護，既有資料由 init_db_schema 回填)
+沒有任何流向紀錄的批次 (歷史不完整) 不列入對帳，避免把正確的數量改成 0；差異以一次 bulk UPDATE 寫回。
+
+增量模式：寫入路徑把受影響的 batchCode 放進 reconcile:dirty_batches，對帳時只處理這些批次；
+full 模式 (夜間排程) 處理全部批次。
+"""
+DIRTY_KEY = "reconcile:dirty_batches"
+LAST_RUN_KEY = "reconcile:last_run"
+NON_STOCK_STATUSES = ("UNASSIGNED", "SHIPPED")
+QUERY_CHUNK = 1000  # SQL Server 單一語句最多 2100 個參數
+
+def mark_batches_dirty(client, batch_codes):
+    """記錄需要重新對帳的批次 (commit 後呼叫；Redis 失敗不影響寫入，夜間 full 對帳會補上)"""
+    codes = {code for code in batch_codes if code}
+    if not codes:
+        return
+    try:
+        client.sadd(DIRTY_KEY, *codes)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to mark batches for reconciliation: {e}")
+
+def take_dirty_batches(client):
+    """取出並清空待對帳批次；之後新標記的批次留給下一次"""
+    pipe = client.pipeline()
+    pipe.smembers(DIRTY_KEY)
+    pipe.delete(DIRTY_KEY)
+    members, _ = pipe.execute()
+    return sorted(m.decode() if isinstance(m, bytes) else m for m in members)
+
+def chunked(items, size=QUERY_CHUNK):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def produced_quantities(db, codes=None):
+    """依流向計算生產量；回傳 {batchCode: produced}，只包含有流向紀錄的批次"""
+    produced = func.coalesce(func.sum(BasketMovement.producedDelta), 0)
+    statement = select(BasketMovement.batchCode, produced)
+    if codes is not None:
+        statement = statement.where(BasketMovement.batchCode.in_(codes))
+    return {code: int(total) for code, total in db.execute(statement.group_by(BasketMovement.batchCode))}
+
+def remaining_quantities(db, codes=None):
+    """目前仍在庫的籃子數量"""
+    quantity = func.coalesce(func.sum(Basket.quantity), 0)
+    statement = select(Basket.batchCode, quantity).where(
+        Basket.status.notin_(NON_STOCK_STATUSES), Basket.batchCode.isnot(None)
+    )
+    if codes is not None:
+        statement = statement.where(Basket.batchCode.in_(codes))
+    return {code: int(total) for code, total in db.execute(statement.group_by(Basket.batchCode))}
+
+def expected_batch_quantities(db, batch_codes=None):
+    """
+    依籃子流向與目前資料計算各批次應有的 (producedQuantity, remainingQuantity)
+    只回傳有流向紀錄的批次；沒有紀錄的批次無法判斷，由呼叫端略過
+    """
+    def totals(codes):
+        produced = produced_quantities(db, codes)
+        remaining = remaining_quantities(db, codes)
+        return {code: (produced[code], remaining.get(code, 0)) for code in produced}
+
+    if batch_codes is None:
+        return totals(None)
+
+    expected = {}
+    for codes in chunked(list(batch_codes)):
+        expected.update(totals(codes))
+    return expected
+
+def batch_drift(db, batch_codes=None):
+    """目前 Batches 與重新計算結果不一致的批次"""
+    columns = (Batch.bid, Batch.batch_code, Batch.producedQuantity, Batch.remainingQuantity)
+    if batch_codes is None:
+        batches = db.execute(select(*columns)).all()
+    else:
+        batches = []
+        for codes in chunked(list(batch_codes)):
+            batches.extend(db.execute(select(*columns).where(Batch.batch_code.in_(codes))).all())
+
+    expected = expected_batch_quantities(db, batch_codes)
+
+    drift = []
+    checked = 0
+    for bid, batch_code, produced, remaining in batches:
+        if batch_code not in expected:
+            continue
+        checked += 1
+        expected_produced, expected_remaining = expected[batch_code]
+        if (produced or 0) != expected_produced or (remaining or 0) != expected_remaining:
+            drift.append({
+                "bid": bid,
+                "batch_code": batch_code,
+                "producedQuantity": produced or 0,
+                "expectedProduced": expected_produced,
+                "remainingQuantity": remaining or 0,
+                "expectedRemaining": expected_remaining,
+            })
+
+    if checked < len(batches):
+        logger.info(f"🧮 Skipped {len(batches) - checked} batches without basket movements")
+    return checked, drift
+
+def reconcile_batches(db, batch_codes=None):
+    """重新計算並寫回有差異的批次 (會 commit)；batch_codes 為 None 時處理全部批次"""
+    checked, drift = batch_drift(db, batch_codes)
+    if drift:
+        db.execute(update(Batch), [
+            {
+                "bid": item["bid"],
+                "producedQuantity": item["expectedProduced"],
+                "remainingQuantity": item["expectedRemaining"],
+            }
+            for item in drift
+        ])
+    db.commit()
+    return {"checked": checked, "updated": len(drift), "drift": drift}
+
+def run_reconciliation(db, client, full: bool = False):
+    """對帳一次並記錄結果；增量模式失敗時把取出的批次放回，下次重試"""
+    started = datetime.now()
+    batch_codes = None
+    if not full:
+        batch_codes = take_dirty_batches(client)
+        if not batch_codes:
+            return {"mode": "incremental", "checked": 0, "updated": 0, "drift": []}
+
+    try:
+        summary = reconcile_batches(db, batch_codes)
+    except Exception:
+        db.rollback()
+        if batch_codes:
+            mark_batches_dirty(client, batch_codes)
+        raise
+
+    summary["mode"] = "full" if full else "incremental"
+    try:
+        client.hset(LAST_RUN_KEY, mapping={
+            "mode": summary["mode"],
+            "startedAt": started.isoformat(),
+            "finishedAt": datetime.now().isoformat(),
+            "checked": summary["checked"],
+            "updated": summary["updated"],
+        })
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to record reconciliation run: {e}")
+
+    logger.info(f"🧮 Batch reconciliation ({summary['mode']}): {summary['updated']}/{summary['checked']} batches corrected")
+    return summary
+
+def last_reconciliation(client):
+    try:
+        run = client.hgetall(LAST_RUN_KEY)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to read last reconciliation run: {e}")
+        return None
+    if not run:
+        return None
+    run = {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v) for k, v in run.items()}
+    return {
+        "mode": run.get("mode"),
+        "startedAt": run.get("startedAt"),
+        "finishedAt": run.get("finishedAt"),
+        "checked": int(run.get("checked") or 0),
+        "updated": int(run.get("updated") or 0),
+    }
@@ -1,17 +1,55 @@
 # app/core/security.py
 from fastapi import Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy.orm import Session
+from jose import JWTError, jwt
+from app.database import get_db, settings
 from app.models import User
-from app.v1.endpoints.auth import get_current_user
-from app.core.permissions import Perms
+from app.core.metrics import InstrumentedRedis
+from app.core.sessions import is_access_token_revoked
+
+# 驗證相依只依賴 core 模組：各 endpoint 不必載入 auth 路由 (密碼雜湊、登入頻率限制...)
+r = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+
+# 驗證目前使用者的 Dependency (供其他 API 使用)
+def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        username: str = payload.get("sub")
+        if username is None or payload.get("type") == "refresh":
+            raise credentials_exception
+    except JWTError:
+        raise credentials_exception
+
+    # --- 檢查撤銷 ---
+    # revoked:{jti} (已登出) 或 session 已失效 (登出、同裝置重新登入、refresh token 外洩)
+    if is_access_token_revoked(r, payload, token):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked (logged out)",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    # ----------------
+        
+    user = db.query(User).filter(User.username == username).first()
+    if user is None:
+        raise credentials_exception
+    return user
 
 # Dependency Factory
 def require_permission(required_perm: str):
     def permission_checker(current_user: User = Depends(get_current_user)):
 
+        # 已編譯的權限集合：O(1) 比對，* 與 production:* 等萬用字元自動涵蓋
         user_perms = current_user.get_all_permissions()
-        
-        if Perms.SUPER_ADMIN in user_perms:
-            return current_user
             
         if required_perm not in user_perms:
             raise HTTPException(
@@ -0,0 +1,160 @@
+# app/core/sessions.py
+import time
+import uuid
+from datetime import datetime
+import redis
+from fastapi import HTTPException, status
+from jose import JWTError, jwt
+from app.database import settings
+from app.utils import create_access_token, create_refresh_token
+
+"""
+# --- 登入 Session 與 Refresh Token ---
+每次登入建立一個 session (Redis hash: session:{sid})，access / refresh token 都帶 sid。
+- Access token : 短效 JWT，帶 jti；登出時寫入 revoked:{jti} (固定長度 key，TTL = 剩餘效期)
+- Refresh token: 長效 JWT (type=refresh)，每次使用都換發新的 (rotation)；
+                 session 只認最新的 refresh_jti，舊的被重用時視為外洩，整個 session 失效
+- 綁定裝置     : device_session:{device_id} 指向目前 session，同一台裝置重新登入時舊 session 失效
+session 每次 refresh 延長效期 (sliding session)，刪除 session 即撤銷其所有 token。
+"""
+def session_key(sid: str):
+    return f"session:{sid}"
+
+def device_session_key(device_id: str):
+    return f"device_session:{device_id}"
+
+def refresh_ttl_seconds():
+    return settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 3600
+
+def unauthorized(detail: str):
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+def start_session(client, username: str, device_id: str | None, client_ip: str | None):
+    sid = uuid.uuid4().hex
+    refresh_jti = uuid.uuid4().hex
+    key = session_key(sid)
+
+    pipe = client.pipeline()
+    pipe.hset(key, mapping={
+        "username": username,
+        "device_id": device_id or "",
+        "refresh_jti": refresh_jti,
+        "ip": client_ip or "",
+        "created_at": datetime.now().isoformat(),
+    })
+    pipe.expire(key, refresh_ttl_seconds())
+    if device_id:
+        pipe.getset(device_session_key(device_id), sid)
+        pipe.expire(device_session_key(device_id), refresh_ttl_seconds())
+    results = pipe.execute()
+
+    # 同一台裝置上前一位使用者的 session 失效
+    previous_sid = results[2] if device_id else None
+    if previous_sid and previous_sid != sid:
+        client.delete(session_key(previous_sid))
+
+    return sid, refresh_jti
+
+def issue_tokens(username: str, role: str, department: str, sid: str, refresh_jti: str):
+    access_token = create_access_token(data={
+        "sub": username,
+        "role": role,
+        "dept": department,
+        "sid": sid,
+    })
+    refresh_token = create_refresh_token(username, sid, refresh_jti)
+    return {
+        "access_token": access_token,
+        "refresh_token": refresh_token,
+        "expires_in": settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def rotate_refresh_token(client, refresh_token: str, device_id: str | None):
+    """驗證 refresh token 並換發新的 refresh_jti；回傳 (username, sid, new_refresh_jti)"""
+    try:
+        payload = jwt.decode(refresh_token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+    except JWTError:
+        raise unauthorized("Invalid refresh token")
+
+    if payload.get("type") != "refresh" or not payload.get("sid") or not payload.get("jti"):
+        raise unauthorized("Invalid refresh token")
+
+    sid = payload["sid"]
+    key = session_key(sid)
+    new_jti = uuid.uuid4().hex
+    outcome = {}
+
+    def rotate(pipe):
+        session = pipe.hgetall(key)
+        if not session:
+            outcome["error"] = "Session expired or revoked"
+            return
+        if session["refresh_jti"] != payload["jti"]:
+            # 已被換發過的 refresh token 再次出現：可能外洩，撤銷整個 session
+            outcome["error"] = "Refresh token reuse detected"
+            outcome["revoke"] = True
+            return
+        if session["device_id"] and device_id != session["device_id"]:
+            outcome["error"] = "Refresh token is bound to another device"
+            return
+
+        outcome["username"] = session["username"]
+        pipe.multi()
+        pipe.hset(key, "refresh_jti", new_jti)
+        pipe.expire(key, refresh_ttl_seconds())
+        if session["device_id"]:
+            pipe.expire(device_session_key(session["device_id"]), refresh_ttl_seconds())
+
+    try:
+        client.transaction(rotate, key)
+    except redis.WatchError:
+        # 同一個 refresh token 同時被使用，只有一個請求會成功
+        raise unauthorized("Refresh token already used")
+
+    if "error" in outcome:
+        if outcome.get("revoke"):
+            revoke_session(client, sid)
+        raise unauthorized(outcome["error"])
+
+    if outcome["username"] != payload.get("sub"):
+        raise unauthorized("Invalid refresh token")
+
+    return outcome["username"], sid, new_jti
+
+def revoke_session(client, sid: str):
+    key = session_key(sid)
+    device_id = client.hget(key, "device_id")
+    client.delete(key)
+    # 只在裝置目前仍指向這個 session 時清除
+    if device_id and client.get(device_session_key(device_id)) == sid:
+        client.delete(device_session_key(device_id))
+
+def revoke_access_token(client, payload: dict):
+    jti = payload.get("jti")
+    exp_timestamp = payload.get("exp")
+    if not jti or not exp_timestamp:
+        return
+    ttl = int(exp_timestamp - time.time())
+    if ttl > 0:
+        client.setex(f"revoked:{jti}", ttl, 1)
+
+def is_access_token_revoked(client, payload: dict, token: str) -> bool:
+    jti = payload.get("jti")
+    sid = payload.get("sid")
+    if not jti:
+        # 舊版 token (沒有 jti) 仍使用完整 token 黑名單
+        return bool(client.exists(f"blacklist:{token}"))
+
+    pipe = client.pipeline()
+    pipe.exists(f"revoked:{jti}")
+    if sid:
+        pipe.exists(session_key(sid))
+    results = pipe.execute()
+
+    if results[0]:
+        return True
+    return bool(sid) and not results[1]
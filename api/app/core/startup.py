@@ -0,0 +1,57 @@
+# app/core/startup.py
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger("uvicorn")
+
+"""
+# --- 啟動時間量測 ---
+main.py 最先載入此模組 (只依賴標準函式庫)，記錄：
+- import：各階段與各 endpoint 模組第一次載入的時間 (含該模組第一次帶入的相依套件)
+- lifespan：engine 建立、背景預熱 (連線、快取) 等初始化步驟
+時間以此模組載入的時間為 0 (不含直譯器本身的啟動)；GET /startup 回傳報告，
+script/bench_startup.py 以此量測 time-to-first-request。
+"""
+STARTED = time.perf_counter()
+
+_steps = []
+_ready_at = None
+_local = threading.local()
+
+@contextmanager
+def startup_step(name: str, background: bool = False):
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _local.depth = depth
+        _steps.append({
+            "step": name,
+            "depth": depth,
+            "startedAt": round(started - STARTED, 4),
+            "seconds": round(time.perf_counter() - started, 4),
+            "background": background,
+        })
+
+def mark_ready():
+    """lifespan 啟動完成 (開始接受請求) 時呼叫"""
+    global _ready_at
+    _ready_at = time.perf_counter()
+    logger.info(f"⏱️ Ready in {_ready_at - STARTED:.3f}s\n{format_report()}")
+
+def startup_report():
+    return {
+        "readySeconds": round(_ready_at - STARTED, 4) if _ready_at else None,
+        "steps": sorted(_steps, key=lambda s: (s["startedAt"], s["depth"])),
+    }
+
+def format_report():
+    lines = []
+    for step in startup_report()["steps"]:
+        suffix = " (background)" if step["background"] else ""
+        lines.append(f"{step['seconds'] * 1000:9.1f} ms  {'  ' * step['depth']}{step['step']}{suffix}")
+    return "\n".join(lines)
@@ -1,7 +1,9 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 from pydantic_settings import BaseSettings
+import threading
 import urllib.parse
 
 class Settings(BaseSettings):
@@ -9,18 +11,140 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    GZIP_MIN_SIZE: int = 1024
+
+    # 部署：API worker 數 (serve.py 會設定)，DB / Redis 連線總數依 worker 數平均分配
+    WEB_CONCURRENCY: int = 1
+    DB_MAX_CONNECTIONS: int = 60
+    REDIS_MAX_CONNECTIONS: int = 200
+    SHUTDOWN_DRAIN_SECONDS: int = 30   # 關閉時等待進行中的請求 / 批量寫入的秒數
+    CACHE_WARM_BASKETS: int = 5000     # 啟動時預熱的最近異動籃子數 (0 表示不預熱)
+
+    # 密碼雜湊：bcrypt 成本 (變更後使用者下次登入時自動重新雜湊)、專用執行緒池大小與排隊上限
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 4
+    PASSWORD_HASH_MAX_QUEUE: int = 64
+
+    # 登入頻率限制 (每個時間窗的嘗試次數，0 表示不限制)
+    LOGIN_RATE_LIMIT_USER: int = 10
+    LOGIN_RATE_LIMIT_IP: int = 120
+    LOGIN_RATE_WINDOW: int = 60
+
+    # 背景工作 (Redis 佇列 + worker.py)
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_BASE_DELAY: int = 5      # 秒，第 n 次重試等待 base * 2^(n-1)
+    JOB_STALE_SECONDS: int = 1800      # worker 中斷後多久視為失聯並重新排入
+    JOB_TTL_DAYS: int = 7
+    JOB_CHUNK_SIZE: int = 500
+
+    # 到期提醒：提前天數與 worker 排程掃描間隔 (秒)
+    EXPIRY_ALERT_DAYS: int = 3
+    EXPIRY_SCAN_INTERVAL: int = 3600
+
+    # 分析彙總：流量增量彙總 / 在庫快照的排程間隔 (秒)，班別起始小時
+    ANALYTICS_ROLLUP_INTERVAL: int = 300
+    ANALYTICS_SNAPSHOT_INTERVAL: int = 900
+    ANALYTICS_ROLLUP_CHUNK: int = 20000
+    SHIFT_START_HOURS: list[int] = [6, 14, 22]
+    DWELL_INTERVAL: int = 900
+
+    # 產品圖片：上傳大小 / 像素上限，WebP 大圖與縮圖的最長邊 (變更尺寸後需重新產生既有圖片，檔名不變)
+    IMAGE_MAX_UPLOAD_BYTES: int = 10 * 1024 * 1024
+    IMAGE_MAX_PIXELS: int = 40_000_000
+    IMAGE_LARGE_SIZE: int = 1600
+    IMAGE_THUMB_SIZE: int = 256
+    IMAGE_WEBP_QUALITY: int = 80
+
+    # SQL 查詢預算 (off / warn / raise)，開發與測試環境使用
+    QUERY_BUDGET_MODE: str = "off"
+    QUERY_BUDGET_MAX: int = 30
+    QUERY_BUDGET_MAX_REPEATS: int = 10
+    QUERY_BUDGET_ROUTES: dict[str, int] = {}
+
+    # 請求 Profiling (預設關閉)：X-Profile header、路徑前綴或隨機取樣
+    PROFILING_ENABLED: bool = False
+    PROFILING_SAMPLE_RATE: float = 0.0
+    PROFILING_ROUTES: list[str] = []
+    PROFILING_TOKEN: str = ""
+    PROFILING_DIR: str = "profiles"
+    PROFILING_MAX_FILES: int = 200
 
     class Config:
         env_file = ".env"
 
 settings = Settings()
 
-encoded_connection_string = urllib.parse.quote_plus(settings.DB_CONNECTION_STRING)
-sqlalchemy_url = f"mssql+pyodbc:///?odbc_connect={encoded_connection_string}"
+def build_engine_url(connection_string: str) -> str:
+    """
+    DB_CONNECTION_STRING 可以是：
+    - ODBC 連線字串 (Driver=...;Server=...)：SQL Server，使用 mssql+pyodbc
+    - SQLAlchemy URL (含 ://)：例如 sqlite:///edge.db、postgresql+psycopg://user:pw@host/db
+    """
+    if "://" in connection_string:
+        return connection_string
+    encoded_connection_string = urllib.parse.quote_plus(connection_string)
+    return f"mssql+pyodbc:///?odbc_connect={encoded_connection_string}"
+
+def pool_sizes(total: int, workers: int):
+    """每個 worker 分到的連線數：(常駐 pool_size, 尖峰 max_overflow)，合計不超過 total / workers"""
+    per_worker = max(3, total // max(1, workers))
+    pool_size = max(2, per_worker * 2 // 3)
+    return pool_size, per_worker - pool_size
+
+def engine_options(url: str) -> dict:
+    if url.startswith("sqlite"):
+        options = {"connect_args": {"check_same_thread": False}}
+        if url in ("sqlite://", "sqlite:///:memory:"):
+            # 記憶體資料庫只存在於單一連線
+            options["poolclass"] = StaticPool
+        return options
+
+    pool_size, max_overflow = pool_sizes(settings.DB_MAX_CONNECTIONS, settings.WEB_CONCURRENCY)
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_pre_ping": True, # 長時間執行的 worker：連線被資料庫端關閉後自動重連
+    }
+
+sqlalchemy_url = build_engine_url(settings.DB_CONNECTION_STRING)
+
+# engine 在第一次使用時才建立 (API 於 lifespan 建立)：import 時不載入 DB driver
+_engine = None
+_engine_lock = threading.Lock()
+_engine_hooks = []
+
+def on_engine_created(hook):
+    """註冊 engine 建立後的設定 (例如 SQL 指標事件)；engine 已建立時立即執行"""
+    _engine_hooks.append(hook)
+    if _engine is not None:
+        hook(_engine)
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(sqlalchemy_url, **engine_options(sqlalchemy_url))
+                for hook in _engine_hooks:
+                    hook(engine)
+                _engine = engine
+    return _engine
+
+def dispose_engine(close: bool = True):
+    if _engine is not None:
+        _engine.dispose(close=close)
+
+def __getattr__(name):
+    # 相容：from app.database import engine (存取時才建立)
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+_session_factory = sessionmaker(autocommit=False, autoflush=False)
 
-# 建立 SQL Server 連線
-engine = create_engine(sqlalchemy_url)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+def SessionLocal(**kwargs):
+    return _session_factory(bind=get_engine(), **kwargs)
 
 Base = declarative_base()
 
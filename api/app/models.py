@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Boolean
-from sqlalchemy.dialects.mssql import NVARCHAR
+from sqlalchemy import Column, Integer, String, Unicode, DateTime, Boolean, Index
 from sqlalchemy.sql import func 
 from app.database import Base
+from app.core.permissions import resolve_permissions
+from app.core.images import thumbnail_url
 
 class User(Base):
     __tablename__ = "Users"
@@ -17,22 +18,7 @@ class User(Base):
     is_active = Column(Boolean, default=True)
 
     def get_all_permissions(self):
-        import json
-        from app.core.permissions import DEFAULT_ROLE_PERMISSIONS
-        
-        role_perms = []
-        if self.role in DEFAULT_ROLE_PERMISSIONS:
-            dept_config = DEFAULT_ROLE_PERMISSIONS[self.role]
-            role_perms = dept_config.get(self.department, [])
-            
-        extra_perms = []
-        if self.permissions:
-            try:
-                extra_perms = json.loads(self.permissions)
-            except:
-                extra_perms = []
-        
-        return set(role_perms + extra_perms)
+        return resolve_permissions(self.role, self.department, self.permissions)
 
 class Device(Base):
     __tablename__ = "Devices"
@@ -57,34 +43,100 @@ class Basket(Base):
     type = Column(Integer, nullable=True)
     
     # 這裡我們將 JSON 資料當作純文字存儲，App 端再自己解析
-    product = Column(NVARCHAR(4000), nullable=True) 
-    batch = Column(NVARCHAR(4000), nullable=True)
+    product = Column(Unicode(4000), nullable=True) 
+    batch = Column(Unicode(4000), nullable=True)
     
     warehouseId = Column(String, nullable=True)
     quantity = Column(Integer, default=0)
     status = Column(String, default="UNASSIGNED") # 對應 App 的 BasketStatus
     
     productionDate = Column(DateTime, nullable=True)
-    lastUpdated = Column(DateTime, default=func.now(), onupdate=func.now())
+    lastUpdated = Column(DateTime, nullable=False, default=func.now(), onupdate=func.now()) # 既有 NULL 由 init_db_schema 回填
     updateBy = Column(String, nullable=True)
-    description = Column(NVARCHAR(255), nullable=True)
+    description = Column(Unicode(255), nullable=True)
+
+    # 由 product/batch JSON 解析出的代碼 (寫入時同步)，供篩選與 GROUP BY 使用
+    itemcode = Column(String(50), nullable=True, index=True)
+    batchCode = Column(String(50), nullable=True, index=True)
+
+    __table_args__ = (
+        # 倉庫庫存查詢：依倉庫 + 狀態篩選、依 lastUpdated 排序分頁
+        Index("ix_Baskets_warehouseId_status_lastUpdated", "warehouseId", "status", "lastUpdated"),
+        # 出貨配貨 (FEFO)：依倉庫 + 產品找在庫籃子
+        Index("ix_Baskets_warehouseId_itemcode_status", "warehouseId", "itemcode", "status"),
+    )
+
+# 籃子歷史版本 (非 SQL Server 使用；SQL Server 由 Temporal Table 記錄)
+# 由 trigger 在 Baskets UPDATE/DELETE 時寫入舊版本，見 app/core/history.py
+class BasketVersion(Base):
+    __tablename__ = "BasketVersions"
+
+    hid = Column(Integer, primary_key=True)
+    bid = Column(Integer, index=True)
+    rfid = Column(String(100), nullable=False)
+    type = Column(Integer, nullable=True)
+    product = Column(Unicode(4000), nullable=True)
+    batch = Column(Unicode(4000), nullable=True)
+    warehouseId = Column(String, nullable=True)
+    quantity = Column(Integer, nullable=True)
+    status = Column(String, nullable=True)
+    productionDate = Column(DateTime, nullable=True)
+    lastUpdated = Column(DateTime, nullable=True)
+    updateBy = Column(String, nullable=True)
+    description = Column(Unicode(255), nullable=True)
+    itemcode = Column(String(50), nullable=True)
+    batchCode = Column(String(50), nullable=True)
+
+    validFrom = Column(DateTime, nullable=False)
+    validTo = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_BasketVersions_rfid_validTo", "rfid", "validTo"),
+    )
+
+# 籃子流向 (只新增不修改)：每次籃子寫入時記錄當下的批次、倉庫與狀態，供回收追溯
+# 依 batchCode 查詢只讀取該批次的資料列，不需掃描歷史表
+class BasketMovement(Base):
+    __tablename__ = "BasketMovements"
+
+    id = Column(Integer, primary_key=True)
+    batchCode = Column(String(50), nullable=False)
+    rfid = Column(String(100), nullable=False)
+    bid = Column(Integer, nullable=True)
+    warehouseId = Column(String(50), nullable=True)
+    status = Column(String(30), nullable=True)
+    quantity = Column(Integer, nullable=True)
+    eventType = Column(String(30), nullable=True) # Production, Receiving, Transfer, Shipping, Update, Backfill, Leave (離開舊批次)
+    shipmentNo = Column(String(50), nullable=True)
+    producedDelta = Column(Integer, nullable=True) # 對批次生產量的影響 (生產 +數量、生產中修改數量的差額)
+    createdAt = Column(DateTime, nullable=False)
+    createdBy = Column(String, nullable=True)
+
+    __table_args__ = (
+        Index("ix_BasketMovements_batchCode_createdAt", "batchCode", "createdAt"),
+        Index("ix_BasketMovements_rfid_createdAt", "rfid", "createdAt"),
+    )
 
 class Product(Base):
     __tablename__ = "Products"
 
     pid = Column(Integer, primary_key=True, index=True)
-    itemcode = Column(NVARCHAR(50), index=True) 
+    itemcode = Column(Unicode(50), index=True) 
     barcodeId = Column(String, nullable=True)
     qrcodeId = Column(String, nullable=True)
-    name = Column(NVARCHAR(100))
+    name = Column(Unicode(100))
     div = Column(Integer, nullable=True)
     shelflife = Column(Integer, nullable=True)
     btype = Column(Integer, default=1)
     maxBasketCapacity = Column(Integer, default=0)
     maxTrolleyCapacity = Column(Integer, default=0)
-    description = Column(NVARCHAR(255), nullable=True)
+    description = Column(Unicode(255), nullable=True)
     imageUrl = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
+
+    @property
+    def thumbnailUrl(self):
+        return thumbnail_url(self.imageUrl)
     
 class Batch(Base):
     __tablename__ = "Batches"
@@ -99,15 +151,139 @@ class Batch(Base):
     remainingQuantity = Column(Integer, default=0) # 實際在庫數量 (Stock)
 
     productionDate = Column(DateTime)
-    expireDate = Column(DateTime)
+    expireDate = Column(DateTime, index=True) # 到期查詢：先找到期批次，再以 Baskets.batchCode 找籃子
     status = Column(String, default="PENDING")
     maxRepairs = Column(Integer, default=1)
 
+    __table_args__ = (
+        # 批次追溯：依產品 + 生產日期範圍查詢
+        Index("ix_Batches_itemcode_productionDate", "itemcode", "productionDate"),
+    )
+
 class Warehouse(Base):
     __tablename__ = "Warehouses"
 
     wid = Column(Integer, primary_key=True, index=True)
     warehouseId = Column(String(50), unique=True, index=True, nullable=False)
-    name = Column(NVARCHAR(100))
-    address = Column(NVARCHAR(255), nullable=True)
+    name = Column(Unicode(100))
+    address = Column(Unicode(255), nullable=True)
     isActive = Column(Boolean, default=True)
+
+# 出貨單 (配貨後為 ALLOCATED，確認出貨後為 SHIPPED，取消為 CANCELLED)
+class Shipment(Base):
+    __tablename__ = "Shipments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    shipmentNo = Column(String(50), unique=True, index=True, nullable=False) # SH-YYYYMMDD-xxxxxx
+    warehouseId = Column(String(50), nullable=False)
+    reference = Column(Unicode(100), nullable=True) # 客戶訂單編號 / 路線
+    lines = Column(Unicode(4000), nullable=True)    # 訂單內容 JSON: [{"itemcode": ..., "quantity": ...}]
+    status = Column(String(20), default="ALLOCATED", index=True)
+    createdBy = Column(String, nullable=True)
+    createdAt = Column(DateTime, default=func.now())
+    confirmedBy = Column(String, nullable=True)
+    confirmedAt = Column(DateTime, nullable=True)
+
+# 出貨單的揀貨明細 (每個籃子一筆；quantity < basketQuantity 表示只取部分)
+class ShipmentItem(Base):
+    __tablename__ = "ShipmentItems"
+
+    id = Column(Integer, primary_key=True)
+    shipmentId = Column(Integer, index=True, nullable=False)
+    bid = Column(Integer, nullable=False)
+    rfid = Column(String(100), index=True, nullable=False)
+    itemcode = Column(String(50), nullable=True)
+    batchCode = Column(String(50), nullable=True)
+    expireDate = Column(DateTime, nullable=True)
+    basketQuantity = Column(Integer, default=0) # 配貨當下的籃子數量 (確認時用來檢查是否被異動)
+    quantity = Column(Integer, default=0)       # 揀貨數量
+
+# --- 分析用彙總表 (由 app/core/analytics.py 增量更新，Dashboard 只讀取這些表) ---
+# 籃子流量：BasketMovements 依時間桶 × 倉庫 × 事件類型 × 產品彙總
+class FlowAggregateColumns:
+    id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, nullable=False)      # 時間桶起點 (整點 / 當日 00:00)
+    warehouseId = Column(String(50), nullable=True)
+    eventType = Column(String(30), nullable=True)
+    itemcode = Column(String(50), nullable=True)
+    baskets = Column(Integer, default=0)           # 籃子異動次數
+    quantity = Column(Integer, default=0)
+
+class FlowHourly(FlowAggregateColumns, Base):
+    __tablename__ = "FlowHourly"
+    __table_args__ = (
+        Index("ix_FlowHourly_bucket_warehouseId", "bucket", "warehouseId"),
+    )
+
+class FlowDaily(FlowAggregateColumns, Base):
+    __tablename__ = "FlowDaily"
+    __table_args__ = (
+        Index("ix_FlowDaily_bucket_warehouseId", "bucket", "warehouseId"),
+    )
+
+# 在庫量快照：Baskets 依倉庫 × 狀態彙總 (同一時間桶以最新快照覆蓋)
+class OccupancyColumns:
+    id = Column(Integer, primary_key=True)
+    bucket = Column(DateTime, nullable=False)
+    warehouseId = Column(String(50), nullable=True)
+    status = Column(String(30), nullable=True)
+    baskets = Column(Integer, default=0)
+    quantity = Column(Integer, default=0)
+
+class OccupancyHourly(OccupancyColumns, Base):
+    __tablename__ = "OccupancyHourly"
+    __table_args__ = (
+        Index("ix_OccupancyHourly_bucket_warehouseId", "bucket", "warehouseId"),
+    )
+
+class OccupancyDaily(OccupancyColumns, Base):
+    __tablename__ = "OccupancyDaily"
+    __table_args__ = (
+        Index("ix_OccupancyDaily_bucket_warehouseId", "bucket", "warehouseId"),
+    )
+
+# 增量處理進度 (例如 flow = 已彙總到的 BasketMovements.id)
+class AnalyticsWatermark(Base):
+    __tablename__ = "AnalyticsWatermarks"
+
+    name = Column(String(50), primary_key=True)
+    lastId = Column(Integer, default=0)
+    lastAt = Column(DateTime, nullable=True) # 以時間為水位的處理 (例如 dwell)
+    updatedAt = Column(DateTime, nullable=True)
+
+# 籃子停留區間：每個籃子在同一狀態 + 倉庫連續停留的期間 (leftAt 為 NULL 表示目前仍在該狀態)
+# status = CYCLE 為完整週期 (離開 UNASSIGNED 到再次被清空)
+class BasketDwell(Base):
+    __tablename__ = "BasketDwells"
+
+    id = Column(Integer, primary_key=True)
+    rfid = Column(String(100), nullable=False)
+    status = Column(String(30), nullable=True)
+    warehouseId = Column(String(50), nullable=True)
+    itemcode = Column(String(50), nullable=True)
+    enteredAt = Column(DateTime, nullable=False)
+    leftAt = Column(DateTime, nullable=True)
+    seconds = Column(Integer, nullable=True)
+    cycleStart = Column(DateTime, nullable=True) # 所屬週期的起點 (離開 UNASSIGNED 的時間)
+
+    __table_args__ = (
+        Index("ix_BasketDwells_rfid_leftAt", "rfid", "leftAt"),
+        Index("ix_BasketDwells_status_leftAt", "status", "leftAt"),
+    )
+
+# 停留時間分佈 (每日 × 狀態 × 倉庫 × 產品的對數直方圖，百分位數由此估算)
+class DwellDaily(Base):
+    __tablename__ = "DwellDaily"
+
+    id = Column(Integer, primary_key=True)
+    day = Column(DateTime, nullable=False)         # 離開該狀態的日期
+    status = Column(String(30), nullable=True)
+    warehouseId = Column(String(50), nullable=True)
+    itemcode = Column(String(50), nullable=True)
+    bin = Column(Integer, nullable=False)          # 秒數的對數分箱，見 app/core/dwell.py
+    count = Column(Integer, default=0)
+    totalSeconds = Column(Integer, default=0)
+
+    __table_args__ = (
+        Index("ix_DwellDaily_day_status", "day", "status"),
+    )
@@ -1,6 +1,6 @@
 # app/schemas.py
 from pydantic import BaseModel, field_validator
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import date, datetime
 
 """
@@ -63,11 +63,20 @@ class BasketResponse(BasketBase):
     class Config:
         from_attributes = True
 
+# 精簡籃子回應 (不含 product/batch JSON，供數量/狀態檢視)
+class BasketBriefResponse(BaseModel):
+    bid: int
+    rfid: str
+    status: str
+    quantity: int
+    warehouseId: Optional[str] = None
+    lastUpdated: Optional[datetime] = None
+
 class BasketListResponse(BaseModel):
     total: int
     page: int
     page_size: int
-    items: List[BasketResponse]
+    items: List[BasketResponse] | List[BasketBriefResponse] # 依 fields 參數決定
 
 # 共通資料 (Common Data)
 class BasketCommonData(BaseModel):
@@ -114,6 +123,14 @@ class BasketBulkCreateResult(BaseModel):
 class BasketBulkCreateResponse(BaseModel):
     results: List[BasketBulkCreateResult]
 
+class BasketLookupRequest(BaseModel):
+    rfids: List[str]
+    fields: Optional[List[str]] = None # 只回傳指定欄位 (rfid 一定回傳)
+
+class BasketLookupResponse(BaseModel):
+    items: List[dict]
+    unknown: List[str] # 系統中不存在的 RFID，App 可提示註冊
+
 """
 # --- Device ---
 """
@@ -188,6 +205,11 @@ class Token(BaseModel):
     username: str
     department: str | None = None
     permissions: List[str] = []
+    refresh_token: str | None = None
+    expires_in: int | None = None # access token 效期 (秒)
+
+class TokenRefreshRequest(BaseModel):
+    refresh_token: str
 
 """
 # --- Product ---
@@ -232,6 +254,7 @@ class ProductUpdate(BaseModel):
 
 class ProductResponse(ProductBase):
     pid: int
+    thumbnailUrl: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -244,6 +267,7 @@ class ProductAppResponse(BaseModel):
     btype: Optional[int] = None
     maxBasketCapacity: int
     imageUrl: Optional[str] = None
+    thumbnailUrl: Optional[str] = None
 
     class Config:
         from_attributes = True
@@ -298,6 +322,238 @@ class BatchAppResponse(BaseModel):
     class Config:
         from_attributes = True
 
+"""
+# --- Trace (批次追溯) ---
+"""
+class TracePair(BaseModel):
+    itemcode: str
+    expire_date: date
+
+class BatchTraceRequest(BaseModel):
+    pairs: List[TracePair]
+    include_baskets: bool = False # 目前在哪些籃子 / 倉庫
+    include_history: bool = False # 曾經裝過該批次的籃子與經過的倉庫
+
+class TraceBasket(BaseModel):
+    rfid: str
+    warehouseId: Optional[str] = None
+    status: Optional[str] = None
+    quantity: Optional[int] = None
+    lastUpdated: Optional[datetime] = None
+
+class TraceWarehouse(BaseModel):
+    warehouseId: Optional[str] = None
+    baskets: int
+    quantity: int
+
+class TraceMovement(BaseModel):
+    rfid: str
+    warehouseId: Optional[str] = None
+    firstSeen: Optional[datetime] = None
+    lastSeen: Optional[datetime] = None
+
+class BatchTrace(BatchResponse):
+    baskets: Optional[List[TraceBasket]] = None
+    warehouses: Optional[List[TraceWarehouse]] = None
+    history: Optional[List[TraceMovement]] = None
+
+class BatchTraceResult(BaseModel):
+    itemcode: str
+    expire_date: date
+    productionDate: Optional[date] = None # 由 shelflife 反推；找不到產品時為 None
+    message: Optional[str] = None
+    batches: List[BatchTrace] = []
+
+class BatchTraceResponse(BaseModel):
+    results: List[BatchTraceResult]
+
+"""
+# --- Genealogy (籃子流向) ---
+"""
+class MovementEvent(BaseModel):
+    rfid: str
+    batchCode: str
+    warehouseId: Optional[str] = None
+    status: Optional[str] = None
+    quantity: Optional[int] = None
+    eventType: Optional[str] = None
+    shipmentNo: Optional[str] = None
+    createdAt: datetime
+    createdBy: Optional[str] = None
+
+class GenealogyBasket(BaseModel):
+    rfid: str
+    firstSeen: datetime
+    lastSeen: datetime
+    events: List[MovementEvent]
+
+class GenealogyWarehouse(BaseModel):
+    warehouseId: str
+    baskets: int
+    firstSeen: datetime
+    lastSeen: datetime
+
+class GenealogyShipment(BaseModel):
+    shipmentNo: str
+    warehouseId: Optional[str] = None
+    baskets: int
+    quantity: int
+    shippedAt: datetime
+
+class BatchGenealogyResponse(BaseModel):
+    batchCode: str
+    baskets: List[GenealogyBasket]
+    warehouses: List[GenealogyWarehouse]
+    shipments: List[GenealogyShipment]
+
+class GenealogyBatch(BaseModel):
+    batchCode: str
+    firstSeen: datetime
+    lastSeen: datetime
+
+class BasketGenealogyResponse(BaseModel):
+    rfid: str
+    batches: List[GenealogyBatch]
+    events: List[MovementEvent]
+
+"""
+# --- Analytics (流量 / 在庫量彙總) ---
+"""
+class ThroughputPoint(BaseModel):
+    bucket: datetime
+    warehouseId: Optional[str] = None
+    eventType: Optional[str] = None
+    itemcode: Optional[str] = None
+    baskets: int
+    quantity: int
+
+class ThroughputResponse(BaseModel):
+    interval: str # hour, shift, day
+    groupBy: List[str]
+    points: List[ThroughputPoint]
+
+class OccupancyPoint(BaseModel):
+    bucket: datetime
+    warehouseId: Optional[str] = None
+    status: Optional[str] = None
+    baskets: int
+    quantity: int
+
+class OccupancyResponse(BaseModel):
+    interval: str # hour, day
+    groupBy: List[str]
+    points: List[OccupancyPoint]
+
+class DwellPoint(BaseModel):
+    day: Optional[datetime] = None
+    status: Optional[str] = None # IN_PRODUCTION, IN_STOCK ... / CYCLE (完整週期)
+    warehouseId: Optional[str] = None
+    itemcode: Optional[str] = None
+    count: int
+    avgSeconds: float
+    percentiles: Dict[str, Optional[float]] # {"p50": 秒數, ...}
+
+class DwellResponse(BaseModel):
+    groupBy: List[str]
+    points: List[DwellPoint]
+
+"""
+# --- Reconciliation (批次對帳) ---
+"""
+class BatchDriftItem(BaseModel):
+    bid: int
+    batch_code: str
+    producedQuantity: int
+    expectedProduced: int
+    remainingQuantity: int
+    expectedRemaining: int
+
+class ReconciliationRun(BaseModel):
+    mode: Optional[str] = None # incremental / full
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
+    checked: int = 0
+    updated: int = 0
+
+class BatchDriftReport(BaseModel):
+    checked: int
+    drifted: int
+    pending: int # 等待增量對帳的批次數
+    items: List[BatchDriftItem]
+    lastRun: Optional[ReconciliationRun] = None
+
+"""
+# --- Expiry (到期提醒) ---
+"""
+class ExpiryGroup(BaseModel):
+    warehouseId: Optional[str] = None
+    itemcode: Optional[str] = None
+    batchCode: str
+    expireDate: datetime
+    daysLeft: int # 0 為今天到期，負數為已過期
+    baskets: int
+    quantity: int
+
+class ExpiryUpcomingResponse(BaseModel):
+    days: int
+    totalBaskets: int
+    totalQuantity: int
+    items: List[ExpiryGroup]
+
+"""
+# --- Shipping (出貨配貨) ---
+"""
+class ShipmentLine(BaseModel):
+    itemcode: str
+    quantity: int
+
+    @field_validator('quantity')
+    @classmethod
+    def check_quantity(cls, v: int) -> int:
+        if v <= 0:
+            raise ValueError('Quantity must be positive')
+        return v
+
+class ShipmentAllocateRequest(BaseModel):
+    warehouseId: str
+    reference: Optional[str] = None
+    lines: List[ShipmentLine]
+
+class ShipmentPickItem(BaseModel):
+    rfid: str
+    itemcode: Optional[str] = None
+    batchCode: Optional[str] = None
+    expireDate: Optional[datetime] = None
+    basketQuantity: int
+    quantity: int # 揀貨數量 (小於 basketQuantity 表示只取部分)
+
+    class Config:
+        from_attributes = True
+
+class ShipmentShortage(BaseModel):
+    itemcode: str
+    requested: int
+    allocated: int
+
+class ShipmentSummary(BaseModel):
+    id: int
+    shipmentNo: str
+    warehouseId: str
+    reference: Optional[str] = None
+    status: str # ALLOCATED, SHIPPED, CANCELLED
+    createdBy: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    confirmedBy: Optional[str] = None
+    confirmedAt: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ShipmentResponse(ShipmentSummary):
+    lines: List[ShipmentLine]
+    items: List[ShipmentPickItem]
+    shortages: List[ShipmentShortage] = []
+
 """
 # --- Warehouse ---
 """
@@ -320,3 +576,77 @@ class WarehouseResponse(WarehouseBase):
 
     class Config:
         from_attributes = True
+
+# 倉庫庫存彙總 (summary=true)
+class WarehouseInventorySummary(BaseModel):
+    status: Optional[str] = None
+    itemcode: Optional[str] = None
+    productName: Optional[str] = None
+    batchCode: Optional[str] = None
+    basketCount: int
+    totalQuantity: int
+
+"""
+# --- Sync (離線佇列回放) ---
+"""
+class SyncBatchData(BatchUpdate):
+    batch_code: str
+
+class SyncMutation(BaseModel):
+    opId: str                      # App 端產生的唯一操作 ID (重送時用來去重)
+    clientTimestamp: datetime      # 操作在裝置上發生的時間
+    entity: str = "basket"         # basket / batch
+    updateType: Optional[str] = None # 同 bulk-update: Production, Receiving, Transfer, Clear
+    baseLastUpdated: Optional[datetime] = None # 裝置離線前看到的 lastUpdated (樂觀鎖)
+    force: bool = False            # 忽略衝突直接覆蓋
+    basket: Optional[BasketItemData] = None
+    batch: Optional[SyncBatchData] = None
+
+class SyncMutationRequest(BaseModel):
+    mutations: List[SyncMutation]
+
+class SyncMutationResult(BaseModel):
+    opId: str
+    status: str # APPLIED, CONFLICT, DUPLICATE, NOT_FOUND, REJECTED, ERROR
+    message: Optional[str] = None
+    serverLastUpdated: Optional[datetime] = None
+
+class SyncMutationResponse(BaseModel):
+    applied: int
+    results: List[SyncMutationResult]
+
+"""
+# --- Profiling ---
+"""
+class ProfileEntry(BaseModel):
+    id: str
+    method: str
+    path: str
+    route: str
+    status: int
+    duration_ms: float
+    reason: str # header, route, sample
+    overlapping: int = 0 # 記錄期間 event loop 上同時進行的其他請求數
+    created_at: datetime
+
+"""
+# --- Jobs (背景工作) ---
+"""
+class JobAcceptedResponse(BaseModel):
+    job_id: str
+    status: str
+
+class JobResponse(BaseModel):
+    id: str
+    type: str
+    status: str # QUEUED, RUNNING, RETRYING, SUCCEEDED, FAILED
+    progress: int = 0
+    total: int = 0
+    attempts: int = 0
+    maxAttempts: int = 0
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    createdBy: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    startedAt: Optional[datetime] = None
+    finishedAt: Optional[datetime] = None
@@ -1,22 +1,63 @@
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from functools import lru_cache
 from jose import jwt
+import json
+import uuid
 from app.database import settings
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# passlib 載入較慢 (啟動時間的一大部分)，第一次雜湊/驗證時才載入 (API 啟動後由背景預熱)
+# min/max 與預設成本相同：成本設定變更後，舊 hash 在驗證時會被標記為需要更新
+@lru_cache(maxsize=1)
+def password_context():
+    from passlib.context import CryptContext
+    return CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+        bcrypt__max_rounds=settings.BCRYPT_ROUNDS,
+    )
 
 # 1. 驗證密碼
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_context().verify(plain_password, hashed_password)
+
+# 1-1. 驗證密碼並在成本設定變更時產生新 hash (不需更新時 new_hash 為 None)
+def verify_and_update_password(plain_password, hashed_password):
+    return password_context().verify_and_update(plain_password, hashed_password)
 
 # 2. 產生密碼 Hash
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return password_context().hash(password)
 
-# 3. 產生 JWT Token
+# 3. 產生 JWT Token (jti 供登出撤銷使用)
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode.update({"exp": expire, "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
-    return encoded_jwt
\ No newline at end of file
+    return encoded_jwt
+
+# 3-1. 產生 Refresh Token (只帶 session 資訊，權限於換發時重新讀取)
+def create_refresh_token(username: str, sid: str, jti: str):
+    expire = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode = {"sub": username, "sid": sid, "jti": jti, "type": "refresh", "exp": expire}
+    return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+
+# 4. 從 JSON 字串取出指定欄位 (非 JSON 或不存在時回傳 None)
+def parse_json_field(raw, key):
+    if not raw or not isinstance(raw, str):
+        return None
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return None
+    return data.get(key) if isinstance(data, dict) else None
+
+# 5. 從籃子的 batch 欄位取出 batch_code (App 可能送 JSON 或直接送 batch_code 字串)
+def extract_batch_code(raw):
+    if not raw or not isinstance(raw, str):
+        return None
+    if raw.lstrip().startswith("{"):
+        return parse_json_field(raw, "batch_code")
+    return raw if len(raw) <= 50 else None
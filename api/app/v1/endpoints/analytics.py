@@ -0,0 +1,127 @@
+# app/v1/endpoints/analytics.py
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db, settings
+from app.models import User
+from app.schemas import ThroughputResponse, OccupancyResponse, DwellResponse
+from app.core.security import require_permission
+from app.core.permissions import Perms
+from app.core.jobs import periodic_job
+from app.core.analytics import (
+    FLOW_DIMENSIONS, OCCUPANCY_DIMENSIONS, parse_group_by,
+    throughput_series, occupancy_series, run_flow_rollup, snapshot_occupancy,
+    hour_bucket, day_bucket
+)
+from app.core.dwell import DWELL_DIMENSIONS, dwell_percentiles, run_dwell
+from app.core.profiling import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+logger = logging.getLogger("uvicorn")
+
+# 各時間粒度可查詢的最長區間
+MAX_RANGE_DAYS = {"hour": 31, "shift": 92, "day": 731}
+
+# 1. 流量：每小時 / 班別 / 每日的籃子異動 (生產、入庫、調撥、出貨...)
+@router.get("/throughput", response_model=ThroughputResponse)
+def read_throughput(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: str = "hour",
+    group_by: str = "warehouseId,eventType",
+    warehouseId: Optional[str] = None,
+    eventType: Optional[str] = None,
+    itemcode: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.BASKET_READ))
+):
+    start, end = resolve_range(start, end, interval, ("hour", "shift", "day"))
+    dimensions = resolve_group_by(group_by, FLOW_DIMENSIONS)
+
+    points = throughput_series(db, start, end, interval, dimensions, {
+        "warehouseId": warehouseId, "eventType": eventType, "itemcode": itemcode,
+    })
+    return {"interval": interval, "groupBy": dimensions, "points": points}
+
+# 2. 在庫量：每小時 / 每日快照
+@router.get("/occupancy", response_model=OccupancyResponse)
+def read_occupancy(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    interval: str = "hour",
+    group_by: str = "warehouseId",
+    warehouseId: Optional[str] = None,
+    status: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.BASKET_READ))
+):
+    start, end = resolve_range(start, end, interval, ("hour", "day"))
+    dimensions = resolve_group_by(group_by, OCCUPANCY_DIMENSIONS)
+
+    points = occupancy_series(db, start, end, interval, dimensions, {
+        "warehouseId": warehouseId, "status": status,
+    })
+    return {"interval": interval, "groupBy": dimensions, "points": points}
+
+# 3. 停留時間：各狀態 (生產中、在庫、各倉庫...) 停留多久、完整週期 (status=CYCLE) 多久
+@router.get("/dwell", response_model=DwellResponse)
+def read_dwell(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: str = "status,warehouseId",
+    status: Optional[str] = None,
+    warehouseId: Optional[str] = None,
+    itemcode: Optional[str] = None,
+    percentiles: str = "50,90,95",
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.BASKET_READ))
+):
+    start, end = resolve_range(start, end, "day", ("day",))
+    dimensions = resolve_group_by(group_by, DWELL_DIMENSIONS)
+    try:
+        ranks = [float(p) for p in percentiles.split(",") if p.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be numbers, e.g. 50,90,95")
+    if not ranks or any(p <= 0 or p > 100 for p in ranks):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+
+    points = dwell_percentiles(db, start, end, dimensions, {
+        "status": status, "warehouseId": warehouseId, "itemcode": itemcode,
+    }, ranks)
+    return {"groupBy": dimensions, "points": points}
+
+# 輔助函式：預設查詢最近 24 小時 (day 為最近 30 天)
+def resolve_range(start, end, interval, allowed):
+    if interval not in allowed:
+        raise HTTPException(status_code=400, detail=f"interval must be one of: {', '.join(allowed)}")
+
+    end = end or datetime.now()
+    start = start or end - (timedelta(days=30) if interval == "day" else timedelta(hours=24))
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if end - start > timedelta(days=MAX_RANGE_DAYS[interval]):
+        raise HTTPException(status_code=400, detail=f"Range too large for {interval} (max {MAX_RANGE_DAYS[interval]} days)")
+    # 起點對齊時間桶，包含起點所在的整個小時 / 日
+    return (day_bucket(start) if interval == "day" else hour_bucket(start)), end
+
+def resolve_group_by(group_by, allowed):
+    try:
+        return parse_group_by(group_by, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# 定期彙總 (worker 排程)
+@periodic_job("analytics.rollup", lambda: settings.ANALYTICS_ROLLUP_INTERVAL)
+def analytics_rollup_job(ctx, payload):
+    return {"movements": run_flow_rollup(ctx.db)}
+
+@periodic_job("analytics.snapshot", lambda: settings.ANALYTICS_SNAPSHOT_INTERVAL)
+def analytics_snapshot_job(ctx, payload):
+    return {"groups": snapshot_occupancy(ctx.db)}
+
+@periodic_job("analytics.dwell", lambda: settings.DWELL_INTERVAL)
+def analytics_dwell_job(ctx, payload):
+    summary = run_dwell(ctx.db)
+    return {"baskets": summary["baskets"], "intervals": summary["intervals"]}
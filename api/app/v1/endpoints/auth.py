@@ -1,32 +1,80 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Header, Request
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.security import OAuth2PasswordRequestForm
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from app.database import get_db, settings
 from app.models import User, Device
-from app.schemas import Token, UserResponse
-from app.utils import verify_password, create_access_token
+from app.schemas import Token, TokenRefreshRequest, UserResponse
 from datetime import datetime
+import time
 from pydantic import BaseModel
 from jose import JWTError, jwt
-import redis
+from app.core.metrics import InstrumentedRedis, LOGIN_RATE_LIMITED
+from app.core.passwords import verify_password_async
+from app.core.rate_limit import hit_rate_limit
+from app.core.sessions import (
+    start_session, issue_tokens, rotate_refresh_token, revoke_session,
+    revoke_access_token, unauthorized
+)
+from app.core.security import get_current_user, oauth2_scheme
+from app.core.profiling import ProfiledRoute
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
-r = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
-
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
+r = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
 
 # 1. 登入 API
+# async：bcrypt 在專用密碼池執行，DB 存取交給 threadpool，等待驗證期間不佔用 threadpool 與 DB 連線
 @router.post("/login", response_model=Token)
-def login_for_access_token(
+async def login_for_access_token(
     request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(), 
     db: Session = Depends(get_db),
     x_device_id: str | None = Header(default=None)
 ):
-    user = db.query(User).filter(User.username == form_data.username).first()
-    
-    if not user or not verify_password(form_data.password, user.password_hash):
+    client_ip = request.client.host if request.client else None
+    await run_in_threadpool(check_login_rate_limit, form_data.username, client_ip)
+
+    password_hash = await run_in_threadpool(load_password_hash, db, form_data.username)
+    verified, new_hash = await verify_password_async(form_data.password, password_hash)
+
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return await run_in_threadpool(
+        complete_login, db, form_data.username, new_hash, x_device_id, client_ip
+    )
+
+# 輔助函式：登入頻率限制 (每個帳號、每個來源 IP)
+def check_login_rate_limit(username: str, client_ip: str | None):
+    window = settings.LOGIN_RATE_WINDOW
+    limits = [("user", f"ratelimit:login:user:{username}", settings.LOGIN_RATE_LIMIT_USER)]
+    if client_ip:
+        limits.append(("ip", f"ratelimit:login:ip:{client_ip}", settings.LOGIN_RATE_LIMIT_IP))
+
+    for scope, key, limit in limits:
+        retry_after = hit_rate_limit(r, key, limit, window)
+        if retry_after is not None:
+            LOGIN_RATE_LIMITED.labels(scope).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, please retry later",
+                headers={"Retry-After": str(retry_after)},
+            )
+
+# 輔助函式：取得密碼 hash 後立即結束交易，驗證密碼期間不佔用 DB 連線
+def load_password_hash(db: Session, username: str):
+    row = db.query(User.password_hash).filter(User.username == username).first()
+    db.rollback()
+    return row.password_hash if row else None
+
+def complete_login(db: Session, username: str, new_hash: str | None, x_device_id: str | None, client_ip: str | None):
+    user = db.query(User).filter(User.username == username).first()
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -35,65 +83,55 @@ def login_for_access_token(
 
     user.last_login = datetime.now()
 
+    # bcrypt 成本設定變更時，以新成本重新雜湊
+    if new_hash:
+        user.password_hash = new_hash
+
     if x_device_id:
         device = db.query(Device).filter(Device.device_id == x_device_id).first()
         if device:
             device.currentUser = user.username
             device.status = "ONLINE"
             device.last_active = datetime.now()
-            device.ip_address = request.client.host
+            device.ip_address = client_ip
 
     db.commit()
 
+    # 建立 session (綁定裝置時，同裝置上前一個 session 失效)
+    sid, refresh_jti = start_session(r, user.username, x_device_id, client_ip)
+
+    return build_token_response(user, sid, refresh_jti)
+
+# 輔助函式：組合登入 / 換發回應 (權限每次重新計算)
+def build_token_response(user: User, sid: str, refresh_jti: str):
     # 計算該使用者的最終權限 (Role 預設 + 額外權限)
     final_permissions = list(user.get_all_permissions())
     
-    # 產生 Token
-    access_token = create_access_token(data={
-        "sub": user.username, 
-        "role": user.role,
-        "dept": user.department 
-    })
-    
     return {
         "username": user.username,
         "role": user.role,
         "department": user.department,
         "token_type": "bearer",
-        "access_token": access_token,
-        "permissions": final_permissions
+        "permissions": final_permissions,
+        **issue_tokens(user.username, user.role, user.department, sid, refresh_jti)
     }
 
-# 2. 驗證目前使用者的 Dependency (供其他 API 使用)
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-
-    # --- 檢查黑名單 ---
-    # 如果 Redis 中存在此 Token，表示已登出
-    if r.exists(f"blacklist:{token}"):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has been revoked (logged out)",
-            headers={"WWW-Authenticate": "Bearer"},
-        )
-    # ----------------
+# 1-1. 換發 Token (Refresh Token Rotation)
+# 只需驗證簽章與 Redis session，不需 bcrypt；App 在 access token 到期前呼叫
+@router.post("/refresh", response_model=Token)
+def refresh_access_token(
+    body: TokenRefreshRequest,
+    db: Session = Depends(get_db),
+    x_device_id: str | None = Header(default=None)
+):
+    username, sid, refresh_jti = rotate_refresh_token(r, body.refresh_token, x_device_id)
 
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-        
     user = db.query(User).filter(User.username == username).first()
-    if user is None:
-        raise credentials_exception
-    return user
+    if not user or user.is_active is False:
+        revoke_session(r, sid)
+        raise unauthorized("User is not active")
+
+    return build_token_response(user, sid, refresh_jti)
 
 @router.get("/me", response_model=UserResponse)
 def read_users_me(current_user: User = Depends(get_current_user)):
@@ -110,7 +148,7 @@ def read_users_me(current_user: User = Depends(get_current_user)):
         "permissions": list(current_user.get_all_permissions())
     }
 
-# 3. 登出 API
+# 2. 登出 API
 @router.post("/logout")
 def logout(
     token: str = Depends(oauth2_scheme),
@@ -118,17 +156,16 @@ def logout(
     x_device_id: str | None = Header(default=None)
 ):
     try:
-        # 解析 Token 取得過期時間 (exp)
         payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        exp_timestamp = payload.get("exp")
-        
-        if exp_timestamp:
-            current_timestamp = datetime.utcnow().timestamp()
-            ttl = int(exp_timestamp - current_timestamp)
-            
-            # 如果 Token 還沒過期，就加入 Redis 黑名單
-            # Key 格式: "blacklist:token_string"
-            # TTL: 設定為 Token 剩餘時間，時間到自動從 Redis 消失 (節省空間)
+
+        if payload.get("jti"):
+            # 撤銷此 access token (revoked:{jti}，TTL 為剩餘效期) 與所屬 session (含 refresh token)
+            revoke_access_token(r, payload)
+            if payload.get("sid"):
+                revoke_session(r, payload["sid"])
+        else:
+            # 舊版 token (沒有 jti)：整個 token 加入黑名單
+            ttl = int(payload.get("exp", 0) - time.time())
             if ttl > 0:
                 r.setex(f"blacklist:{token}", ttl, "logged_out")
 
@@ -1,26 +1,47 @@
 # app/v1/endpoints/baskets.py
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
 from typing import Optional, List
-from sqlalchemy import or_, and_, text
+from sqlalchemy import or_, and_
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, settings
 from app.models import Basket, User, Batch
 from app.schemas import (
     BasketCreate, BasketUpdate, BasketResponse, BasketListResponse,
     BasketBatchUpdateItem, BasketBulkUpdateRequest, BasketCommonData,
-    BasketBulkCreateRequest, BasketBulkCreateResponse
+    BasketBulkCreateRequest, BasketBulkCreateResponse, BasketBulkItem, JobAcceptedResponse,
+    BasketLookupRequest, BasketLookupResponse, BasketBriefResponse
 )
-from app.v1.endpoints.auth import get_current_user
-import redis
+from app.core.metrics import InstrumentedRedis, BULK_BATCH_SIZE
 import json
 from datetime import datetime
 from app.core.permissions import Perms
-from app.core.security import require_permission
+from app.core.security import require_permission, get_current_user
+from app.core.encoding import compact_response, query_rows, fast_response
+from app.core.projection import parse_basket_fields
+from app.core.history import basket_history_statement
+from app.core.jobs import enqueue_job, job_handler
+from app.core.reconciliation import mark_batches_dirty
+from app.core.genealogy import basket_movements, record_movements
+from app.utils import parse_json_field, extract_batch_code
+from app.core.profiling import ProfiledRoute
+from app.core.lifecycle import drains_on_shutdown
 import logging
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 logger = logging.getLogger("uvicorn")
-r = redis.Redis(host='localhost', port=6379, db=0)
+r = InstrumentedRedis(host='localhost', port=6379, db=0)
+jobs_redis = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+LOOKUP_MAX_RFIDS = 5000     # 單次 lookup 最多 RFID 數
+LOOKUP_QUERY_CHUNK = 2000   # SQL Server 單一語句最多 2100 個參數
+BASKET_CACHE_TTL = 300      # 熱籃子快取秒數
+BASKET_CACHE_GEN_TTL = 86400 # 失效版本 (basket:gen:{rfid}) 保留秒數，需遠大於一次查詢的時間
+
+# lookup 回傳的精簡欄位 (不含 description 等管理用欄位)
+LOOKUP_FIELDS = (
+    "rfid", "bid", "type", "status", "quantity", "warehouseId",
+    "product", "batch", "productionDate", "lastUpdated", "updateBy"
+)
 
 # 新增籃子 (僅限 Admin)
 @router.post("/", response_model=dict)
@@ -59,6 +80,45 @@ def create_basket(
         "detail": "success"
     }
 
+# 批量查詢籃子 (App 掃描整台車的 RFID)
+@router.post("/lookup", response_model=BasketLookupResponse)
+def lookup_baskets(
+    body: BasketLookupRequest,
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    一次查詢多個 RFID，先讀 Redis 熱快取，未命中的再以 IN 查詢補齊並寫回快取。
+    系統中不存在的 RFID 放在 unknown，方便 App 提示註冊。
+    """
+    rfids = list(dict.fromkeys(body.rfids)) # 去重但保留順序
+    if len(rfids) > LOOKUP_MAX_RFIDS:
+        raise HTTPException(status_code=413, detail=f"Too many RFIDs (max {LOOKUP_MAX_RFIDS})")
+    BULK_BATCH_SIZE.labels("lookup").observe(len(rfids))
+
+    fields = body.fields or LOOKUP_FIELDS
+    invalid = [f for f in fields if f not in LOOKUP_FIELDS]
+    if invalid:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(invalid)}")
+    if "rfid" not in fields:
+        fields = ["rfid", *fields]
+
+    records = get_cached_baskets(rfids)
+    missing = [rfid for rfid in rfids if rfid not in records]
+
+    if missing:
+        records.update(load_baskets_into_cache(db, missing))
+
+    items = [{f: records[rfid][f] for f in fields} for rfid in rfids if rfid in records]
+    unknown = [rfid for rfid in rfids if rfid not in records]
+
+    compact = compact_response(request, items, fields, extra={"unknown": unknown})
+    if compact:
+        return compact
+
+    return {"items": items, "unknown": unknown}
+
 # 查詢籃子詳情
 @router.get("/{rfid}", response_model=BasketResponse)
 def get_basket(
@@ -72,9 +132,13 @@ def get_basket(
     return basket
 
 # 批量新增籃子 (App) 
-@router.post("/bulk", response_model=BasketBulkCreateResponse)
+# background=true 時立即回傳 job_id，由 worker 分段寫入 (數千個 tag 時使用)
+@router.post("/bulk", response_model=BasketBulkCreateResponse | JobAcceptedResponse)
+@drains_on_shutdown
 def create_baskets_bulk(
     body: BasketBulkCreateRequest,
+    response: Response,
+    background: bool = False,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_permission(Perms.BASKET_CREATE))
 ):
@@ -84,36 +148,92 @@ def create_baskets_bulk(
             detail="Only Admins can register new baskets"
         )
 
+    BULK_BATCH_SIZE.labels("bulk-create").observe(len(body.items))
+
+    if background:
+        job_id = enqueue_job(
+            jobs_redis, "baskets.bulk_create",
+            {"items": [item.model_dump() for item in body.items], "username": current_user.username},
+            created_by=current_user.username, total=len(body.items)
+        )
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {"job_id": job_id, "status": "QUEUED"}
+
     results = []
-    
-    for item in body.items:
-        existing = db.query(Basket).filter(Basket.rfid == item.rfid).first()
-        if existing:
+    for offset in range(0, len(body.items), settings.JOB_CHUNK_SIZE):
+        chunk = body.items[offset:offset + settings.JOB_CHUNK_SIZE]
+        results.extend(register_baskets(db, chunk, current_user.username))
+            
+    return {"results": results}
+
+# 輔助函式：新增一批籃子 (一次查詢既有 RFID、一次 commit；commit 失敗時逐筆重試以取得個別錯誤)
+def register_baskets(db: Session, items, username: str):
+    rfids = [item.rfid for item in items]
+    existing = {row.rfid for row in db.query(Basket.rfid).filter(Basket.rfid.in_(rfids))}
+
+    results = []
+    new_items = []
+    for item in items:
+        if item.rfid in existing:
             results.append({"rfid": item.rfid, "success": False, "message": "Already exists"})
             continue
-        
+        existing.add(item.rfid)
+        new_items.append((len(results), item))
+        results.append({"rfid": item.rfid, "success": True, "message": "Success"})
+
+    try:
+        db.add_all([new_basket(item, username) for _, item in new_items])
+        db.commit()
+        return results
+    except Exception:
+        db.rollback()
+
+    # 整批失敗 (例如其他裝置同時註冊了相同 RFID)：逐筆寫入
+    for index, item in new_items:
         try:
-            new_basket = Basket(
-                rfid=item.rfid,
-                type=item.type,
-                description=item.description,
-                status="UNASSIGNED",
-                quantity=0,
-                updateBy=current_user.username,
-                lastUpdated=datetime.now()
-            )
-            db.add(new_basket)
+            db.add(new_basket(item, username))
             db.commit()
-            results.append({"rfid": item.rfid, "success": True, "message": "Success"})
         except Exception as e:
             db.rollback()
-            results.append({"rfid": item.rfid, "success": False, "message": str(e)})
-            
-    return {"results": results}
+            results[index] = {"rfid": item.rfid, "success": False, "message": str(e)}
+    return results
+
+def new_basket(item, username: str):
+    return Basket(
+        rfid=item.rfid,
+        type=item.type,
+        description=item.description,
+        status="UNASSIGNED",
+        quantity=0,
+        updateBy=username,
+        lastUpdated=datetime.now()
+    )
+
+# 背景工作：分段新增籃子，每段 commit 後記錄 checkpoint，重試時從中斷處繼續
+@job_handler("baskets.bulk_create")
+def bulk_create_job(ctx, payload):
+    items = [BasketBulkItem(**item) for item in payload["items"]]
+    state = ctx.checkpoint or {"offset": 0, "created": 0, "existing": 0, "failed": []}
+
+    for offset in range(state["offset"], len(items), settings.JOB_CHUNK_SIZE):
+        chunk = items[offset:offset + settings.JOB_CHUNK_SIZE]
+        for result in register_baskets(ctx.db, chunk, payload["username"]):
+            if result["success"]:
+                state["created"] += 1
+            elif result["message"] == "Already exists":
+                state["existing"] += 1
+            else:
+                state["failed"].append({"rfid": result["rfid"], "message": result["message"]})
+        state["offset"] = offset + len(chunk)
+        ctx.checkpoint = state
+        ctx.progress(state["offset"], len(items))
+
+    return {"created": state["created"], "existing": state["existing"], "failed": state["failed"][:100]}
 
 # 查詢籃子詳情列表
 @router.get("/", response_model=BasketListResponse)
 def get_baskets(
+    request: Request,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user),
     page: int = 1,
@@ -121,8 +241,14 @@ def get_baskets(
     search: Optional[str] = None,
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
-    status: Optional[str] = None
+    status: Optional[str] = None,
+    fields: Optional[str] = None
 ):
+    """
+    fields: full (預設) / brief (不含 product、batch JSON) / 逗號分隔欄位清單。
+    只查詢指定欄位並直接輸出，不建立 ORM 物件。
+    """
+    columns = parse_basket_fields(fields)
     query = db.query(Basket)
 
     if search:
@@ -161,31 +287,25 @@ def get_baskets(
     total = query.count()
 
     skip = (page - 1) * page_size
-    baskets = query.order_by(Basket.lastUpdated.desc()).offset(skip).limit(page_size).all()
+    page_query = query.order_by(Basket.lastUpdated.desc()).offset(skip).limit(page_size)
+    items = query_rows(page_query, Basket, columns)
 
-    return {
-        "total": total,
-        "page": page,
-        "page_size": page_size,
-        "items": baskets
-    }
+    return fast_response(
+        request, items, columns,
+        extra={"total": total, "page": page, "page_size": page_size},
+        items_key="items"
+    )
 
-# 取得特定籃子的所有歷史變更記錄 (利用 MS SQL Temporal Tables)
+# 取得特定籃子的所有歷史變更記錄 (SQL Server: Temporal Tables；其他資料庫: BasketVersions)
 @router.get("/{rfid}/history", response_model=List[BasketResponse])
 def get_basket_history(
     rfid: str, 
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # 注意: SysStartTime 和 SysEndTime 是在 SQL 建立表時定義的欄位名稱
-    # 這裡使用 Raw SQL 查詢，因為 ORM 對 Temporal Syntax 支援有限
+    # 歷史查詢依資料庫切換，見 app/core/history.py
     try:
-        sql = text("""
-            SELECT *, SysStartTime as validFrom, SysEndTime as validTo 
-            FROM Baskets FOR SYSTEM_TIME ALL 
-            WHERE rfid = :rfid 
-            ORDER BY lastUpdated DESC
-        """)
+        sql = basket_history_statement(db.get_bind().dialect.name)
         
         result = db.execute(sql, {"rfid": rfid})
         
@@ -200,6 +320,7 @@ def get_basket_history(
 
 # 更新批量籃子 (App) (生產、入庫、出貨) -> 觸發 Redis 推播
 @router.put("/bulk-update", response_model=dict)
+@drains_on_shutdown
 def bulk_update_baskets(
     request: BasketBulkUpdateRequest,
     db: Session = Depends(get_db),
@@ -209,168 +330,40 @@ def bulk_update_baskets(
     logger.info(f"🚀 [Bulk Update] Type: {request.updateType}")
     logger.info(f"📦 [Payload]: {request.model_dump_json()}")
 
+    # updateType 來自用戶端，只接受已知類型作為標籤，避免標籤數量無限增長
+    update_label = request.updateType if request.updateType in UPDATE_TYPE_STATUS else "other"
+    BULK_BATCH_SIZE.labels(f"bulk-update:{update_label}").observe(len(request.baskets))
+
     common = request.commonData or BasketCommonData()
+    if any(bypasses_shipping(request.updateType, item, common) for item in request.baskets):
+        raise HTTPException(status_code=400, detail=SHIPPING_BYPASS_MESSAGE)
     updated_count = 0
     default_update_by = common.updateBy or current_user.username
-
-    default_status = None
-    is_production = False
-    # is_clear_mode = False
-
-    if request.updateType == "Production":
-        default_status = "IN_PRODUCTION"
-        is_production = True
-    elif request.updateType == "Receiving":
-        default_status = "IN_STOCK"
-    elif request.updateType == "Transfer":
-        default_status = "IN_STOCK"
-    elif request.updateType == "Clear":
-        default_status = "UNASSIGNED"
-        # is_clear_mode = True
+    is_production = request.updateType == "Production"
 
     production_increments = {}
+    touched_batches = set()
+    movements = []
 
     for item in request.baskets:
         basket = db.query(Basket).filter(Basket.rfid == item.rfid).first()
         if not basket: continue
 
-        basket.updateBy = item.updateBy or default_update_by
-        basket.lastUpdated = datetime.now()
-
-        # if is_production:
-        #     new_status = item.status or default_status
-        #     basket.status = new_status
-            
-        #     target_batch = item.batch or common.batch
-        #     if target_batch:
-        #         basket.batch = target_batch
-            
-        #     qty = item.quantity if item.quantity is not None else common.quantity
-        #     if qty is not None:
-        #         basket.quantity = qty
-        #         if target_batch:
-        #             production_increments[target_batch] = production_increments.get(target_batch, 0) + qty
-
-        # if is_clear_mode:
-        #     basket.status = "UNASSIGNED"
-        #     basket.quantity = 0
-        #     basket.product = None
-        #     basket.batch = None
-        #     basket.productionDate = None
-        #     basket.warehouseId = None 
-        #     # if item.warehouseId or common.warehouseId:
-        #     #     basket.warehouseId = item.warehouseId or common.warehouseId
-        
-        # else:
-        #     # 4. 正常更新模式 (Receiving / Other)
-            
-        #     # Status: 個別指定 > 預設 (由 Type 決定)
-        #     # 如果個別沒指定且 Type 也沒定義，則保持原狀
-        #     new_status = item.status or default_status
-        #     if new_status:
-        #         basket.status = new_status
-
-        #     # Quantity
-        #     new_qty = item.quantity if item.quantity is not None else common.quantity
-        #     if new_qty is not None:
-        #         basket.quantity = new_qty
-
-        #     # Warehouse
-        #     new_wh = item.warehouseId or common.warehouseId
-        #     if new_wh:
-        #         basket.warehouseId = new_wh
-
-        #     # Product Info
-        #     new_prod = item.product or common.product
-        #     if new_prod: basket.product = new_prod
-            
-        #     new_batch = item.batch or common.batch
-        #     if new_batch: basket.batch = new_batch
-            
-        #     new_pdate = item.productionDate or common.productionDate
-        #     if new_pdate: basket.productionDate = new_pdate
-
-        # 1. 狀態 (Status)
-        # 優先級：個別指定 > 預設狀態 (由 Type 決定) > 共通資料 (若有)
-        final_status = item.status or default_status or common.status
-        if final_status:
-            basket.status = final_status
-
-        # 2. 倉庫 (Warehouse)
-        final_wh = item.warehouseId or common.warehouseId
-        if final_wh:
-            basket.warehouseId = final_wh
-
-        # 3. 產品與批次 (Product & Batch)
-        final_prod = item.product or common.product
-        if final_prod: 
-            basket.product = final_prod
-        
-        final_batch = item.batch or common.batch
-        if final_batch: 
-            basket.batch = final_batch
-
-        # 4. 數量 (Quantity)
-        # 使用 is not None 確保 0 也能被更新
-        final_qty = item.quantity if item.quantity is not None else common.quantity
-        if final_qty is not None:
-            basket.quantity = final_qty
-
-        # 5. Production 模式下的額外邏輯
-        if is_production:
-            # 在生產模式下，如果這裡有更新數量且有 Batch，需要累加到 Batches 表
-            if final_batch and final_qty is not None:
-                production_increments[final_batch] = production_increments.get(final_batch, 0) + final_qty
-            
-            # 記錄 Log 確認這一筆更新了什麼
-            # logger.info(f"   🔧 Processing {basket.rfid}: Status->{basket.status}, Qty->{basket.quantity}, Batch->{basket.batch}")
-            # logger.info(production_increments)
-        
-        # 6. Clear 模式
-        elif request.updateType == "Clear":
-            basket.status = "UNASSIGNED"
-            basket.quantity = 0
-            basket.product = None
-            basket.batch = None
-            basket.productionDate = None
-            basket.warehouseId = None  
+        apply_basket_update(
+            basket, item, common, request.updateType, default_update_by, production_increments,
+            touched_batches, movements
+        )
 
         publish_redis_update(basket)
         updated_count += 1
 
     if is_production and production_increments:
-        logger.info(f"📈 Updating Batches (Raw Keys): {production_increments}")
-        
-        for raw_batch_info, added_qty in production_increments.items():
-            final_batch_code = raw_batch_info
-            
-            try:
-                if isinstance(raw_batch_info, str) and "batch_code" in raw_batch_info:
-                    batch_data = json.loads(raw_batch_info)
-                    if isinstance(batch_data, dict):
-                        final_batch_code = batch_data.get("batch_code", raw_batch_info)
-            except Exception as e:
-                logger.warning(f"⚠️ Failed to parse batch JSON: {e}. Using raw string: {raw_batch_info}")
-
-            logger.info(f"   🔍 Querying Batch Code: {final_batch_code}")
-            
-            batch_record = db.query(Batch).filter(Batch.batch_code == final_batch_code).first()
-            
-            if batch_record:
-                batch_record.producedQuantity += added_qty
-                batch_record.remainingQuantity += added_qty
-                
-                if batch_record.producedQuantity > 0 and batch_record.status == "PENDING":
-                    batch_record.status = "IN_PRODUCTION"
-                
-                if batch_record.producedQuantity >= batch_record.targetQuantity:
-                    batch_record.status = "COMPLETED"
-                
-                logger.info(f"   ✅ Updated Batch {final_batch_code}: Produced {batch_record.producedQuantity}/{batch_record.targetQuantity}")
-            else:
-                logger.error(f"❌ Batch code not found in DB: {final_batch_code}")
+        apply_production_increments(db, production_increments)
 
+    record_movements(db, movements)
     db.commit()
+    invalidate_basket_cache([item.rfid for item in request.baskets])
+    mark_batches_dirty(r, touched_batches)
     
     return {
         "message": "success", 
@@ -390,6 +383,11 @@ def update_basket(
     if not basket:
         raise HTTPException(status_code=404, detail="Basket not found")
 
+    if basket_update.status == "SHIPPED":
+        raise HTTPException(status_code=400, detail=SHIPPING_BYPASS_MESSAGE)
+
+    previous = (basket.batchCode, basket.status, basket.quantity)
+
     if basket_update.status is not None:
         basket.status = basket_update.status
     if basket_update.quantity is not None:
@@ -403,10 +401,14 @@ def update_basket(
     if basket_update.productionDate is not None:
         basket.productionDate = basket_update.productionDate
 
+    sync_basket_codes(basket)
     basket.updateBy = basket_update.updateBy or current_user.username
     basket.lastUpdated = datetime.now()
 
+    record_movements(db, basket_movements(basket, "Update", previous))
     db.commit()
+    invalidate_basket_cache([rfid])
+    mark_batches_dirty(r, {previous[0], basket.batchCode})
 
     publish_redis_update(basket)
 
@@ -416,9 +418,202 @@ def update_basket(
         "detail": "success"
     }
 
+# 各 updateType 對應的預設狀態
+UPDATE_TYPE_STATUS = {
+    "Production": "IN_PRODUCTION",
+    "Receiving": "IN_STOCK",
+    "Transfer": "IN_STOCK",
+    "Clear": "UNASSIGNED",
+}
+
+# 出貨須經由 /shipping (配貨保留、扣除批次庫存、流向紀錄)，籃子更新不可直接改為 SHIPPED
+SHIPPING_BYPASS_MESSAGE = "Shipping must go through /shipping allocate and confirm"
+
+def bypasses_shipping(update_type, item, common) -> bool:
+    return update_type == "Shipping" or "SHIPPED" in (item.status, getattr(common, "status", None))
+
+# 輔助函式：套用單個籃子的批量更新 (bulk-update 與 sync 共用)
+# touched_batches (選填) 收集更新前後的 batchCode，供 commit 後標記對帳；movements (選填) 收集流向紀錄
+def apply_basket_update(basket, item, common, update_type, default_update_by, production_increments,
+                        touched_batches=None, movements=None):
+    default_status = UPDATE_TYPE_STATUS.get(update_type)
+    previous = (basket.batchCode, basket.status, basket.quantity)
+
+    basket.updateBy = item.updateBy or default_update_by
+    basket.lastUpdated = datetime.now()
+
+    # 1. 狀態 (Status)
+    # 優先級：個別指定 > 預設狀態 (由 Type 決定) > 共通資料 (若有)
+    final_status = item.status or default_status or getattr(common, "status", None)
+    if final_status:
+        basket.status = final_status
+
+    # 2. 倉庫 (Warehouse)
+    final_wh = item.warehouseId or common.warehouseId
+    if final_wh:
+        basket.warehouseId = final_wh
+
+    # 3. 產品與批次 (Product & Batch)
+    final_prod = item.product or common.product
+    if final_prod: 
+        basket.product = final_prod
+    
+    final_batch = item.batch or common.batch
+    if final_batch: 
+        basket.batch = final_batch
+
+    # 4. 數量 (Quantity)
+    # 使用 is not None 確保 0 也能被更新
+    final_qty = item.quantity if item.quantity is not None else common.quantity
+    if final_qty is not None:
+        basket.quantity = final_qty
+
+    # 5. Production 模式下的額外邏輯
+    if update_type == "Production":
+        # 在生產模式下，如果這裡有更新數量且有 Batch，需要累加到 Batches 表
+        if final_batch and final_qty is not None:
+            production_increments[final_batch] = production_increments.get(final_batch, 0) + final_qty
+
+    # 6. Clear 模式
+    elif update_type == "Clear":
+        basket.status = "UNASSIGNED"
+        basket.quantity = 0
+        basket.product = None
+        basket.batch = None
+        basket.productionDate = None
+        basket.warehouseId = None  
+
+    sync_basket_codes(basket)
+
+    if touched_batches is not None:
+        touched_batches.update({previous[0], basket.batchCode})
+    if movements is not None:
+        movements.extend(basket_movements(basket, update_type or "Update", previous))
+
+# 輔助函式：依 product/batch JSON 同步 itemcode 與 batchCode 欄位
+def sync_basket_codes(basket):
+    basket.itemcode = parse_json_field(basket.product, "itemcode")
+    basket.batchCode = extract_batch_code(basket.batch)
+
+# 輔助函式：從 batch JSON 字串取出 batch_code (非 JSON 時直接使用原字串)
+def parse_batch_code(raw_batch_info):
+    final_batch_code = raw_batch_info
+    try:
+        if isinstance(raw_batch_info, str) and "batch_code" in raw_batch_info:
+            batch_data = json.loads(raw_batch_info)
+            if isinstance(batch_data, dict):
+                final_batch_code = batch_data.get("batch_code", raw_batch_info)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to parse batch JSON: {e}. Using raw string: {raw_batch_info}")
+    return final_batch_code
+
+# 輔助函式：將生產數量累加到 Batches 表 (不 commit，由呼叫端決定交易範圍)
+def apply_production_increments(db: Session, production_increments: dict):
+    logger.info(f"📈 Updating Batches (Raw Keys): {production_increments}")
+
+    for raw_batch_info, added_qty in production_increments.items():
+        final_batch_code = parse_batch_code(raw_batch_info)
+
+        logger.info(f"   🔍 Querying Batch Code: {final_batch_code}")
+        
+        batch_record = db.query(Batch).filter(Batch.batch_code == final_batch_code).first()
+        
+        if batch_record:
+            batch_record.producedQuantity += added_qty
+            batch_record.remainingQuantity += added_qty
+            
+            if batch_record.producedQuantity > 0 and batch_record.status == "PENDING":
+                batch_record.status = "IN_PRODUCTION"
+            
+            if batch_record.producedQuantity >= batch_record.targetQuantity:
+                batch_record.status = "COMPLETED"
+            
+            logger.info(f"   ✅ Updated Batch {final_batch_code}: Produced {batch_record.producedQuantity}/{batch_record.targetQuantity}")
+        else:
+            logger.error(f"❌ Batch code not found in DB: {final_batch_code}")
+
+# 輔助函式：Redis 熱籃子快取 (lookup 讀取，寫入路徑 commit 後失效)
+def basket_cache_record(mapping):
+    record = {}
+    for f in LOOKUP_FIELDS:
+        value = mapping[f]
+        record[f] = value.isoformat() if isinstance(value, datetime) else value
+    return record
+
+def get_cached_baskets(rfids):
+    if not rfids:
+        return {}
+    try:
+        cached = r.mget([f"basket:{rfid}" for rfid in rfids])
+    except Exception as e:
+        logger.warning(f"⚠️ Basket cache read failed: {e}")
+        return {}
+    return {rfid: json.loads(raw) for rfid, raw in zip(rfids, cached) if raw}
+
+# 讀取 DB 與寫回快取之間若有寫入路徑 commit 並失效，寫回的會是舊資料：
+# 失效時遞增 basket:gen:{rfid}，寫回前後比對版本，版本變了就刪除剛寫入的值
+def basket_cache_generations(rfids):
+    try:
+        return dict(zip(rfids, r.mget([f"basket:gen:{rfid}" for rfid in rfids])))
+    except Exception as e:
+        logger.warning(f"⚠️ Basket cache generation read failed: {e}")
+        return None
+
+def cache_baskets(records, generations):
+    """generations 為讀取 DB 前取得的失效版本 (basket_cache_generations)"""
+    if not records or generations is None:
+        return
+    try:
+        pipe = r.pipeline()
+        for rfid, record in records.items():
+            pipe.setex(f"basket:{rfid}", BASKET_CACHE_TTL, json.dumps(record))
+        pipe.execute()
+
+        current = basket_cache_generations(list(records))
+        stale = [rfid for rfid in records if current is None or current[rfid] != generations.get(rfid)]
+        if stale:
+            r.delete(*[f"basket:{rfid}" for rfid in stale])
+    except Exception as e:
+        logger.warning(f"⚠️ Basket cache write failed: {e}")
+
+def load_baskets_into_cache(db: Session, rfids):
+    """以 IN 查詢讀取籃子 (LOOKUP_FIELDS) 並寫回快取；回傳 {rfid: record}"""
+    generations = basket_cache_generations(rfids)
+    columns = [getattr(Basket, f) for f in LOOKUP_FIELDS]
+    fetched = {}
+    for start in range(0, len(rfids), LOOKUP_QUERY_CHUNK):
+        rows = db.query(*columns).filter(
+            Basket.rfid.in_(rfids[start:start + LOOKUP_QUERY_CHUNK])
+        ).all()
+        for row in rows:
+            fetched[row.rfid] = basket_cache_record(row._mapping)
+    cache_baskets(fetched, generations)
+    return fetched
+
+def warm_basket_cache(db: Session, limit: int):
+    """啟動時預熱最近異動的籃子 (lookup 的熱資料)，回傳筆數"""
+    rfids = [row.rfid for row in db.query(Basket.rfid).order_by(Basket.lastUpdated.desc()).limit(limit)]
+    return len(load_baskets_into_cache(db, rfids))
+
+def invalidate_basket_cache(rfids):
+    if not rfids:
+        return
+    try:
+        pipe = r.pipeline()
+        for rfid in rfids:
+            pipe.incr(f"basket:gen:{rfid}")
+            pipe.expire(f"basket:gen:{rfid}", BASKET_CACHE_GEN_TTL)
+        pipe.delete(*[f"basket:{rfid}" for rfid in rfids])
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ Basket cache invalidation failed: {e}")
+
 # 輔助函式：Redis 推播
 def publish_redis_update(basket):
-    message = {
+    publish_redis_message(basket_update_message(basket))
+
+def basket_update_message(basket):
+    return {
         "event": "BASKET_UPDATED",
         "data": {
             "uid": basket.rfid,
@@ -428,7 +623,9 @@ def publish_redis_update(basket):
             "timestamp": int(basket.lastUpdated.timestamp() * 1000)
         }
     }
+
+def publish_redis_message(message):
     try:
         r.publish('rfid_updates', json.dumps(message))
     except Exception as e:
-        print(f"Redis publish failed: {e}")
+        print(f"Redis publish failed: {e}")
\ No newline at end of file
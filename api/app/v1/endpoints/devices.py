@@ -4,9 +4,10 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Device
 from app.schemas import DeviceRegister, DeviceResponse, DeviceHeartbeat
+from app.core.profiling import ProfiledRoute
 from datetime import datetime
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 # 1. 裝置註冊/開機回報 (App 啟動時呼叫)
 @router.post("/register", response_model=DeviceResponse)
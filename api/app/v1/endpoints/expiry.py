@@ -0,0 +1,59 @@
+# app/v1/endpoints/expiry.py
+import logging
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db, settings
+from app.models import User
+from app.schemas import ExpiryUpcomingResponse
+from app.core.security import require_permission
+from app.core.permissions import Perms
+from app.core.metrics import InstrumentedRedis
+from app.core.jobs import periodic_job
+from app.core.expiry import upcoming_expiry, scan_expiry_alerts
+from app.core.profiling import ProfiledRoute
+from app.v1.endpoints.baskets import publish_redis_message
+
+router = APIRouter(route_class=ProfiledRoute)
+logger = logging.getLogger("uvicorn")
+
+EXPIRY_MAX_DAYS = 90
+
+# 即將到期的在庫籃子 (依倉庫 × 批次彙總)
+@router.get("/upcoming", response_model=ExpiryUpcomingResponse)
+def read_upcoming_expiry(
+    days: int = None,
+    warehouseId: Optional[str] = None,
+    itemcode: Optional[str] = None,
+    include_expired: bool = False,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.BASKET_READ))
+):
+    if days is None:
+        days = settings.EXPIRY_ALERT_DAYS
+    if days < 0 or days > EXPIRY_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 0 and {EXPIRY_MAX_DAYS}")
+
+    items = upcoming_expiry(db, days, warehouseId, itemcode, include_expired=include_expired)
+    return {
+        "days": days,
+        "totalBaskets": sum(item["baskets"] for item in items),
+        "totalQuantity": sum(item["quantity"] for item in items),
+        "items": items,
+    }
+
+# 定期掃描 (worker 排程)：新進入提醒範圍的批次透過 rfid_updates 頻道推播 EXPIRY_ALERT
+@periodic_job("expiry.scan", lambda: settings.EXPIRY_SCAN_INTERVAL)
+def expiry_scan_job(ctx, payload):
+    alerts = scan_expiry_alerts(ctx.db, ctx.client, settings.EXPIRY_ALERT_DAYS)
+    timestamp = int(datetime.now().timestamp() * 1000)
+    for alert in alerts:
+        publish_redis_message({
+            "event": "EXPIRY_ALERT",
+            "data": {**alert, "expireDate": alert["expireDate"].isoformat(), "timestamp": timestamp}
+        })
+
+    if alerts:
+        logger.info(f"🗓️ Published {len(alerts)} expiry alerts")
+    return {"alerts": len(alerts)}
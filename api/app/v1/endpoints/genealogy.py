@@ -0,0 +1,37 @@
+# app/v1/endpoints/genealogy.py
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import User
+from app.schemas import BatchGenealogyResponse, BasketGenealogyResponse
+from app.core.security import require_permission
+from app.core.permissions import Perms
+from app.core.genealogy import batch_genealogy, basket_genealogy
+from app.core.profiling import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+# 1. 正向追溯 (回收)：批次 -> 籃子 -> 倉庫 -> 出貨單
+@router.get("/batch/{batch_code}", response_model=BatchGenealogyResponse)
+def read_batch_genealogy(
+    batch_code: str,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.BASKET_READ))
+):
+    genealogy = batch_genealogy(db, batch_code)
+    if not genealogy["baskets"]:
+        raise HTTPException(status_code=404, detail="No movements recorded for this batch")
+    return genealogy
+
+# 2. 反向追溯：籃子曾裝過哪些批次
+@router.get("/basket/{rfid}", response_model=BasketGenealogyResponse)
+def read_basket_genealogy(
+    rfid: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.BASKET_READ))
+):
+    return basket_genealogy(db, rfid, since, until)
@@ -0,0 +1,38 @@
+# app/v1/endpoints/jobs.py
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from app.models import User
+from app.schemas import JobResponse
+from app.core.security import get_current_user
+from app.core.permissions import Perms
+from app.core.metrics import InstrumentedRedis
+from app.core.jobs import get_job, list_user_jobs
+from app.core.profiling import ProfiledRoute
+
+router = APIRouter(route_class=ProfiledRoute)
+
+r = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+# 1. 我的背景工作 (新到舊)
+@router.get("/", response_model=List[JobResponse])
+def read_my_jobs(
+    limit: int = 20,
+    current_user: User = Depends(get_current_user)
+):
+    return list_user_jobs(r, current_user.username, min(limit, 50))
+
+# 2. 查詢工作狀態與進度 (App 輪詢)
+@router.get("/{job_id}", response_model=JobResponse)
+def read_job(
+    job_id: str,
+    current_user: User = Depends(get_current_user)
+):
+    job = get_job(r, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    # 只能查看自己的工作 (IT Admin 除外)
+    if job["createdBy"] != current_user.username and Perms.SUPER_ADMIN not in current_user.get_all_permissions():
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job
@@ -1,22 +1,30 @@
 # api/app/v1/endpoints/production.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
+from typing import Optional, List
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.models import Batch, Product, User
 from app.schemas import (
     BatchCreate, BatchUpdate, BatchResponse, ProductResponse, 
-    ProductAppResponse, BatchAppResponse
+    ProductAppResponse, BatchAppResponse, BatchDriftReport, JobAcceptedResponse
 )
-from app.core.security import require_permission
+from app.core.security import require_permission, get_current_user
 from app.core.permissions import Perms
-from app.v1.endpoints.auth import get_current_user
+from app.core.encoding import compact_response, query_rows, fast_response
+from app.core.profiling import ProfiledRoute
+from app.core.metrics import InstrumentedRedis
+from app.core.jobs import enqueue_job, job_handler
+from app.core.reconciliation import batch_drift, run_reconciliation, last_reconciliation, DIRTY_KEY
+from app.core.expiry import index_batch_expiry, remove_batch_expiry
 from datetime import datetime, timedelta, date
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
+r = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
 
 # 查詢某天的生產工序
 @router.get("/", response_model=list[BatchResponse])
 def read_batches(
+    request: Request,
     target_date: date = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_permission(Perms.PRODUCTION_READ))
@@ -29,12 +37,19 @@ def read_batches(
     start = datetime.combine(target_date, datetime.min.time())
     end = datetime.combine(target_date, datetime.max.time())
     
-    batches = db.query(Batch).filter(
+    query = db.query(Batch).filter(
         Batch.productionDate >= start,
         Batch.productionDate <= end
-    ).all()
+    )
+
+    fields = list(BatchResponse.model_fields)
+    batches = query_rows(query, Batch, fields)
+    # BatchResponse.productionDate 為 date 型別
+    for batch in batches:
+        if batch["productionDate"]:
+            batch["productionDate"] = batch["productionDate"].date()
     
-    return batches
+    return fast_response(request, batches, fields)
 
 # 新增生產批次
 @router.post("/", response_model=BatchResponse)
@@ -80,30 +95,21 @@ def create_batch(
     db.add(new_batch)
     db.commit()
     db.refresh(new_batch)
+    index_batch_expiry(r, [new_batch])
     return new_batch
 
-# 修改批次 (需檢查日期權限)
-@router.put("/{bid}", response_model=BatchResponse)
-def update_batch(
-    bid: int,
-    batch_update: BatchUpdate,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(require_permission(Perms.PRODUCTION_CREATE))
-):
-    batch = db.query(Batch).filter(Batch.bid == bid).first()
-    if not batch:
-        raise HTTPException(status_code=404, detail="Batch not found")
-    
+# 輔助函式：檢查日期/停止權限並套用批次修改 (update_batch 與 sync 共用，不 commit)
+def apply_batch_update(batch: Batch, batch_update: BatchUpdate, current_user: User):
     today = date.today()
     batch_date = batch.productionDate.date()
-    perms = current_user.get_all_permissions()
+    perms = current_user.get_all_permissions() # * 與 production:* 萬用字元由權限集合自動涵蓋
 
     if batch_date < today:
-        if Perms.SUPER_ADMIN not in perms and Perms.PRODUCTION_EDIT_HISTORY not in perms:
+        if Perms.PRODUCTION_EDIT_HISTORY not in perms:
             raise HTTPException(status_code=403, detail="Permission denied: Cannot edit past production records")
 
     if batch_update.status == "STOPPED":
-        if Perms.SUPER_ADMIN not in perms and Perms.PRODUCTION_STOP not in perms:
+        if Perms.PRODUCTION_STOP not in perms:
             raise HTTPException(status_code=403, detail="Permission denied: Cannot stop production")
 
     if batch_update.targetQuantity is not None:
@@ -127,8 +133,23 @@ def update_batch(
     if batch_update.status is not None:
         batch.status = batch_update.status
 
+# 修改批次 (需檢查日期權限)
+@router.put("/{bid}", response_model=BatchResponse)
+def update_batch(
+    bid: int,
+    batch_update: BatchUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.PRODUCTION_CREATE))
+):
+    batch = db.query(Batch).filter(Batch.bid == bid).first()
+    if not batch:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    
+    apply_batch_update(batch, batch_update, current_user)
+
     db.commit()
     db.refresh(batch)
+    index_batch_expiry(r, [batch])
     return batch
 
 # 刪除批次 (需檢查日期權限)
@@ -148,13 +169,55 @@ def delete_batch(
     
     if batch_date < today:
         perms = current_user.get_all_permissions()
-        if Perms.SUPER_ADMIN not in perms and Perms.PRODUCTION_DELETE_HISTORY not in perms:
+        if Perms.PRODUCTION_DELETE_HISTORY not in perms:
             raise HTTPException(status_code=403, detail="Permission denied: Cannot delete past production records")
 
+    batch_code = batch.batch_code
     db.delete(batch)
     db.commit()
+    remove_batch_expiry(r, [batch_code])
     return {"message": "Batch deleted"}
 
+"""
+批次對帳 (producedQuantity / remainingQuantity 以籃子資料重新計算)
+"""
+# 差異報表 (唯讀)：預設檢查全部批次，可指定 batch_code
+@router.get("/reconciliation/drift", response_model=BatchDriftReport)
+def read_batch_drift(
+    batch_code: Optional[List[str]] = Query(default=None),
+    limit: int = 200,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.PRODUCTION_READ))
+):
+    checked, drift = batch_drift(db, batch_code)
+    try:
+        pending = r.scard(DIRTY_KEY)
+    except Exception:
+        pending = 0
+
+    return {
+        "checked": checked,
+        "drifted": len(drift),
+        "pending": pending,
+        "items": drift[:limit],
+        "lastRun": last_reconciliation(r),
+    }
+
+# 執行對帳 (背景工作)：預設只處理有異動的批次，full=true 處理全部批次
+@router.post("/reconciliation", response_model=JobAcceptedResponse, status_code=202)
+def start_reconciliation(
+    full: bool = False,
+    current_user: User = Depends(require_permission(Perms.PRODUCTION_EDIT_HISTORY))
+):
+    job_id = enqueue_job(r, "batches.reconcile", {"full": full}, current_user.username)
+    return {"job_id": job_id, "status": "QUEUED"}
+
+@job_handler("batches.reconcile")
+def reconcile_batches_job(ctx, payload):
+    summary = run_reconciliation(ctx.db, ctx.client, full=payload.get("full", False))
+    ctx.progress(summary["checked"], summary["checked"])
+    return {"mode": summary["mode"], "checked": summary["checked"], "updated": summary["updated"]}
+
 """
 App 端
 """
@@ -174,6 +237,7 @@ def get_batch_by_code(
 
 @router.get("/daily-products", response_model=list[ProductAppResponse])
 def get_daily_production_products(
+    request: Request,
     target_date: date = None,
     db: Session = Depends(get_db),
     # 視 App 需求，這裡可以放寬權限，例如只要是登入用戶 (User) 即可，不一定要 Production Admin
@@ -203,10 +267,15 @@ def get_daily_production_products(
 
     products = db.query(Product).filter(Product.itemcode.in_(itemcode_list)).all()
     
+    compact = compact_response(request, products, ProductAppResponse.model_fields)
+    if compact:
+        return compact
+
     return products
 
 @router.get("/app-list", response_model=list[BatchAppResponse])
 def read_batches_app(
+    request: Request,
     target_date: date = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -222,4 +291,8 @@ def read_batches_app(
         Batch.productionDate <= end
     ).all()
     
+    compact = compact_response(request, batches, BatchAppResponse.model_fields)
+    if compact:
+        return compact
+
     return batches
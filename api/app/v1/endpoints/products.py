@@ -1,17 +1,17 @@
 # api/app/v1/endpoints/products.py
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, Request
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
-from app.database import get_db
+from app.database import get_db, settings
 from app.models import Product, User
 from app.schemas import ProductCreate, ProductUpdate, ProductResponse, ProductListResponse
 from app.core.security import require_permission
 from app.core.permissions import Perms
-import shutil
-import os
-import uuid
+from app.core.profiling import ProfiledRoute
+from app.core.images import receive_image_upload, store_image, ImageTooLarge, InvalidImage
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 # 1. 取得產品列表
 @router.get("/", response_model=ProductListResponse)
@@ -78,26 +78,31 @@ def update_product(
     db.refresh(product)
     return product
 
-# 4. 圖片上傳接口
-@router.post("/upload")
-def upload_product_image(
-    file: UploadFile = File(...),
+# 4. 圖片上傳接口 (multipart 欄位 file；串流寫入、內容雜湊命名並產生 WebP 大圖與縮圖)
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {"multipart/form-data": {"schema": {
+            "type": "object",
+            "properties": {"file": {"type": "string", "format": "binary"}},
+            "required": ["file"],
+        }}},
+    }
+}
+
+@router.post("/upload", openapi_extra=UPLOAD_REQUEST_BODY)
+async def upload_product_image(
+    request: Request,
     current_user: User = Depends(require_permission(Perms.SUPER_ADMIN))
 ):
     try:
-        # 1. 產生唯一檔名，防止覆蓋
-        file_ext = file.filename.split(".")[-1]
-        new_filename = f"{uuid.uuid4()}.{file_ext}"
-        file_path = f"static/images/{new_filename}"
-        
-        # 2. 存檔
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # 3. 回傳 URL (相對路徑或完整路徑皆可，這裡回傳相對路徑)
-        # 前端顯示時需要補上 Base URL
-        return {"filename": new_filename, "url": f"/static/images/{new_filename}"}
-        
+        upload = await receive_image_upload(request, "file", settings.IMAGE_MAX_UPLOAD_BYTES)
+        # 回傳相對路徑，前端顯示時需要補上 Base URL；url 為原圖 (相同內容重複上傳時回傳既有檔案)
+        return await run_in_threadpool(store_image, upload)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Image upload failed: {str(e)}")
 
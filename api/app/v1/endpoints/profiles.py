@@ -0,0 +1,55 @@
+# app/v1/endpoints/profiles.py
+import os
+import re
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, PlainTextResponse
+from app.models import User
+from app.schemas import ProfileEntry
+from app.core.security import require_permission
+from app.core.permissions import Perms
+from app.core.profiling import list_profiles, profile_path, profile_summary
+
+router = APIRouter()
+
+_PROFILE_ID = re.compile(r"^[0-9a-f]{12}$")
+
+def resolve_profile(profile_id: str) -> str:
+    path = profile_path(profile_id, "prof")
+    if not _PROFILE_ID.match(profile_id) or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return path
+
+# 1. 列出已記錄的 profile (新到舊)
+@router.get("/", response_model=List[ProfileEntry])
+def read_profiles(
+    route: str = None,
+    limit: int = 50,
+    current_user: User = Depends(require_permission(Perms.SUPER_ADMIN))
+):
+    items = list_profiles()
+    if route:
+        items = [item for item in items if item["route"].startswith(route) or item["path"].startswith(route)]
+    return items[:limit]
+
+# 2. 下載 .prof (pstats 格式，snakeviz / flameprof 可轉成 flame graph)
+@router.get("/{profile_id}")
+def download_profile(
+    profile_id: str,
+    current_user: User = Depends(require_permission(Perms.SUPER_ADMIN))
+):
+    path = resolve_profile(profile_id)
+    return FileResponse(path, media_type="application/octet-stream", filename=f"{profile_id}.prof")
+
+# 3. 文字摘要 (依累計時間排序的前 N 個函式)
+@router.get("/{profile_id}/summary", response_class=PlainTextResponse)
+def read_profile_summary(
+    profile_id: str,
+    sort: str = "cumulative",
+    limit: int = 40,
+    current_user: User = Depends(require_permission(Perms.SUPER_ADMIN))
+):
+    resolve_profile(profile_id)
+    if sort not in ("cumulative", "tottime", "calls"):
+        raise HTTPException(status_code=400, detail="sort must be cumulative, tottime or calls")
+    return profile_summary(profile_id, sort, limit)
@@ -0,0 +1,301 @@
+# app/v1/endpoints/shipping.py
+import json
+import logging
+import uuid
+from datetime import datetime, date
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import select, update, func, case, exists
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import Basket, Batch, Shipment, ShipmentItem, Warehouse, User
+from app.schemas import ShipmentAllocateRequest, ShipmentResponse, ShipmentSummary
+from app.core.security import require_permission
+from app.core.permissions import Perms
+from app.core.metrics import InstrumentedRedis, BULK_BATCH_SIZE
+from app.core.reconciliation import mark_batches_dirty
+from app.core.genealogy import record_movements
+from app.core.profiling import ProfiledRoute
+from app.core.lifecycle import drains_on_shutdown
+from app.v1.endpoints.baskets import invalidate_basket_cache, publish_redis_message
+
+router = APIRouter(route_class=ProfiledRoute)
+logger = logging.getLogger("uvicorn")
+r = InstrumentedRedis(host='localhost', port=6379, db=0)
+
+SHIPMENT_MAX_LINES = 200
+CONFIRM_CHUNK = 300  # SQL Server 單一語句最多 2100 個參數；每個籃子最多 5 個 (bid IN、配貨數量 CASE 2 個、整籃 IN 或部分數量 CASE 2 個)
+
+# 1. 配貨 (FEFO)：依到期日先出，一次查詢產生揀貨清單並保留籃子
+@router.post("/allocate", response_model=ShipmentResponse)
+def allocate_shipment(
+    request: ShipmentAllocateRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.SHIPPING_OP))
+):
+    if not request.lines:
+        raise HTTPException(status_code=400, detail="Order has no lines")
+    if len(request.lines) > SHIPMENT_MAX_LINES:
+        raise HTTPException(status_code=413, detail=f"Too many lines (max {SHIPMENT_MAX_LINES} per order)")
+
+    if not db.query(Warehouse.wid).filter(Warehouse.warehouseId == request.warehouseId).first():
+        raise HTTPException(status_code=404, detail="Warehouse not found")
+
+    # 同一產品出現多行時合併
+    requested = {}
+    for line in request.lines:
+        requested[line.itemcode] = requested.get(line.itemcode, 0) + line.quantity
+
+    BULK_BATCH_SIZE.labels("shipping:allocate").observe(len(requested))
+
+    picks = allocate_fefo(db, request.warehouseId, requested)
+
+    shipment = Shipment(
+        shipmentNo=f"SH-{datetime.now():%Y%m%d}-{uuid.uuid4().hex[:6].upper()}",
+        warehouseId=request.warehouseId,
+        reference=request.reference,
+        lines=json.dumps([{"itemcode": code, "quantity": qty} for code, qty in requested.items()]),
+        status="ALLOCATED",
+        createdBy=current_user.username,
+        createdAt=datetime.now(),
+    )
+    db.add(shipment)
+    db.flush()
+
+    items = [ShipmentItem(shipmentId=shipment.id, **pick) for pick in picks]
+    db.add_all(items)
+    db.commit()
+
+    logger.info(f"🚚 [Shipping] {shipment.shipmentNo}: {len(items)} baskets allocated for {len(requested)} items")
+    return shipment_response(shipment, items)
+
+# 2. 出貨單列表 (新到舊)
+@router.get("/", response_model=List[ShipmentSummary])
+def read_shipments(
+    status: Optional[str] = None,
+    warehouseId: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.SHIPPING_OP))
+):
+    query = db.query(Shipment)
+    if status:
+        query = query.filter(Shipment.status == status)
+    if warehouseId:
+        query = query.filter(Shipment.warehouseId == warehouseId)
+    return query.order_by(Shipment.id.desc()).limit(min(limit, 200)).all()
+
+# 3. 出貨單明細 (揀貨清單)
+@router.get("/{shipment_id}", response_model=ShipmentResponse)
+def read_shipment(
+    shipment_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.SHIPPING_OP))
+):
+    shipment = get_shipment_or_404(db, shipment_id)
+    items = db.query(ShipmentItem).filter(ShipmentItem.shipmentId == shipment.id).all()
+    return shipment_response(shipment, items)
+
+# 4. 確認出貨：籃子與批次庫存以 set-based UPDATE 在同一個交易內扣除
+@router.post("/{shipment_id}/confirm", response_model=ShipmentResponse)
+@drains_on_shutdown
+def confirm_shipment(
+    shipment_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.SHIPPING_OP))
+):
+    shipment = get_shipment_or_404(db, shipment_id)
+    items = db.query(ShipmentItem).filter(ShipmentItem.shipmentId == shipment.id).all()
+    now = datetime.now()
+
+    # 先鎖定出貨單狀態，避免重複確認或與取消同時進行
+    claim_allocated_shipment(db, shipment.id, status="SHIPPED", confirmedBy=current_user.username, confirmedAt=now)
+
+    shipped = 0
+    for start in range(0, len(items), CONFIRM_CHUNK):
+        shipped += ship_baskets(db, shipment.warehouseId, items[start:start + CONFIRM_CHUNK], current_user.username, now)
+
+    if shipped != len(items):
+        # 配貨後有籃子被移動、清空或修改數量：整張出貨單不套用，需重新配貨
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Some allocated baskets changed since allocation; cancel and re-allocate")
+
+    record_movements(db, [
+        {
+            "batchCode": item.batchCode,
+            "rfid": item.rfid,
+            "bid": item.bid,
+            "warehouseId": shipment.warehouseId,
+            "status": "SHIPPED" if item.quantity >= item.basketQuantity else "IN_STOCK",
+            "quantity": item.quantity,
+            "eventType": "Shipping",
+            "shipmentNo": shipment.shipmentNo,
+            "producedDelta": 0,
+            "createdAt": now,
+            "createdBy": current_user.username,
+        }
+        for item in items if item.batchCode
+    ])
+
+    per_batch = {}
+    for item in items:
+        if item.batchCode:
+            per_batch[item.batchCode] = per_batch.get(item.batchCode, 0) + item.quantity
+    if per_batch:
+        db.execute(
+            update(Batch)
+            .where(Batch.batch_code.in_(list(per_batch)))
+            .values(remainingQuantity=Batch.remainingQuantity - case(per_batch, value=Batch.batch_code, else_=0))
+            .execution_options(synchronize_session=False)
+        )
+
+    db.commit()
+    db.refresh(shipment)
+
+    rfids = [item.rfid for item in items]
+    invalidate_basket_cache(rfids)
+    mark_batches_dirty(r, per_batch)
+    publish_redis_message({
+        "event": "SHIPMENT_CONFIRMED",
+        "data": {
+            "shipmentNo": shipment.shipmentNo,
+            "warehouseId": shipment.warehouseId,
+            "rfids": rfids,
+            "timestamp": int(now.timestamp() * 1000)
+        }
+    })
+
+    logger.info(f"🚚 [Shipping] {shipment.shipmentNo} confirmed: {len(items)} baskets")
+    return shipment_response(shipment, items)
+
+# 5. 取消配貨 (釋放保留的籃子)
+@router.post("/{shipment_id}/cancel", response_model=ShipmentResponse)
+def cancel_shipment(
+    shipment_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.SHIPPING_OP))
+):
+    shipment = get_shipment_or_404(db, shipment_id)
+    claim_allocated_shipment(db, shipment.id, status="CANCELLED")
+    db.commit()
+    db.refresh(shipment)
+    items = db.query(ShipmentItem).filter(ShipmentItem.shipmentId == shipment.id).all()
+    return shipment_response(shipment, items)
+
+# 輔助函式：以條件式 UPDATE 將 ALLOCATED 的出貨單改為新狀態 (確認與取消同時進行時只有一個成功)，失敗回 409
+def claim_allocated_shipment(db: Session, shipment_id: int, **values):
+    claimed = db.execute(
+        update(Shipment)
+        .where(Shipment.id == shipment_id, Shipment.status == "ALLOCATED")
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if claimed != 1:
+        db.rollback()
+        current = db.query(Shipment.status).filter(Shipment.id == shipment_id).scalar()
+        raise HTTPException(status_code=409, detail=f"Shipment is {current}, not ALLOCATED")
+
+# 輔助函式：FEFO 配貨查詢
+def allocate_fefo(db: Session, warehouse_id: str, requested: dict):
+    """
+    依產品分組、依批次到期日 (同日再依生產日、bid) 累加籃子數量，
+    取到累計量剛好滿足需求為止；最後一個籃子可能只取部分。
+    已被其他 ALLOCATED 出貨單保留的籃子、已過期批次不列入。
+    """
+    reserved = exists().where(
+        ShipmentItem.bid == Basket.bid,
+        ShipmentItem.shipmentId == Shipment.id,
+        Shipment.status == "ALLOCATED",
+    )
+    cumulative = func.sum(Basket.quantity).over(
+        partition_by=Basket.itemcode,
+        order_by=(Batch.expireDate, Basket.productionDate, Basket.bid),
+        rows=(None, 0),
+    )
+    stock = select(
+        Basket.bid,
+        Basket.rfid,
+        Basket.itemcode,
+        Basket.batchCode,
+        Basket.quantity,
+        Batch.expireDate,
+        cumulative.label("cumulative"),
+        case(requested, value=Basket.itemcode).label("requested"),
+    ).join(
+        Batch, Batch.batch_code == Basket.batchCode
+    ).where(
+        Basket.warehouseId == warehouse_id,
+        Basket.status == "IN_STOCK",
+        Basket.itemcode.in_(list(requested)),
+        Basket.quantity > 0,
+        Batch.expireDate >= datetime.combine(date.today(), datetime.min.time()),
+        ~reserved,
+    ).subquery("stock")
+
+    rows = db.execute(
+        select(stock)
+        .where(stock.c.cumulative - stock.c.quantity < stock.c.requested)
+        .order_by(stock.c.itemcode, stock.c.cumulative)
+    ).all()
+
+    return [
+        {
+            "bid": row.bid,
+            "rfid": row.rfid,
+            "itemcode": row.itemcode,
+            "batchCode": row.batchCode,
+            "expireDate": row.expireDate,
+            "basketQuantity": row.quantity,
+            "quantity": min(row.quantity, row.requested - (row.cumulative - row.quantity)),
+        }
+        for row in rows
+    ]
+
+# 輔助函式：一個 chunk 的籃子出貨 (整籃 -> SHIPPED，部分 -> 扣數量)；回傳實際更新筆數
+def ship_baskets(db: Session, warehouse_id: str, items, username: str, now: datetime):
+    bids = [item.bid for item in items]
+    full_bids = [item.bid for item in items if item.quantity >= item.basketQuantity]
+    partial = {item.bid: item.quantity for item in items if item.quantity < item.basketQuantity}
+    allocated_quantity = {item.bid: item.basketQuantity for item in items}
+
+    values = {"lastUpdated": now, "updateBy": username}
+    if full_bids:
+        values["status"] = case((Basket.bid.in_(full_bids), "SHIPPED"), else_=Basket.status)
+    if partial:
+        values["quantity"] = Basket.quantity - case(partial, value=Basket.bid, else_=0)
+
+    # 只更新仍在該倉庫、在庫且數量與配貨時相同的籃子
+    return db.execute(
+        update(Basket)
+        .where(
+            Basket.bid.in_(bids),
+            Basket.warehouseId == warehouse_id,
+            Basket.status == "IN_STOCK",
+            Basket.quantity == case(allocated_quantity, value=Basket.bid),
+        )
+        .values(**values)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+def get_shipment_or_404(db: Session, shipment_id: int):
+    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    if not shipment:
+        raise HTTPException(status_code=404, detail="Shipment not found")
+    return shipment
+
+def shipment_response(shipment: Shipment, items):
+    lines = json.loads(shipment.lines) if shipment.lines else []
+    allocated = {}
+    for item in items:
+        allocated[item.itemcode] = allocated.get(item.itemcode, 0) + item.quantity
+
+    return {
+        **ShipmentSummary.model_validate(shipment).model_dump(),
+        "lines": lines,
+        "items": items,
+        "shortages": [
+            {"itemcode": line["itemcode"], "requested": line["quantity"], "allocated": allocated.get(line["itemcode"], 0)}
+            for line in lines
+            if allocated.get(line["itemcode"], 0) < line["quantity"]
+        ],
+    }
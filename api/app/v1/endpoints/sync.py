@@ -0,0 +1,212 @@
+# app/v1/endpoints/sync.py
+from fastapi import APIRouter, Depends, HTTPException, Header
+from sqlalchemy.orm import Session
+from app.database import get_db
+from app.models import Basket, Batch, User
+from app.schemas import SyncMutationRequest, SyncMutationResponse, BasketCommonData
+from app.core.security import get_current_user
+from app.v1.endpoints.baskets import (
+    apply_basket_update, apply_production_increments,
+    basket_update_message, publish_redis_message, invalidate_basket_cache,
+    bypasses_shipping, SHIPPING_BYPASS_MESSAGE
+)
+from app.v1.endpoints.production import apply_batch_update
+from app.core.permissions import Perms
+from datetime import datetime
+from app.core.metrics import InstrumentedRedis, BULK_BATCH_SIZE
+from app.core.profiling import ProfiledRoute
+from app.core.reconciliation import mark_batches_dirty
+from app.core.genealogy import record_movements
+from app.core.lifecycle import drains_on_shutdown
+import logging
+
+router = APIRouter(route_class=ProfiledRoute)
+logger = logging.getLogger("uvicorn")
+r = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
+
+SYNC_MAX_OPS = 2000          # 單次請求最多可回放的操作數
+SYNC_CHUNK_SIZE = 200        # 每個交易 (chunk) 處理的操作數
+SYNC_OP_TTL = 7 * 24 * 3600  # 已套用 opId 的保留時間 (秒)
+
+# 離線操作佇列回放 (App 重新連線後呼叫)
+@router.post("/mutations", response_model=SyncMutationResponse)
+@drains_on_shutdown
+def sync_mutations(
+    body: SyncMutationRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+    x_device_id: str | None = Header(default=None)
+):
+    """
+    依序回放 App 離線期間累積的籃子/批次操作，並回傳每筆操作的結果。
+    - 每 SYNC_CHUNK_SIZE 筆為一個交易，chunk 內的籃子與批次一次查出
+    - 籃子操作以 Basket.lastUpdated 檢查衝突：伺服器版本比 baseLastUpdated (未提供時用 clientTimestamp) 新即為 CONFLICT，force=true 可強制覆蓋
+    - 已套用的 opId 會記錄在 Redis，App 重送時回傳 DUPLICATE 而不會重複累加；
+      同一次請求中重複的 opId 只處理第一筆，其餘回傳 DUPLICATE
+    """
+    if len(body.mutations) > SYNC_MAX_OPS:
+        raise HTTPException(status_code=413, detail=f"Too many mutations (max {SYNC_MAX_OPS} per request)")
+
+    BULK_BATCH_SIZE.labels("sync").observe(len(body.mutations))
+
+    source = x_device_id or current_user.username
+    results = []
+    request_ops = set()
+    base_versions = {}
+
+    for start in range(0, len(body.mutations), SYNC_CHUNK_SIZE):
+        chunk = body.mutations[start:start + SYNC_CHUNK_SIZE]
+        results.extend(apply_mutation_chunk(db, chunk, current_user, source, request_ops, base_versions))
+
+    applied = sum(1 for result in results if result["status"] == "APPLIED")
+    logger.info(f"🔄 [Sync] {source}: {applied}/{len(results)} mutations applied")
+
+    return {"applied": applied, "results": results}
+
+# 輔助函式：在單一交易內套用一個 chunk 的操作
+# request_ops：本次請求已出現過的 opId (跨 chunk)，App 重試時可能在同一次請求中重送相同操作
+# base_versions：本次請求回放前各籃子的 lastUpdated (跨 chunk)，較早 chunk 已 commit 的修改不算衝突
+def apply_mutation_chunk(db: Session, chunk, current_user: User, source: str,
+                         request_ops: set = None, base_versions: dict = None):
+    request_ops = set() if request_ops is None else request_ops
+    base_versions = {} if base_versions is None else base_versions
+    op_keys = [f"sync:op:{source}:{m.opId}" for m in chunk]
+    try:
+        seen = r.mget(op_keys)
+    except Exception as e:
+        logger.warning(f"⚠️ Redis dedupe lookup failed: {e}")
+        seen = [None] * len(chunk)
+
+    # 一次撈出本 chunk 用到的籃子與批次，避免逐筆查詢
+    rfids = {m.basket.rfid for m in chunk if m.entity == "basket" and m.basket}
+    codes = {m.batch.batch_code for m in chunk if m.entity == "batch" and m.batch}
+    baskets = {b.rfid: b for b in db.query(Basket).filter(Basket.rfid.in_(rfids))} if rfids else {}
+    batches = {b.batch_code: b for b in db.query(Batch).filter(Batch.batch_code.in_(codes))} if codes else {}
+
+    # 衝突一律以回放前的版本判斷，同一次回放中較早的操作不會讓後面的操作變成衝突
+    for rfid, b in baskets.items():
+        base_versions.setdefault(rfid, b.lastUpdated)
+
+    perms = current_user.get_all_permissions()
+    can_edit_batch = Perms.PRODUCTION_CREATE in perms
+    common = BasketCommonData()
+
+    results = []
+    messages = {}
+    production_increments = {}
+    touched_batches = set()
+    movements = []
+
+    for mutation, previous in zip(chunk, seen):
+        result = {"opId": mutation.opId, "status": "APPLIED", "message": None, "serverLastUpdated": None}
+        results.append(result)
+
+        if mutation.opId in request_ops:
+            result["status"] = "DUPLICATE"
+            result["message"] = "Repeated in this request"
+            continue
+        request_ops.add(mutation.opId)
+
+        if previous:
+            result["status"] = "DUPLICATE"
+            result["message"] = "Already applied"
+            continue
+
+        if mutation.entity == "basket":
+            if not mutation.basket:
+                result["status"] = "REJECTED"
+                result["message"] = "Missing basket data"
+                continue
+
+            if bypasses_shipping(mutation.updateType, mutation.basket, common):
+                result["status"] = "REJECTED"
+                result["message"] = SHIPPING_BYPASS_MESSAGE
+                continue
+
+            basket = baskets.get(mutation.basket.rfid)
+            if not basket:
+                result["status"] = "NOT_FOUND"
+                result["message"] = "Basket not found"
+                continue
+
+            server_version = base_versions.get(basket.rfid)
+            client_version = to_server_time(mutation.baseLastUpdated or mutation.clientTimestamp)
+            if not mutation.force and server_version and server_version > client_version:
+                result["status"] = "CONFLICT"
+                result["message"] = "Basket was updated on the server after this operation"
+                result["serverLastUpdated"] = server_version
+                continue
+
+            apply_basket_update(
+                basket, mutation.basket, common, mutation.updateType,
+                current_user.username, production_increments, touched_batches, movements
+            )
+            # 推播內容在 commit 前組好，避免 commit 後逐筆 refresh
+            messages[basket.rfid] = basket_update_message(basket)
+            result["serverLastUpdated"] = basket.lastUpdated
+
+        elif mutation.entity == "batch":
+            if not mutation.batch:
+                result["status"] = "REJECTED"
+                result["message"] = "Missing batch data"
+                continue
+
+            if not can_edit_batch:
+                result["status"] = "REJECTED"
+                result["message"] = f"Permission denied. Required: {Perms.PRODUCTION_CREATE.value}"
+                continue
+
+            batch = batches.get(mutation.batch.batch_code)
+            if not batch:
+                result["status"] = "NOT_FOUND"
+                result["message"] = "Batch not found"
+                continue
+
+            try:
+                apply_batch_update(batch, mutation.batch, current_user)
+            except HTTPException as e:
+                result["status"] = "REJECTED"
+                result["message"] = e.detail
+
+        else:
+            result["status"] = "REJECTED"
+            result["message"] = f"Unknown entity: {mutation.entity}"
+
+    if production_increments:
+        apply_production_increments(db, production_increments)
+
+    try:
+        record_movements(db, movements)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"❌ [Sync] Chunk commit failed: {e}")
+        for result in results:
+            if result["status"] == "APPLIED":
+                result["status"] = "ERROR"
+                result["message"] = str(e)
+                result["serverLastUpdated"] = None
+        return results
+
+    invalidate_basket_cache(list(messages))
+    mark_batches_dirty(r, touched_batches)
+    for message in messages.values():
+        publish_redis_message(message)
+
+    applied_keys = [key for key, result in zip(op_keys, results) if result["status"] == "APPLIED"]
+    if applied_keys:
+        try:
+            pipe = r.pipeline()
+            for key in applied_keys:
+                pipe.setex(key, SYNC_OP_TTL, "APPLIED")
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"⚠️ Redis dedupe record failed: {e}")
+
+    return results
+
+# 輔助函式：App 送來的時間可能帶時區，轉成伺服器本地時間 (與 lastUpdated 一致) 再比較
+def to_server_time(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
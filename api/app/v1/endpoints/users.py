@@ -1,17 +1,20 @@
 # app/v1/endpoints/users.py
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from app.database import get_db
 from app.models import User
 from app.schemas import UserCreate, UserResponse, UserListResponse, UserUpdateAdmin, UserPasswordUpdate
 from app.core.security import require_permission
-from app.core.permissions import Perms
-from app.utils import get_password_hash, verify_password
-from app.v1.endpoints.auth import get_current_user
+from app.core.permissions import Perms, resolve_permissions
+from app.core.encoding import ORJSONResponse
+from app.core.passwords import hash_password, hash_password_async, verify_password_async
+from app.core.security import get_current_user
+from app.core.profiling import ProfiledRoute
 import json
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
 
 @router.get("/", response_model=UserListResponse)
 def read_users(
@@ -32,22 +35,27 @@ def read_users(
     #     query = query.filter(User.department == current_user.department)
 
     total = query.count()
-    users = query.order_by(User.uid).offset((page - 1) * page_size).limit(page_size).all()
+    page_query = query.order_by(User.uid).offset((page - 1) * page_size).limit(page_size)
+    rows = page_query.with_entities(
+        User.uid, User.username, User.name, User.role, User.department,
+        User.is_active, User.last_login, User.permissions
+    ).all()
 
+    # resolve_permissions 依 (role, department, permissions) 快取，同組合只解析一次
     items = []
-    for user in users:
+    for row in rows:
         items.append({
-            "uid": user.uid,
-            "username": user.username,
-            "name": user.name,
-            "role": user.role,
-            "department": user.department,
-            "is_active": user.is_active,
-            "last_login": user.last_login,
-            "permissions": list(user.get_all_permissions()) 
+            "uid": row.uid,
+            "username": row.username,
+            "name": row.name,
+            "role": row.role,
+            "department": row.department,
+            "is_active": row.is_active,
+            "last_login": row.last_login,
+            "permissions": list(resolve_permissions(row.role, row.department, row.permissions))
         })
     
-    return {"total": total, "items": items}
+    return ORJSONResponse({"total": total, "items": items})
 
 @router.post("/", response_model=UserResponse)
 def create_user(
@@ -72,7 +80,7 @@ def create_user(
 
     new_user = User(
         username=new_user_data.username,
-        password_hash=get_password_hash(new_user_data.password),
+        password_hash=hash_password(new_user_data.password),
         name=new_user_data.name,
         role=new_user_data.role,
         department=new_user_data.department,
@@ -122,7 +130,7 @@ def update_user(
     
     # 重設密碼
     if user_in.password:
-        user.password_hash = get_password_hash(user_in.password)
+        user.password_hash = hash_password(user_in.password)
     
     # 修改權限
     if user_in.extra_permissions is not None:
@@ -157,15 +165,28 @@ def delete_user(
     return {"message": "User deleted"}
 
 @router.put("/me/password")
-def update_my_password(
+async def update_my_password(
     password_in: UserPasswordUpdate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    # 驗證舊密碼
-    if not verify_password(password_in.current_password, current_user.password_hash):
+    # 取得 hash 後結束 get_current_user 開啟的交易，雜湊期間不佔用 DB 連線 (與登入相同)
+    uid, password_hash = current_user.uid, current_user.password_hash
+    await run_in_threadpool(db.rollback)
+
+    # 驗證舊密碼 (bcrypt 在密碼池執行，不佔用 threadpool)
+    verified, _ = await verify_password_async(password_in.current_password, password_hash)
+    if not verified:
         raise HTTPException(status_code=400, detail="Incorrect current password")
     
-    current_user.password_hash = get_password_hash(password_in.new_password)
-    db.commit()
+    new_hash = await hash_password_async(password_in.new_password)
+    await run_in_threadpool(save_password_hash, db, uid, new_hash)
     return {"message": "Password updated successfully"}
+
+# 輔助函式：重新載入使用者並寫入新的密碼 hash
+def save_password_hash(db: Session, uid: int, password_hash: str):
+    user = db.query(User).filter(User.uid == uid).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.password_hash = password_hash
+    db.commit()
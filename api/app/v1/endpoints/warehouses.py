@@ -1,18 +1,26 @@
 # api/app/v1/endpoints/warehouses.py
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Query
 from sqlalchemy.orm import Session
+from sqlalchemy import or_, and_, func, select
 from datetime import date, datetime, timedelta
 from app.database import get_db
-from app.models import Warehouse, Basket, User, Product, Batch
+from app.models import Warehouse, Basket, BasketMovement, User, Product, Batch
 from app.schemas import (
     WarehouseCreate, WarehouseUpdate, WarehouseResponse, 
-    BasketResponse, BatchResponse
+    BasketResponse, BasketBriefResponse, BatchResponse, WarehouseInventorySummary,
+    BatchTraceRequest, BatchTraceResponse
 )
 from app.core.security import require_permission
 from app.core.permissions import Perms
+from app.core.encoding import query_rows, fast_response
+from app.core.projection import parse_basket_fields
+from app.core.profiling import ProfiledRoute
+from app.core.genealogy import LEAVE_EVENT
 from typing import List, Optional
 
-router = APIRouter()
+router = APIRouter(route_class=ProfiledRoute)
+
+INVENTORY_MAX_PAGE_SIZE = 1000 # 庫存明細單頁上限
 
 # 1. 取得倉庫列表 (App 與 Panel 共用)
 # App 端呼叫: GET /api/v1/warehouses/?is_active=true
@@ -70,20 +78,85 @@ def update_warehouse(
     return warehouse
 
 # 4. 查詢某倉庫內的籃子 (庫存查詢)
-@router.get("/{warehouseId}/baskets", response_model=List[BasketResponse])
+@router.get(
+    "/{warehouseId}/baskets",
+    response_model=List[BasketResponse] | List[BasketBriefResponse] | List[WarehouseInventorySummary]
+)
 def get_warehouse_inventory(
     warehouseId: str,
+    request: Request,
+    status: Optional[str] = None,
+    itemcode: Optional[str] = None,
+    batch: Optional[str] = None,
+    summary: bool = False,
+    limit: Optional[int] = Query(default=None, ge=1, le=INVENTORY_MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_permission(Perms.BASKET_READ))
 ):
-    # 這裡假設我們要找的是「目前位置」在該倉庫，且狀態為「在庫 (WAREHOUSE)」的籃子
-    # 如果您希望顯示所有在此位置的籃子(不論狀態)，可移除 status 過濾
-    baskets = db.query(Basket).filter(
-        Basket.warehouseId == warehouseId,
-        # Basket.status == "WAREHOUSE" 
-    ).all()
-    
-    return baskets
+    """
+    - status / itemcode / batch: 篩選條件 (status 可用逗號分隔多個狀態，batch 為 batch_code)
+    - summary=true: 依 狀態/產品/批次 GROUP BY 回傳籃子數與總數量，不回傳明細
+    - limit + cursor: keyset 分頁 (依 lastUpdated、bid 由新到舊)，下一頁的 cursor 放在 X-Next-Cursor header
+    - fields: full (預設) / brief (不含 product、batch JSON) / 逗號分隔欄位清單
+    """
+    query = db.query(Basket).filter(Basket.warehouseId == warehouseId)
+
+    if status and status != "ALL":
+        query = query.filter(Basket.status.in_(status.split(",")))
+    if itemcode:
+        query = query.filter(Basket.itemcode == itemcode)
+    if batch:
+        query = query.filter(Basket.batchCode == batch)
+
+    if summary:
+        rows = query.outerjoin(Product, Product.itemcode == Basket.itemcode).with_entities(
+            Basket.status,
+            Basket.itemcode,
+            Product.name.label("productName"),
+            Basket.batchCode,
+            func.count(Basket.bid).label("basketCount"),
+            func.coalesce(func.sum(Basket.quantity), 0).label("totalQuantity"),
+        ).group_by(
+            Basket.status, Basket.itemcode, Product.name, Basket.batchCode
+        ).order_by(Basket.status, Basket.itemcode, Basket.batchCode).all()
+
+        fields = list(WarehouseInventorySummary.model_fields)
+        return fast_response(request, [dict(row._mapping) for row in rows], fields)
+
+    columns = parse_basket_fields(fields)
+    # 直接以 lastUpdated (NOT NULL，既有資料由 init_db_schema 回填) 排序，使用 (warehouseId, status, lastUpdated) 索引
+    query = query.order_by(Basket.lastUpdated.desc(), Basket.bid.desc())
+
+    if cursor:
+        last_updated, last_bid = parse_inventory_cursor(cursor)
+        query = query.filter(or_(
+            Basket.lastUpdated < last_updated,
+            and_(Basket.lastUpdated == last_updated, Basket.bid < last_bid)
+        ))
+
+    # 分頁時額外查 lastUpdated/bid 以產生下一頁 cursor
+    page_columns = list(dict.fromkeys(columns + ["lastUpdated", "bid"])) if limit else columns
+    if limit:
+        query = query.limit(limit)
+
+    items = query_rows(query, Basket, page_columns)
+    response = fast_response(request, [{f: item[f] for f in columns} for item in items], columns)
+
+    if limit and len(items) == limit:
+        last = items[-1]
+        response.headers["X-Next-Cursor"] = f"{last['lastUpdated'].isoformat()}|{last['bid']}"
+
+    return response
+
+# 輔助函式：解析庫存分頁 cursor ("<lastUpdated ISO>|<bid>")
+def parse_inventory_cursor(cursor: str):
+    try:
+        last_updated, last_bid = cursor.rsplit("|", 1)
+        return datetime.fromisoformat(last_updated), int(last_bid)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 # 依據過期日反查批次資訊
 @router.get("/trace-batch", response_model=List[BatchResponse])
@@ -125,3 +198,130 @@ def trace_batch_by_expiry(
     # batches = db.query(Batch).filter(Batch.itemcode==itemcode, Batch.expireDate >= start_exp, Batch.expireDate <= end_exp).all()
     
     return batches
+
+TRACE_MAX_PAIRS = 1000 # 單次追溯最多 (itemcode, expire_date) 組數
+TRACE_QUERY_CHUNK = 1000 # SQL Server 單一語句最多 2100 個參數
+
+# 批量反查批次 (客訴 / 回收演練)：一次解析多組 ItemCode + ExpireDate
+@router.post("/trace-batch/bulk", response_model=BatchTraceResponse)
+def trace_batches_bulk(
+    request: BatchTraceRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_permission(Perms.USER_READ))
+):
+    """
+    與 /trace-batch 相同的反推邏輯 (ProductionDate = ExpireDate - ShelfLife)，但：
+    - 所有產品的 shelflife 一次查出
+    - 所有批次以一個 itemcode IN + 生產日期範圍查詢取回，再依 (itemcode, 生產日) 配對
+    - include_baskets / include_history 時，籃子與歷史各以一個查詢 (依 batchCode 分組) 取回
+    """
+    if len(request.pairs) > TRACE_MAX_PAIRS:
+        raise HTTPException(status_code=413, detail=f"Too many pairs (max {TRACE_MAX_PAIRS} per request)")
+
+    itemcodes = list({pair.itemcode for pair in request.pairs})
+    shelf_lives = dict(
+        db.query(Product.itemcode, Product.shelflife).filter(Product.itemcode.in_(itemcodes))
+    ) if itemcodes else {}
+
+    # 1. 反推每組的生產日期
+    targets = {}
+    for pair in request.pairs:
+        if pair.itemcode in shelf_lives:
+            targets[(pair.itemcode, pair.expire_date)] = pair.expire_date - timedelta(days=shelf_lives[pair.itemcode] or 0)
+
+    # 2. 一次取回範圍內的批次，依 (itemcode, 生產日) 分組
+    batches_by_day = {}
+    if targets:
+        wanted = {(itemcode, prod_date) for (itemcode, _), prod_date in targets.items()}
+        start_dt = datetime.combine(min(d for _, d in wanted), datetime.min.time())
+        end_dt = datetime.combine(max(d for _, d in wanted) + timedelta(days=1), datetime.min.time())
+        batches = db.query(Batch).filter(
+            Batch.itemcode.in_({itemcode for itemcode, _ in wanted}),
+            Batch.productionDate >= start_dt,
+            Batch.productionDate < end_dt
+        ).order_by(Batch.productionDate, Batch.bid).all()
+
+        for batch in batches:
+            key = (batch.itemcode, batch.productionDate.date())
+            if key in wanted:
+                batches_by_day.setdefault(key, []).append(batch)
+
+    # 3. 正向追溯 (選填)
+    codes = list({b.batch_code for found in batches_by_day.values() for b in found})
+    baskets = trace_current_baskets(db, codes) if request.include_baskets else {}
+    history = trace_basket_history(db, codes) if request.include_history else {}
+
+    results = []
+    for pair in request.pairs:
+        prod_date = targets.get((pair.itemcode, pair.expire_date))
+        result = {"itemcode": pair.itemcode, "expire_date": pair.expire_date, "productionDate": prod_date, "batches": []}
+        if prod_date is None:
+            result["message"] = "Product not found"
+        else:
+            for batch in batches_by_day.get((pair.itemcode, prod_date), []):
+                trace = BatchResponse.model_validate(batch).model_dump()
+                if request.include_baskets:
+                    current = baskets.get(batch.batch_code, [])
+                    trace["baskets"] = current
+                    trace["warehouses"] = summarize_trace_warehouses(current)
+                if request.include_history:
+                    trace["history"] = history.get(batch.batch_code, [])
+                result["batches"].append(trace)
+            if not result["batches"]:
+                result["message"] = "No batch produced on this date"
+        results.append(result)
+
+    return {"results": results}
+
+# 輔助函式：目前裝有這些批次的籃子 (依 batchCode 分組)
+def trace_current_baskets(db: Session, batch_codes):
+    grouped = {}
+    for start in range(0, len(batch_codes), TRACE_QUERY_CHUNK):
+        rows = db.query(
+            Basket.batchCode, Basket.rfid, Basket.warehouseId, Basket.status, Basket.quantity, Basket.lastUpdated
+        ).filter(Basket.batchCode.in_(batch_codes[start:start + TRACE_QUERY_CHUNK])).order_by(Basket.warehouseId, Basket.rfid)
+        for row in rows:
+            grouped.setdefault(row.batchCode, []).append({
+                "rfid": row.rfid,
+                "warehouseId": row.warehouseId,
+                "status": row.status,
+                "quantity": row.quantity,
+                "lastUpdated": row.lastUpdated,
+            })
+    return grouped
+
+def summarize_trace_warehouses(baskets):
+    summary = {}
+    for basket in baskets:
+        entry = summary.setdefault(basket["warehouseId"], {"warehouseId": basket["warehouseId"], "baskets": 0, "quantity": 0})
+        entry["baskets"] += 1
+        entry["quantity"] += basket["quantity"] or 0
+    return list(summary.values())
+
+# 輔助函式：曾經裝過這些批次的籃子與經過的倉庫 (籃子流向，依 batchCode 分組；離開紀錄不算經過)
+def trace_basket_history(db: Session, batch_codes):
+    grouped = {}
+    for start in range(0, len(batch_codes), TRACE_QUERY_CHUNK):
+        rows = db.execute(
+            select(
+                BasketMovement.batchCode,
+                BasketMovement.rfid,
+                BasketMovement.warehouseId,
+                func.min(BasketMovement.createdAt).label("firstSeen"),
+                func.max(BasketMovement.createdAt).label("lastSeen"),
+            )
+            .where(
+                BasketMovement.batchCode.in_(batch_codes[start:start + TRACE_QUERY_CHUNK]),
+                BasketMovement.eventType != LEAVE_EVENT,
+            )
+            .group_by(BasketMovement.batchCode, BasketMovement.rfid, BasketMovement.warehouseId)
+            .order_by(BasketMovement.batchCode, BasketMovement.rfid, func.min(BasketMovement.createdAt))
+        )
+        for row in rows:
+            grouped.setdefault(row.batchCode, []).append({
+                "rfid": row.rfid,
+                "warehouseId": row.warehouseId,
+                "firstSeen": row.firstSeen,
+                "lastSeen": row.lastSeen,
+            })
+    return grouped
@@ -1,11 +1,27 @@
+import importlib
 from fastapi import APIRouter
-from app.v1.endpoints import auth, baskets, devices, users, products, production, warehouses
+from app.core.startup import startup_step
+
+# (模組, 路徑前綴, 標籤)；依序載入並記錄各模組第一次載入的時間
+ENDPOINTS = [
+    ("auth", "/auth", "Authentication"),
+    ("baskets", "/baskets", "Baskets"),
+    ("devices", "/devices", "Devices"),
+    ("users", "/users", "Users"),
+    ("products", "/products", "Products"),
+    ("production", "/production", "Production"),
+    ("warehouses", "/warehouses", "Warehouses"),
+    ("shipping", "/shipping", "Shipping"),
+    ("expiry", "/expiry", "Expiry"),
+    ("genealogy", "/genealogy", "Genealogy"),
+    ("analytics", "/analytics", "Analytics"),
+    ("sync", "/sync", "Sync"),
+    ("jobs", "/jobs", "Jobs"),
+    ("profiles", "/profiles", "Profiling"),
+]
 
 api_router = APIRouter()
-api_router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
-api_router.include_router(baskets.router, prefix="/baskets", tags=["Baskets"])
-api_router.include_router(devices.router, prefix="/devices", tags=["Devices"])
-api_router.include_router(users.router, prefix="/users", tags=["Users"])
-api_router.include_router(products.router, prefix="/products", tags=["Products"])
-api_router.include_router(production.router, prefix="/production", tags=["Production"])
-api_router.include_router(warehouses.router, prefix="/warehouses", tags=["Warehouses"])
\ No newline at end of file
+for name, prefix, tag in ENDPOINTS:
+    with startup_step(f"import app.v1.endpoints.{name}"):
+        module = importlib.import_module(f"app.v1.endpoints.{name}")
+    api_router.include_router(module.router, prefix=prefix, tags=[tag])
@@ -1,14 +1,74 @@
-import logging
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
-from fastapi.middleware.cors import CORSMiddleware
-from app.v1.router import api_router
-import uvicorn
-import os
+from app.core.startup import startup_step, mark_ready, startup_report
+
+with startup_step("import framework"):
+    import asyncio
+    import logging
+    from contextlib import asynccontextmanager
+    from fastapi import FastAPI
+    from starlette.concurrency import run_in_threadpool
+    from fastapi.middleware.cors import CORSMiddleware
+    from fastapi.middleware.gzip import GZipMiddleware
+    import uvicorn
+    import os
+
+with startup_step("import app.v1.router"):
+    from app.v1.router import api_router
+
+with startup_step("import app.core (middleware / lifecycle)"):
+    from app.database import settings, SessionLocal, get_engine, on_engine_created
+    from app.core.metrics import MetricsMiddleware, install_sql_metrics, metrics_response
+    from app.core.query_budget import QueryBudgetMiddleware, install_query_budget
+    from app.core.profiling import ProfilingMiddleware
+    from app.core.encoding import VaryAcceptMiddleware
+    from app.core.lifecycle import (
+        prepare_worker_connections, warm_permission_cache, release_worker_connections,
+        install_drain_signal_handlers, shutdown_time_left,
+    )
+    from app.utils import password_context
+    from app.v1.endpoints.baskets import jobs_redis, warm_basket_cache
+    from app.core.images import CachedStaticFiles
+
+logger = logging.getLogger("uvicorn")
+
+def warm_up():
+    with startup_step("connect database / redis", background=True):
+        prepare_worker_connections(jobs_redis)
+    with startup_step("warm permission cache / password context", background=True):
+        warm_permission_cache()
+        password_context()
+
+    # 籃子快取在 Redis 內共用：同一時間只由一個 worker 預熱
+    if settings.CACHE_WARM_BASKETS <= 0:
+        return
+    try:
+        if not jobs_redis.set("cache:warming", os.getpid(), nx=True, ex=60):
+            return
+        with startup_step("warm basket cache", background=True):
+            db = SessionLocal()
+            try:
+                logger.info(f"🔥 Warmed basket cache ({warm_basket_cache(db, settings.CACHE_WARM_BASKETS)} baskets)")
+            finally:
+                db.close()
+    except Exception as e:
+        logger.warning(f"⚠️ Cache warm-up skipped: {e}")
+
+# 每個 worker 行程各自執行 (serve.py 多 worker 時每個行程一次)
+# engine 在這裡建立；連線與快取預熱在背景進行，worker 不等預熱完成就開始接受請求
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with startup_step("lifespan: create engine"):
+        get_engine()
+    warming = asyncio.create_task(run_in_threadpool(warm_up))
+    install_drain_signal_handlers()
+    mark_ready()
+    yield
+    await asyncio.wait({warming}, timeout=shutdown_time_left())
+    await run_in_threadpool(release_worker_connections)
 
 app = FastAPI(
     title="RFID Inventory API", 
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.add_middleware(
@@ -17,11 +77,38 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# 大型列表回應壓縮 (小於門檻的回應不壓縮，避免浪費 CPU)
+app.add_middleware(GZipMiddleware, minimum_size=settings.GZIP_MIN_SIZE)
+
+# JSON / msgpack / 欄位格式依 Accept 協商的回應加上 Vary: Accept
+app.add_middleware(VaryAcceptMiddleware)
+
+# 每個路由的請求數/延遲、SQL 語句數與時間 (Prometheus)
+app.add_middleware(MetricsMiddleware)
+on_engine_created(install_sql_metrics)
+
+# 開發/測試環境：每個請求的 SQL 語句數與 N+1 偵測 (off 時完全不掛載)
+if settings.QUERY_BUDGET_MODE != "off":
+    app.add_middleware(
+        QueryBudgetMiddleware,
+        max_queries=settings.QUERY_BUDGET_MAX,
+        max_repeats=settings.QUERY_BUDGET_MAX_REPEATS,
+        mode=settings.QUERY_BUDGET_MODE,
+        route_budgets=settings.QUERY_BUDGET_ROUTES,
+    )
+    on_engine_created(install_query_budget)
+
+# 取樣 Profiling (預設關閉，關閉時不掛載)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 os.makedirs("static/images", exist_ok=True)
 
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# 雜湊命名的圖片以 immutable 快取 + ETag 回應 (見 app/core/images.py)
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 app.include_router(api_router, prefix="/api/v1")
 
@@ -29,5 +116,15 @@ app.include_router(api_router, prefix="/api/v1")
 def health_check():
     return {"status": "ok", "version": "v1"}
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return metrics_response()
+
+# 啟動時間報告 (import 與初始化各步驟)，見 app/core/startup.py
+@app.get("/startup", include_in_schema=False)
+def startup():
+    return startup_report()
+
+# 開發用 (單一行程 + 自動重新載入)；正式環境使用 python serve.py
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
\ No newline at end of file
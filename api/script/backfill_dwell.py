@@ -0,0 +1,31 @@
+"""
+籃子停留時間 (dwell / cycle time) 重算
+
+用法 (在 api/ 目錄下):
+    python -m script.backfill_dwell          # 增量 (與 worker 的 analytics.dwell 相同)
+    python -m script.backfill_dwell --full   # 清空 BasketDwells / DwellDaily 後以全部歷史重算
+"""
+import argparse
+import time
+from app.database import SessionLocal
+from app.core.dwell import run_dwell
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute basket dwell intervals from basket history")
+    parser.add_argument("--full", action="store_true", help="discard stored intervals and replay the whole history")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        summary = run_dwell(db, full=args.full)
+    finally:
+        db.close()
+
+    print(
+        f"{summary['intervals']} intervals from {summary['baskets']} baskets "
+        f"(history up to {summary['watermark']:%Y-%m-%d %H:%M:%S}) in {time.perf_counter() - started:.1f}s"
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+序列化效能比較 (get_baskets / get_warehouse_inventory 的資料形狀)
+
+- ORM 路徑  : db.query(Basket).all() -> Pydantic from_attributes 逐筆驗證 -> jsonable_encoder -> json.dumps
+- 快速路徑  : 只查需要的欄位 (tuple) -> dict(zip) -> orjson.dumps
+
+使用本機 SQLite 記憶體資料庫，不需要 SQL Server。
+用法 (在 api/ 目錄下): python -m script.bench_serialization --rows 10000 --repeat 5
+"""
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime, timedelta
+from typing import List
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.models import Basket
+from app.schemas import BasketResponse
+from app.core.encoding import query_rows
+
+FIELDS = list(BasketResponse.model_fields)
+
+def seed(session, rows):
+    now = datetime.now()
+    product = json.dumps({"itemcode": "10001", "name": "鮮奶 946ml", "shelflife": 14, "maxBasketCapacity": 24}, ensure_ascii=False)
+    batch = json.dumps({"batch_code": "BC-20240101-10001-01", "itemcode": "10001", "targetQuantity": 5000})
+    session.bulk_save_objects([
+        Basket(
+            rfid=f"E2000017221101{i:010d}",
+            type=1,
+            product=product,
+            batch=batch,
+            warehouseId="WH01",
+            quantity=24,
+            status="IN_STOCK",
+            productionDate=now,
+            lastUpdated=now - timedelta(seconds=i),
+            updateBy="bench",
+        )
+        for i in range(rows)
+    ])
+    session.commit()
+
+def orm_path(session):
+    baskets = session.query(Basket).filter(Basket.warehouseId == "WH01").all()
+    validated = TypeAdapter(List[BasketResponse]).validate_python(baskets, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode("utf-8")
+
+def fast_path(session):
+    query = session.query(Basket).filter(Basket.warehouseId == "WH01")
+    return orjson.dumps(query_rows(query, Basket, FIELDS))
+
+def measure(name, fn, session_factory, repeat):
+    timings = []
+    size = 0
+    for _ in range(repeat):
+        session = session_factory()
+        try:
+            start = time.perf_counter()
+            size = len(fn(session))
+            timings.append((time.perf_counter() - start) * 1000)
+        finally:
+            session.close()
+    print(f"{name:<10} median {statistics.median(timings):8.1f} ms   min {min(timings):8.1f} ms   {size / 1024:8.0f} KiB")
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine, tables=[Basket.__table__])
+    session_factory = sessionmaker(bind=engine)
+
+    session = session_factory()
+    seed(session, args.rows)
+    session.close()
+
+    print(f"Baskets: {args.rows} rows, repeat {args.repeat}")
+    orm_ms = measure("ORM", orm_path, session_factory, args.repeat)
+    fast_ms = measure("fast", fast_path, session_factory, args.repeat)
+    print(f"speedup    x{orm_ms / fast_ms:.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+API 冷啟動量測 (time-to-first-request)
+
+每一輪啟動一個新的 Python 行程執行 uvicorn (main:app)，從行程建立開始計時，
+輪詢 GET / 直到第一個 200 回應；再讀取 GET /startup 的各步驟時間 (import、lifespan、背景預熱)。
+
+- 資料庫：預設 sqlite:// (可用 --db-url 或 DB_CONNECTION_STRING 指定)；engine 在 lifespan 才建立
+- Redis  ：使用設定的 Redis；連不上時背景預熱只會記錄警告，不影響 time-to-first-request
+輸出各輪中位數 / 最小 / 最大值與各步驟的中位數；--max-ms 可設定回歸門檻 (中位數超過時 exit code 1)
+
+用法 (在 api/ 目錄下): python -m script.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def fetch(url, timeout=1.0):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.status, response.read()
+
+def serve(port: int):
+    import uvicorn
+    uvicorn.run("main:app", host="127.0.0.1", port=port, log_level="warning")
+
+def measure_once(env, timeout: float):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "script.bench_startup", "--serve", str(port)],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited during startup:\n{process.stderr.read().decode(errors='replace')}")
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"Server not ready after {timeout}s")
+            try:
+                status, _ = fetch(f"{base}/")
+                if status == 200:
+                    break
+            except (urllib.error.URLError, ConnectionError, OSError):
+                time.sleep(0.005)
+        ready = time.perf_counter() - started
+
+        # 等背景預熱結束再取報告 (最多 2 秒)
+        report = None
+        for _ in range(40):
+            _, body = fetch(f"{base}/startup")
+            report = json.loads(body)
+            if any(step["background"] for step in report["steps"]):
+                break
+            time.sleep(0.05)
+        return ready, report
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API time-to-first-request")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--db-url", default=None, help="default: DB_CONNECTION_STRING or sqlite://")
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for each server")
+    parser.add_argument("--max-ms", type=float, default=None, help="fail when median time-to-first-request exceeds this")
+    parser.add_argument("--serve", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve)
+        return
+
+    env = dict(os.environ)
+    if args.db_url:
+        env["DB_CONNECTION_STRING"] = args.db_url
+    env.setdefault("DB_CONNECTION_STRING", "sqlite://")
+    env.setdefault("SECRET_KEY", "bench-secret")
+
+    # 第一輪可能包含 .pyc 編譯，不列入統計
+    measure_once(env, args.timeout)
+
+    readies = []
+    app_readies = []
+    steps = {}
+    order = []
+    for _ in range(args.runs):
+        ready, report = measure_once(env, args.timeout)
+        readies.append(ready * 1000)
+        if report and report.get("readySeconds") is not None:
+            app_readies.append(report["readySeconds"] * 1000)
+        for step in (report or {}).get("steps", []):
+            key = ("  " * step["depth"]) + step["step"] + (" (background)" if step["background"] else "")
+            if key not in steps:
+                order.append(key)
+            steps.setdefault(key, []).append(step["seconds"] * 1000)
+
+    print(f"time-to-first-request  median {statistics.median(readies):8.1f} ms  "
+          f"min {min(readies):8.1f}  max {max(readies):8.1f}  ({args.runs} runs)")
+    if app_readies:
+        app_ready = statistics.median(app_readies)
+        print(f"app import + lifespan  median {app_ready:8.1f} ms  "
+              f"(interpreter start / server bind ~{statistics.median(readies) - app_ready:.1f} ms)")
+    print()
+    for key in order:
+        print(f"{statistics.median(steps[key]):9.1f} ms  {key}")
+
+    if args.max_ms is not None and statistics.median(readies) > args.max_ms:
+        print(f"\nFAIL: median {statistics.median(readies):.1f} ms > {args.max_ms} ms")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+"""
+手持機作業流程壓力測試 (直接驅動 FastAPI app，不需 SQL Server / Redis 伺服器)
+
+每台模擬裝置重複執行：
+    login -> daily-products -> app-list -> bulk-update Production (N 個 tag)
+    -> Receiving -> Transfer -> Clear
+
+- 資料庫：預設為暫存 SQLite 檔案 (同一套 models 建表)，可用 --db-url 指向其他資料庫
+- Redis  ：fakeredis (需 pip install fakeredis)
+- 請求經 httpx.ASGITransport 送進 app，同步 endpoint 一樣在 threadpool 執行
+- 每個請求的 SQL 語句數由 QueryRecorder 記錄，回應時附在 X-Query-Count header
+
+輸出每個步驟的 p50/p95/p99 延遲與平均/最大 SQL 語句數，以及整體吞吐量。
+--threshold 可設定回歸門檻 (超過時 exit code 1)，例如：
+    --threshold bulk-production:p95=300 --threshold bulk-production:queries=20 --threshold all:rps=50
+
+用法 (在 api/ 目錄下): python -m script.bench_workflows --devices 4 --iterations 10 --tags 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+os.environ.setdefault("DB_CONNECTION_STRING", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "bench-secret")
+# 所有裝置在同一個 IP，關閉登入頻率限制
+os.environ.setdefault("LOGIN_RATE_LIMIT_USER", "0")
+os.environ.setdefault("LOGIN_RATE_LIMIT_IP", "0")
+
+try:
+    import fakeredis
+except ImportError:
+    sys.exit("fakeredis is required: pip install fakeredis")
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, get_db
+from app.models import User, Warehouse, Product, Batch, Basket
+from app.utils import get_password_hash
+from app.core.query_budget import QueryRecorder, _request_recorder, install_query_budget
+from app.core.history import install_history_triggers
+from app.v1.endpoints import auth, baskets, sync
+from app.core import security
+import main
+
+STEPS = ["login", "daily-products", "app-list", "bulk-production", "bulk-receiving", "bulk-transfer", "bulk-clear"]
+METRICS = ("p50", "p95", "p99", "queries", "errors", "rps")
+PASSWORD = "bench-pw"
+
+class QueryCountMiddleware:
+    """把每個請求執行的 SQL 語句數附在 X-Query-Count header"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        recorder = QueryRecorder()
+        token = _request_recorder.set(recorder)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(recorder.count).encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_recorder.reset(token)
+
+def setup_database(db_url):
+    connect_args = {"check_same_thread": False, "timeout": 30} if db_url.startswith("sqlite") else {}
+    engine = create_engine(db_url, connect_args=connect_args)
+    Base.metadata.create_all(bind=engine)
+    install_history_triggers(engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def get_bench_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    main.app.dependency_overrides[get_db] = get_bench_db
+    install_query_budget(engine)
+    return engine, session_factory
+
+def setup_redis():
+    server = fakeredis.FakeServer()
+    auth.r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    security.r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    sync.r = fakeredis.FakeRedis(server=server, decode_responses=True)
+    baskets.r = fakeredis.FakeRedis(server=server)
+
+def seed(session_factory, devices, tags, products):
+    session = session_factory()
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    password_hash = get_password_hash(PASSWORD)
+    try:
+        for d in range(devices):
+            session.add(User(username=f"bench{d}", name=f"Bench {d}", role="Admin", department="IT",
+                             password_hash=password_hash, is_active=True))
+        session.add_all([Warehouse(warehouseId="BENCH-A", name="Bench A"), Warehouse(warehouseId="BENCH-B", name="Bench B")])
+        for p in range(products):
+            itemcode = f"B{p:04d}"
+            session.add(Product(itemcode=itemcode, name=f"Bench product {p}", shelflife=14, maxBasketCapacity=24))
+            session.add(Batch(batch_code=f"BENCH-{today:%Y%m%d}-{itemcode}", itemcode=itemcode,
+                              totalQuantity=100000, targetQuantity=100000, producedQuantity=0, remainingQuantity=0,
+                              productionDate=today, expireDate=today + timedelta(days=14), status="PENDING"))
+        session.bulk_save_objects([
+            Basket(rfid=device_rfid(d, i), type=1, status="UNASSIGNED", quantity=0, lastUpdated=datetime.now())
+            for d in range(devices) for i in range(tags)
+        ])
+        session.commit()
+    finally:
+        session.close()
+
+def device_rfid(device, index):
+    return f"BENCH{device:04d}{index:06d}"
+
+class Results:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.queries = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, step, elapsed, response):
+        self.latencies[step].append(elapsed * 1000)
+        count = response.headers.get("x-query-count")
+        if count is not None:
+            self.queries[step].append(int(count))
+        if response.status_code >= 400:
+            self.errors[step] += 1
+
+async def timed(client, results, step, method, url, **kwargs):
+    start = time.perf_counter()
+    response = await client.request(method, url, **kwargs)
+    results.record(step, time.perf_counter() - start, response)
+    return response
+
+async def run_device(client, results, device, iterations, tags):
+    rfids = [device_rfid(device, i) for i in range(tags)]
+    for _ in range(iterations):
+        response = await timed(client, results, "login", "POST", "/api/v1/auth/login",
+                               data={"username": f"bench{device}", "password": PASSWORD})
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        products = (await timed(client, results, "daily-products", "GET", "/api/v1/production/daily-products", headers=headers)).json()
+        batches = (await timed(client, results, "app-list", "GET", "/api/v1/production/app-list", headers=headers)).json()
+
+        batch = batches[device % len(batches)]
+        product = next(p for p in products if p["itemcode"] == batch["itemcode"])
+        common = {
+            "product": json.dumps({"itemcode": product["itemcode"], "name": product["name"]}, ensure_ascii=False),
+            "batch": json.dumps({"batch_code": batch["batch_code"], "itemcode": batch["itemcode"]}),
+            "quantity": 24,
+        }
+
+        flows = [
+            ("bulk-production", "Production", common),
+            ("bulk-receiving", "Receiving", {"warehouseId": "BENCH-A"}),
+            ("bulk-transfer", "Transfer", {"warehouseId": "BENCH-B"}),
+            ("bulk-clear", "Clear", {}),
+        ]
+        for step, update_type, common_data in flows:
+            await timed(client, results, step, "PUT", "/api/v1/baskets/bulk-update", headers=headers, json={
+                "updateType": update_type,
+                "commonData": common_data,
+                "baskets": [{"rfid": rfid} for rfid in rfids],
+            })
+
+def percentile(values, q):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+def summarize(results, wall_time):
+    summary = {}
+    for step in STEPS:
+        latencies = results.latencies.get(step)
+        if not latencies:
+            continue
+        queries = results.queries.get(step) or [0]
+        summary[step] = {
+            "count": len(latencies),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "queries": statistics.mean(queries),
+            "max_queries": max(queries),
+            "errors": results.errors[step],
+            "rps": len(latencies) / wall_time,
+        }
+    total = sum(item["count"] for item in summary.values())
+    all_latencies = [v for step in STEPS for v in results.latencies.get(step, [])]
+    all_queries = [v for step in STEPS for v in results.queries.get(step, [])] or [0]
+    summary["all"] = {
+        "count": total,
+        "p50": percentile(all_latencies, 50),
+        "p95": percentile(all_latencies, 95),
+        "p99": percentile(all_latencies, 99),
+        "queries": statistics.mean(all_queries),
+        "max_queries": max(all_queries),
+        "errors": sum(results.errors.values()),
+        "rps": total / wall_time,
+    }
+    return summary
+
+def print_summary(summary, wall_time, flows):
+    print(f"{'step':<16}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>10}{'max q':>7}{'errors':>8}")
+    for step, item in summary.items():
+        print(f"{step:<16}{item['count']:>7}{item['p50']:>10.1f}{item['p95']:>10.1f}{item['p99']:>10.1f}"
+              f"{item['queries']:>10.1f}{item['max_queries']:>7}{item['errors']:>8}")
+    print(f"\n{flows} flows in {wall_time:.2f} s: {flows / wall_time:.2f} flows/s, {summary['all']['rps']:.1f} req/s")
+
+def parse_threshold(raw):
+    """step:metric=value，例如 bulk-production:p95=300 (延遲單位 ms；rps 為下限，其餘為上限)"""
+    try:
+        target, value = raw.split("=", 1)
+        step, metric = target.split(":", 1)
+        value = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid threshold '{raw}', expected step:metric=value")
+    if step != "all" and step not in STEPS:
+        raise argparse.ArgumentTypeError(f"Unknown step '{step}', choose from all, {', '.join(STEPS)}")
+    if metric not in METRICS:
+        raise argparse.ArgumentTypeError(f"Unknown metric '{metric}', choose from {', '.join(METRICS)}")
+    return step, metric, value
+
+def check_thresholds(summary, thresholds):
+    failures = []
+    for step, metric, limit in thresholds:
+        actual = summary.get(step, {}).get(metric)
+        if actual is None:
+            continue
+        failed = actual < limit if metric == "rps" else actual > limit
+        if failed:
+            failures.append(f"{step}:{metric} = {actual:.1f} (limit {limit:g})")
+    return failures
+
+async def run(args):
+    transport = httpx.ASGITransport(app=QueryCountMiddleware(main.app))
+    results = Results()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*[
+            run_device(client, results, device, args.iterations, args.tags)
+            for device in range(args.devices)
+        ])
+        wall_time = time.perf_counter() - start
+    return results, wall_time
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=4, help="同時作業的裝置數")
+    parser.add_argument("--iterations", type=int, default=5, help="每台裝置執行完整流程的次數")
+    parser.add_argument("--tags", type=int, default=50, help="每次 bulk-update 的籃子數")
+    parser.add_argument("--products", type=int, default=20, help="當日生產的產品/批次數")
+    parser.add_argument("--db-url", default=None, help="SQLAlchemy URL (預設為暫存 SQLite 檔案)")
+    parser.add_argument("--threshold", type=parse_threshold, action="append", default=[])
+    parser.add_argument("--json", dest="json_path", help="另存結果 (JSON)")
+    args = parser.parse_args()
+
+    tmp_path = None
+    db_url = args.db_url
+    if db_url is None:
+        fd, tmp_path = tempfile.mkstemp(suffix=".db", prefix="bench_")
+        os.close(fd)
+        db_url = f"sqlite:///{tmp_path}"
+
+    try:
+        engine, session_factory = setup_database(db_url)
+        setup_redis()
+        seed(session_factory, args.devices, args.tags, args.products)
+
+        print(f"Devices {args.devices}, iterations {args.iterations}, tags {args.tags}, db {engine.dialect.name}\n")
+        results, wall_time = asyncio.run(run(args))
+        engine.dispose()
+    finally:
+        if tmp_path:
+            os.remove(tmp_path)
+
+    summary = summarize(results, wall_time)
+    print_summary(summary, wall_time, args.devices * args.iterations)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(summary, f, indent=2)
+
+    failures = check_thresholds(summary, args.threshold)
+    if failures:
+        print("\nThresholds exceeded:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,115 @@
+"""
+補齊資料庫結構 (可重複執行)：
+1. 建立 models.py 中尚未存在的資料表
+2. 為既有資料表新增缺少的欄位 (一律 NULL，Temporal Table 的歷史表會自動同步)
+3. 建立缺少的索引
+4. 非 SQL Server：建立/重建籃子歷史 trigger (BasketVersions)
+5. 回填 Baskets.itemcode / batchCode (由 product/batch JSON 解析)
+   與 NULL 的 Baskets.lastUpdated (以 productionDate 或目前時間，庫存分頁直接以 lastUpdated 排序)
+6. BasketMovements 為空時，以既有籃子歷史建立初始流向紀錄；舊格式的離開紀錄改為 Leave 事件 (並重新彙總流量)，
+   並補上 producedDelta (批次對帳的生產量)
+
+用法 (在 api/ 目錄下): python -m script.init_db_schema
+"""
+from datetime import datetime
+from sqlalchemy import inspect, text, update, func, or_, and_
+from app.database import engine, Base, SessionLocal
+from app.models import Basket
+from app.utils import parse_json_field, extract_batch_code
+from app.core.history import unused_history_tables, install_history_triggers
+from app.core.genealogy import backfill_movements, mark_leave_movements, fill_produced_deltas
+from app.core.analytics import reset_flow_rollup
+
+BACKFILL_CHUNK = 1000
+
+def managed_tables():
+    # SQL Server 的歷史由 Temporal Table 管理，不建立 BasketVersions
+    skipped = unused_history_tables(engine.dialect.name)
+    return [t for t in Base.metadata.sorted_tables if t not in skipped]
+
+def create_missing_tables():
+    Base.metadata.create_all(bind=engine, tables=managed_tables())
+
+def add_missing_columns():
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+
+    with engine.begin() as conn:
+        for table in managed_tables():
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {quote(table.name)} ADD {quote(column.name)} {ddl_type} NULL"))
+                print(f"Added column {table.name}.{column.name} ({ddl_type})")
+
+def create_missing_indexes():
+    for table in managed_tables():
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def backfill_basket_codes():
+    db = SessionLocal()
+    try:
+        last_bid = 0
+        updated = 0
+        while True:
+            rows = db.query(Basket.bid, Basket.product, Basket.batch).filter(
+                Basket.bid > last_bid,
+                or_(
+                    and_(Basket.itemcode.is_(None), Basket.product.isnot(None)),
+                    and_(Basket.batchCode.is_(None), Basket.batch.isnot(None)),
+                ),
+            ).order_by(Basket.bid).limit(BACKFILL_CHUNK).all()
+            if not rows:
+                break
+
+            params = []
+            for row in rows:
+                itemcode = parse_json_field(row.product, "itemcode")
+                batch_code = extract_batch_code(row.batch)
+                if itemcode or batch_code:
+                    params.append({"bid": row.bid, "itemcode": itemcode, "batchCode": batch_code})
+
+            if params:
+                db.execute(update(Basket), params)
+                db.commit()
+                updated += len(params)
+            last_bid = rows[-1].bid
+
+        print(f"Backfilled itemcode/batchCode for {updated} baskets.")
+    finally:
+        db.close()
+
+def backfill_basket_last_updated():
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(Basket)
+            .where(Basket.lastUpdated.is_(None))
+            .values(lastUpdated=func.coalesce(Basket.productionDate, datetime.now()))
+        )
+    print(f"Backfilled lastUpdated for {result.rowcount} baskets.")
+
+def backfill_basket_movements():
+    db = SessionLocal()
+    try:
+        print(f"Backfilled {backfill_movements(db)} basket movements.")
+        marked = mark_leave_movements(db)
+        print(f"Marked {marked} basket movements as Leave.")
+        if marked:
+            # 已彙總的流量含這些離開紀錄，清空後由 worker 重新彙總
+            reset_flow_rollup(db)
+            print("Reset flow rollup.")
+        print(f"Filled producedDelta for {fill_produced_deltas(db)} basket movements.")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    create_missing_tables()
+    add_missing_columns()
+    create_missing_indexes()
+    install_history_triggers(engine)
+    backfill_basket_codes()
+    backfill_basket_last_updated()
+    backfill_basket_movements()
@@ -0,0 +1,39 @@
+"""
+批次庫存對帳 (夜間排程用)
+
+用法 (在 api/ 目錄下):
+    python -m script.reconcile_batches            # 只處理有異動的批次
+    python -m script.reconcile_batches --full     # 全部批次 (建議每晚執行)
+    python -m script.reconcile_batches --dry-run  # 只列出差異，不寫回
+"""
+import argparse
+from app.database import SessionLocal
+from app.core.metrics import InstrumentedRedis
+from app.core.reconciliation import batch_drift, run_reconciliation
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute Batches.producedQuantity / remainingQuantity from baskets")
+    parser.add_argument("--full", action="store_true", help="reconcile every batch instead of the dirty set")
+    parser.add_argument("--dry-run", action="store_true", help="only report drift (always checks every batch)")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.dry_run:
+            checked, drift = batch_drift(db)
+        else:
+            client = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
+            summary = run_reconciliation(db, client, full=args.full)
+            checked, drift = summary["checked"], summary["drift"]
+    finally:
+        db.close()
+
+    for item in drift:
+        print(
+            f"{item['batch_code']}: produced {item['producedQuantity']} -> {item['expectedProduced']}, "
+            f"remaining {item['remainingQuantity']} -> {item['expectedRemaining']}"
+        )
+    print(f"{len(drift)}/{checked} batches {'drifted' if args.dry_run else 'corrected'}")
+
+if __name__ == "__main__":
+    main()
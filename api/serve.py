@@ -0,0 +1,47 @@
+"""
+正式環境 API 伺服器 (多 worker)
+
+用法 (在 api/ 目錄下):
+    python serve.py                          # worker 數 = WEB_CONCURRENCY，未設定時為 CPU 核心數
+    python serve.py --workers 4 --port 8000
+開發環境仍使用 python main.py (單一行程 + 自動重新載入)。
+
+- 每個 worker 是獨立行程，各自建立 engine / Redis 連線池 (main.py 的 lifespan)；
+  DB_MAX_CONNECTIONS / REDIS_MAX_CONNECTIONS 為全部 worker 合計，依 worker 數平均分配
+- SIGTERM：停止接受連線與新的批量寫入 (503)，從收到 signal 起最多等待 SHUTDOWN_DRAIN_SECONDS 讓進行中的請求與批量寫入完成
+- /metrics：多 worker 時使用 Prometheus multiprocess 模式，回應合併所有 worker 的指標
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import uvicorn
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=0, help="default: WEB_CONCURRENCY or CPU count")
+    args = parser.parse_args()
+
+    workers = args.workers or int(os.environ.get("WEB_CONCURRENCY") or 0) or os.cpu_count() or 1
+    # worker 行程繼承環境變數：連線池依此分配、指標寫入共用目錄
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    if workers > 1:
+        metrics_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "rfid-api-metrics"))
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+        os.makedirs(metrics_dir)
+
+    from app.database import settings
+
+    uvicorn.run(
+        "main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        timeout_graceful_shutdown=settings.SHUTDOWN_DRAIN_SECONDS,
+        proxy_headers=True,
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""
+背景工作 worker (與 API 共用 app.database.SessionLocal 與同一個 Redis)
+
+用法 (在 api/ 目錄下): python worker.py
+可同時啟動多個 worker；收到 SIGTERM / Ctrl+C 時會做完目前的工作再結束。
+"""
+import logging
+import signal
+from app.core.metrics import InstrumentedRedis
+from app.core.jobs import run_worker, JOB_HANDLERS
+import app.v1.router  # noqa: F401  載入各模組以註冊 @job_handler
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("uvicorn")
+
+stopping = False
+
+def request_stop(signum, frame):
+    global stopping
+    stopping = True
+    logger.info("Stopping worker after the current job...")
+
+if __name__ == "__main__":
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    r = InstrumentedRedis(host='localhost', port=6379, db=0, decode_responses=True)
+    logger.info(f"Worker started, handlers: {', '.join(sorted(JOB_HANDLERS))}")
+    run_worker(r, lambda: stopping)
@@ -4,6 +4,7 @@ import {
     LogOut, LayoutDashboard, Users, ShoppingBag, Factory, 
     Warehouse, Truck, Car, Smartphone, Package, Settings as SettingsIcon
 } from 'lucide-react';
+import api from './api';
 import Login from './pages/Login';
 import Dashboard from './pages/Dashboard';
 import Baskets from './pages/Baskets';
@@ -39,8 +40,12 @@ function Layout({ children }) {
     const location = useLocation();
     const user = JSON.parse(localStorage.getItem('user') || '{}');
 
-    const handleLogout = () => {
+    const handleLogout = async () => {
+        // 撤銷伺服器端 session：request interceptor 為非同步，需等請求完成 (含 Token 過期時換發重送) 再清除本機 Token
+        // 失敗也照常登出
+        await api.post('/auth/logout').catch(() => {});
         localStorage.removeItem('token');
+        localStorage.removeItem('refresh_token');
         localStorage.removeItem('user');
         navigate('/login');
     };
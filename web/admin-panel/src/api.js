@@ -15,13 +15,53 @@ api.interceptors.request.use((config) => {
     return config;
 });
 
+// 同時多個請求 401 時只換發一次 Token
+let refreshPromise = null;
+
+const refreshToken = () => {
+    const refresh = localStorage.getItem('refresh_token');
+    if (!refresh) {
+        return Promise.reject(new Error('No refresh token'));
+    }
+    if (!refreshPromise) {
+        refreshPromise = axios.post(`${API_URL}/auth/refresh`, { refresh_token: refresh })
+            .then((res) => {
+                localStorage.setItem('token', res.data.access_token);
+                localStorage.setItem('refresh_token', res.data.refresh_token);
+                return res.data.access_token;
+            })
+            .finally(() => {
+                refreshPromise = null;
+            });
+    }
+    return refreshPromise;
+};
+
+const redirectToLogin = () => {
+    localStorage.removeItem('token');
+    localStorage.removeItem('refresh_token');
+    localStorage.removeItem('user');
+    window.location.href = '/login';
+};
+
 api.interceptors.response.use(
     (response) => response,
-    (error) => {
+    async (error) => {
+        const original = error.config;
         if (error.response && error.response.status === 401) {
-            localStorage.removeItem('token');
-            localStorage.removeItem('user');
-            window.location.href = '/login';
+            // Access Token 過期：用 Refresh Token 換發後重送一次
+            if (original && !original._retried) {
+                original._retried = true;
+                try {
+                    const token = await refreshToken();
+                    original.headers.Authorization = `Bearer ${token}`;
+                    return api(original);
+                } catch (refreshError) {
+                    redirectToLogin();
+                    return Promise.reject(refreshError);
+                }
+            }
+            redirectToLogin();
         }
         return Promise.reject(error);
     }
@@ -1,23 +1,72 @@
 // src/pages/Dashboard.jsx
-import { Activity, Package, Truck, AlertCircle } from 'lucide-react';
+import { useState, useEffect } from 'react';
+import api from '../api';
+import { Activity, Package, Truck, Warehouse } from 'lucide-react';
 
+// 儀表板只讀取 /analytics 的彙總資料 (每小時 / 每日時間桶)，不查詢籃子歷史
 export default function Dashboard() {
+    const [todayFlow, setTodayFlow] = useState({});
+    const [stock, setStock] = useState(null);
+    const [hourly, setHourly] = useState([]);
+
+    useEffect(() => {
+        const fetchAnalytics = async () => {
+            const start = new Date();
+            start.setHours(0, 0, 0, 0);
+            try {
+                const [daily, occupancy, flow] = await Promise.all([
+                    api.get('/analytics/throughput', { params: { interval: 'day', group_by: 'eventType', start: toLocalISO(start) } }),
+                    api.get('/analytics/occupancy', { params: { interval: 'hour', group_by: '' } }),
+                    api.get('/analytics/throughput', { params: { interval: 'hour', group_by: 'eventType' } }),
+                ]);
+
+                const byType = {};
+                daily.data.points.forEach((p) => { byType[p.eventType] = p.quantity; });
+                setTodayFlow(byType);
+
+                const points = occupancy.data.points;
+                setStock(points.length ? points[points.length - 1].quantity : 0);
+
+                setHourly(flow.data.points.filter((p) => p.eventType === 'Production' || p.eventType === 'Receiving'));
+            } catch (error) {
+                console.error("Failed to fetch analytics", error);
+            }
+        };
+        fetchAnalytics();
+    }, []);
+
+    const maxHourly = Math.max(1, ...hourly.map((p) => p.quantity));
+
     return (
         <div className="p-6">
             <h1 className="text-2xl font-bold mb-6 text-slate-800">儀表板</h1>
-            
+
             {/* 統計卡片區 */}
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-6 mb-8">
-                <StatCard title="今日生產" value="1,250" icon={<Activity />} color="bg-blue-500" />
-                <StatCard title="庫存總數" value="15,400" icon={<Package />} color="bg-green-500" />
-                <StatCard title="今日出貨" value="850" icon={<Truck />} color="bg-orange-500" />
-                <StatCard title="異常警報" value="3" icon={<AlertCircle />} color="bg-red-500" />
+                <StatCard title="今日生產" value={formatNumber(todayFlow.Production)} icon={<Activity />} color="bg-blue-500" />
+                <StatCard title="庫存總數" value={formatNumber(stock)} icon={<Package />} color="bg-green-500" />
+                <StatCard title="今日出貨" value={formatNumber(todayFlow.Shipping)} icon={<Truck />} color="bg-orange-500" />
+                <StatCard title="今日入庫" value={formatNumber(todayFlow.Receiving)} icon={<Warehouse />} color="bg-purple-500" />
             </div>
 
-            {/* 這裡可以放圖表或近期活動 */}
             <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
-                <div className="bg-white p-6 rounded-lg shadow-sm border h-64 flex items-center justify-center text-slate-400">
-                    [生產趨勢圖表佔位]
+                <div className="bg-white p-6 rounded-lg shadow-sm border h-64 overflow-y-auto">
+                    <h2 className="font-bold text-slate-700 mb-4">近 24 小時生產 / 入庫</h2>
+                    {hourly.length === 0 ? (
+                        <p className="text-slate-400 text-sm">暫無資料</p>
+                    ) : hourly.map((p) => (
+                        <div key={`${p.bucket}-${p.eventType}`} className="flex items-center gap-2 text-sm mb-1">
+                            <span className="w-28 text-slate-500">{p.bucket.slice(5, 13).replace('T', ' ')}:00</span>
+                            <span className="w-16 text-slate-600">{p.eventType === 'Production' ? '生產' : '入庫'}</span>
+                            <div className="flex-1 bg-slate-100 rounded h-3">
+                                <div
+                                    className={`h-3 rounded ${p.eventType === 'Production' ? 'bg-blue-500' : 'bg-green-500'}`}
+                                    style={{ width: `${(p.quantity / maxHourly) * 100}%` }}
+                                />
+                            </div>
+                            <span className="w-12 text-right text-slate-700">{p.quantity}</span>
+                        </div>
+                    ))}
                 </div>
                 <div className="bg-white p-6 rounded-lg shadow-sm border h-64 flex items-center justify-center text-slate-400">
                     [近期活動列表佔位]
@@ -27,6 +76,16 @@ export default function Dashboard() {
     );
 }
 
+// 後端使用伺服器本地時間 (不帶時區)
+function toLocalISO(date) {
+    const offset = date.getTimezoneOffset() * 60000;
+    return new Date(date.getTime() - offset).toISOString().slice(0, 19);
+}
+
+function formatNumber(value) {
+    return value === null || value === undefined ? '-' : value.toLocaleString();
+}
+
 function StatCard({ title, value, icon, color }) {
     return (
         <div className="bg-white p-6 rounded-lg shadow-sm border flex items-center">
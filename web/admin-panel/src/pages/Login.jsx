@@ -25,6 +25,7 @@ export default function Login() {
             
             // 儲存 Token 與使用者資訊
             localStorage.setItem('token', res.data.access_token);
+            localStorage.setItem('refresh_token', res.data.refresh_token);
             localStorage.setItem('user', JSON.stringify({
                 username: res.data.username,
                 role: res.data.role,
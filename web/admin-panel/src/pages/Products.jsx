@@ -126,7 +126,7 @@ export default function Products() {
                         <div className="h-48 bg-slate-100 relative">
                             {prod.imageUrl ? (
                                 <img 
-                                    src={`${IMAGE_BASE_URL}${prod.imageUrl}`} 
+                                    src={`${IMAGE_BASE_URL}${prod.thumbnailUrl || prod.imageUrl}`} 
                                     alt={prod.name} 
                                     className="w-full h-full object-cover"
                                 />
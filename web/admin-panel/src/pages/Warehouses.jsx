@@ -37,11 +37,11 @@ export default function Warehouses() {
 
     useEffect(() => { fetchWarehouses(); }, []);
 
-    // 2. 載入特定倉庫的庫存
+    // 2. 載入特定倉庫的庫存 (彙總模式：依狀態/產品/批次統計，不載入每個籃子)
     const fetchInventory = async (whId) => {
         setInventoryLoading(true);
         try {
-            const res = await api.get(`/warehouses/${whId}/baskets`);
+            const res = await api.get(`/warehouses/${whId}/baskets`, { params: { summary: true } });
             setInventory(res.data);
         } catch (error) {
             alert("無法載入庫存資訊");
@@ -221,23 +221,23 @@ export default function Warehouses() {
                                 <table className="w-full text-sm text-left">
                                     <thead className="bg-slate-50 border-b sticky top-0">
                                         <tr>
-                                            <th className="p-3 font-medium text-slate-600">RFID</th>
                                             <th className="p-3 font-medium text-slate-600">產品</th>
+                                            <th className="p-3 font-medium text-slate-600">批次</th>
+                                            <th className="p-3 font-medium text-slate-600">狀態</th>
+                                            <th className="p-3 font-medium text-slate-600 text-right">籃數</th>
                                             <th className="p-3 font-medium text-slate-600 text-right">數量</th>
-                                            <th className="p-3 font-medium text-slate-600">更新時間</th>
                                         </tr>
                                     </thead>
                                     <tbody className="divide-y divide-slate-100">
-                                        {inventory.map(b => (
-                                            <tr key={b.bid} className="hover:bg-blue-50">
-                                                <td className="p-3 font-mono text-blue-600">{b.rfid}</td>
+                                        {inventory.map((row, idx) => (
+                                            <tr key={idx} className="hover:bg-blue-50">
                                                 <td className="p-3">
-                                                    {b.product ? JSON.parse(b.product).name : '-'}
-                                                </td>
-                                                <td className="p-3 text-right font-bold">{b.quantity}</td>
-                                                <td className="p-3 text-xs text-slate-400">
-                                                    {new Date(b.lastUpdated).toLocaleString()}
+                                                    {row.productName || row.itemcode || '-'}
                                                 </td>
+                                                <td className="p-3 font-mono text-xs text-slate-500">{row.batchCode || '-'}</td>
+                                                <td className="p-3 text-xs">{row.status}</td>
+                                                <td className="p-3 text-right">{row.basketCount}</td>
+                                                <td className="p-3 text-right font-bold">{row.totalQuantity}</td>
                                             </tr>
                                         ))}
                                     </tbody>
@@ -246,7 +246,7 @@ export default function Warehouses() {
                         </div>
                         
                         <div className="p-3 border-t bg-slate-50 text-right text-xs text-slate-500">
-                            共 {inventory.length} 筆資料
+                            共 {inventory.reduce((sum, row) => sum + row.basketCount, 0)} 籃 / 總數量 {inventory.reduce((sum, row) => sum + row.totalQuantity, 0)}
                         </div>
                     </div>
                 </div>